@@ -4,23 +4,129 @@ import random
 import shutil
 import os
 import datetime
+import contextlib
 
 import cv2
 import numpy as np
 from adb import Adb
+from pipeline import FrameGrabber, Actuator
+from shootout import ShootoutDetector
+from motion import MotionEstimator
+from tracker import PlayerTracker
+from playground import PlaygroundSegmenter
+from buffer_pool import BufferPool
+from frame import Frame, to_frame
+from stats import Stats
+import metrics
+from watchdog import Watchdog, AppHang
+from recording import RecordingWriter
+from pass_planner import FieldPlanner
+from governor import Governor
+from input_queue import InputQueue
+import detector
 
 import config
 import image_processing
 import sys
 import math as m
+from concurrent.futures import ThreadPoolExecutor
+
+
+kernel_3 = np.ones((3, 3), np.uint8)
+kernel_5 = np.ones((5, 5), np.uint8)
+kernel_30 = np.ones((30, 30), np.uint8)
+
+
+def get_vision_threads():
+    '''
+    Number of threads for the vision stages. Unless configured, the cores available
+    to this process are shared by the bot instances on the host.
+    '''
+    if config.vision_threads > 0:
+        return config.vision_threads
+
+    if hasattr(os, 'sched_getaffinity'):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        cores = os.cpu_count()
+
+    return max(1, cores // config.bot_instances)
 
 
 class Action():
-    def __init__(self, debug: bool = False, save_mask: bool = False):
-        self.adb = Adb()
+    def __init__(
+            self,
+            debug: bool = False,
+            save_mask: bool = False,
+            adb: Adb = None,
+            parallel: bool = False,
+            stats: Stats = None,
+            tracking: bool = False,
+            watchdog: bool = False,
+            player_detector: str = 'color',
+            record: bool = False,
+            vision_pool=None,
+            pass_planner: str = 'lines',
+            input_queue: bool = False,
+            pipelined: bool = True):
+        self.adb = adb if adb else Adb()
+        self.stats = stats if stats else Stats(':memory:')
+        self.stats.device = self.adb.serial
+        self.adb.stats = self.stats
+        # CPU time of each phase, and the poll intervals of the waiting phases
+        self.governor = Governor(self.adb.serial, self.stats)
+        # watchdog of the app, which is None if disabled
+        self.watchdog = None
+        if watchdog:
+            self.watchdog = Watchdog(self.adb, self.stats)
+            self.adb.watchdog = self.watchdog
+            self.watchdog.start()
+        # number of card packs opened by open_cards
+        self.opened_count = 0
+        # gestures during the match are sent through the actuator
+        self.actuator = self.adb
+        # capture and gestures of the match run in background threads, or in the match loop if not set
+        self.pipelined = pipelined
+        # taps of the chores are sent through the input queue if enabled, which batches them
+        self.input = InputQueue(self.adb) if input_queue else self.adb
         self.debug = debug
         self.save_mask = save_mask
+        self.debug_dir = None
         self.frame_index = 0
+        # captured frames of each match are recorded in the debug directory if record is set
+        self.record = record
+        self.recorder = None
+        self.recorded_frame = None
+        self.playground = PlaygroundSegmenter()
+        # player detector of get_player_map, i.e. 'color' or 'cnn'
+        self.detector = detector.create(player_detector, self)
+        self.uniform_mask = cv2.imread('templates/uniform_mask.png', cv2.IMREAD_GRAYSCALE)
+
+        # reusable arrays for the images computed on every frame
+        self.buffers = BufferPool()
+
+        # template images as Frames, so that their gray images are converted once
+        self.templates = {}
+
+        # expected elapsed time of each decision stage
+        self.stage_costs = {}
+
+        # my and opponent player trackers, which are empty if tracking is disabled
+        self.trackers = [PlayerTracker(), PlayerTracker()] if tracking else []
+        self.uniform_colors = []
+        self.track_count = 0
+        self.track_timestamp = None
+        self.track_map = None
+
+        # pool of vision worker processes which decide the kicks, shared by the bot instances of the process
+        self.vision_pool = vision_pool
+
+        # thread pool for the vision stages, which is None in serial mode
+        self.executor = None
+        if parallel:
+            threads = get_vision_threads()
+            logging.info(f'Vision stages run in parallel with {threads} threads')
+            self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='Vision')
 
         self.forward_kick_mask = cv2.imread('templates/forward_kick_mask.png', cv2.IMREAD_GRAYSCALE)
         self.backward_kick_masks = [
@@ -29,11 +135,28 @@ class Action():
         ]
         self.header_mask = cv2.imread('templates/header_mask.png', cv2.IMREAD_GRAYSCALE)
 
+        # pass planner of kick_pass, i.e. 'lines' (opponent distance to the line to each teammate) or 'field'
+        self.pass_planner = None
+        if pass_planner == 'field':
+            self.pass_planner = FieldPlanner(
+                [self.forward_kick_mask, self.backward_kick_masks[0], self.backward_kick_masks[1], self.header_mask],
+                [config.kick_start_loc, config.kick_backward_start_locs[0], config.kick_backward_start_locs[1], config.header_start_loc])
+        elif pass_planner != 'lines':
+            raise Exception(f'Unknown pass planner {pass_planner}')
+
     def create_debug_dir(self):
         self.debug_dir = os.path.join('debug', f'{datetime.datetime.now():%Y%m%d%H%M%S}')
         if self.debug:
             os.makedirs(self.debug_dir, exist_ok=True)
 
+    def get_template(self, template_path: str):
+        template = self.templates.get(template_path)
+        if template is None:
+            template = Frame(cv2.imread(template_path))
+            self.templates[template_path] = template
+
+        return template
+
     def match_template(
             self,
             template_path: str = None,
@@ -44,29 +167,25 @@ class Action():
             image: np.ndarray = None,
             diff_threshold: float = 0):
 
-        template_image = cv2.imread(template_path)
-        mask_image = cv2.imread(template_path) if mask else None
+        template_image = self.get_template(template_path)
+        mask_image = template_image if mask else None
 
         if image is None:
             image = self.adb.get_screen()
 
         if coordinate:
-            x = coordinate[0]
-            y = coordinate[1]
-            width = coordinate[2]
-            height = coordinate[3]
-            sub_image = image[y:y + height, x:x + width]
+            sub_image = image_processing.crop(image, coordinate)
         else:
             sub_image = image
 
         score = image_processing.diff_image(
             template_image, sub_image, mask=mask_image, color=color, diff_threshold=diff_threshold)
-        logging.debug(f'diff score: {score}')
+        logging.debug('diff score: %s', score)
 
         return (True, score) if score > threshold else (False, score)
 
     def find_template(self, template_path: str, image: np.ndarray = None):
-        template_image = cv2.imread(template_path)
+        template_image = self.get_template(template_path)
 
         if image is None:
             image = self.adb.get_screen()
@@ -82,16 +201,16 @@ class Action():
         width = coordinate[2]
         height = coordinate[3]
 
-        self.adb.touch(x + width / 2, y + height / 2)
+        self.input.touch(x + width / 2, y + height / 2)
 
     def touch_center(self):
-        self.adb.touch(config.screen_size[0] / 2, config.screen_size[1] / 2)
+        self.input.touch(config.screen_size[0] / 2, config.screen_size[1] / 2)
 
     def touch(self, coordinate: list):
-        self.adb.touch(coordinate[0], coordinate[1])
+        self.input.touch(coordinate[0], coordinate[1])
 
     def swipe(self, start: list, end: list):
-        self.adb.swipe(start[0], start[1], end[0], end[1], 200)
+        self.actuator.swipe(start[0], start[1], end[0], end[1], 200)
 
     def open_package(self):
         template_path = 'templates/free_collect.png'
@@ -104,7 +223,9 @@ class Action():
             self.touch_box(coordinate)
 
             logging.info('Playing video')
+            start_time = time.time()
             time.sleep(40)
+            self.stats.record_ad_wait(start_time, time.time())
 
             logging.info('Finished playing video')
             self.touch(config.free_collect_end_loc)
@@ -214,14 +335,56 @@ class Action():
                     'Can\'t find the okay button during 20 iterations')
 
                 if restart_on_error:
-                    self.adb.restart_app()
+                    self.adb.restart_app('okay button is not found')
                     logging.info('App is restarted')
                     time.sleep(10)
 
                 return False
 
+        self.opened_count += 1
         return True
 
+    def run_chore(self, chore):
+        '''
+        Run a chore such as open_box and record its duration and the number of opened cards
+        '''
+        opened_count = self.opened_count
+        start_time = time.time()
+        self.run_guarded(chore)
+        self.stats.record_chore(chore.__name__, start_time, time.time(), self.opened_count - opened_count)
+
+    def enter_phase(self, phase: str):
+        '''
+        Set the screen state, to which the CPU time is accounted from now on
+        '''
+        metrics.screen_state.set((self.adb.serial,), phase)
+        self.governor.enter(phase)
+
+    def run_guarded(self, function):
+        '''
+        Run a function, and restart the app if the watchdog cancelled it
+        '''
+        device = self.adb.serial
+        self.enter_phase(function.__name__)
+        try:
+            result = function()
+        except AppHang as e:
+            logging.error(f'{function.__name__} is cancelled by the watchdog: {e}')
+            metrics.chores.inc((device, function.__name__, 'cancelled'))
+            self.watchdog.recover()
+            return None
+        except Exception:
+            metrics.chores.inc((device, function.__name__, 'error'))
+            raise
+        finally:
+            self.enter_phase('idle')
+
+        metrics.chores.inc((device, function.__name__, 'failed' if result is False else 'success'))
+        return result
+
+    def expect_motion(self):
+        return self.watchdog.expect_motion() if self.watchdog else contextlib.nullcontext()
+
     def kick_penalty(self):
         locations = [
             config.penalty_left_corner_loc,
@@ -280,6 +443,8 @@ class Action():
 
         logging.info('Starting game')
 
+        matchmaking_start_time = time.time()
+        self.enter_phase('matchmaking')
         logging.info('Entering arena')
         self.touch(config.arena_loc)
         time.sleep(3)
@@ -289,9 +454,11 @@ class Action():
         time.sleep(3)
 
         logging.info('Finding an opponent')
-        index = 0
         while True:
+            # the screens below are checked on the same capture
+            image = self.adb.get_screen(fresh=True)
             if self.sign_in():
+                self.stats.record_chore('matchmaking', matchmaking_start_time, time.time())
                 return
 
             logging.info(f'Trying to find support screen')
@@ -321,80 +488,40 @@ class Action():
                 'templates/bid.png', config.bid_loc)
             if matched:
                 logging.info(f'Bid stage ({score})')
+                self.stats.record_chore('matchmaking', matchmaking_start_time, time.time())
                 time.sleep(5)
                 break
 
-            index += 1
-
-            if index > 50:
+            if time.time() - matchmaking_start_time > config.matchmaking_timeout:
                 logging.info('Something\'s wrong. Restart the app')
-                self.adb.restart_app()
+                self.stats.record_chore('matchmaking', matchmaking_start_time, time.time())
+                self.adb.restart_app('opponent is not found')
 
                 return
 
-        logging.info('Game starated')
-
-        photo_loc = [
-            0,
-            0,
-            config.screen_size[1],
-            config.my_photo_loc[1] + config.my_photo_loc[3]
-        ]
-
-        self.frame_index = 0
-        while True:
-            image1 = self.adb.get_screen()
+            self.governor.wait(image)
 
-            logging.info('Trying to find game end screen')
-            matched, score = self.match_template(
-                'templates/game_end.png', config.game_end_loc, image=image1)
-            if matched:
-                logging.info(f'Game ended ({score})')
-                break
-
-            logging.info('Trying to find time out screen')
-            matched, score = self.match_template(
-                'templates/timeout.png', config.timeout_loc, mask=True, threshold=0.95, image=image1)
-            if matched:
-                logging.info(f'Timeout ({score})')
-                break
+        logging.info('Game starated')
 
-            image2 = self.adb.get_screen()
-
-            diff_image = image_processing.crop(image1, photo_loc) - image_processing.crop(image2, photo_loc)
-            my_photo_diff = image_processing.crop(
-                diff_image, config.my_photo_loc)
-            opponent_photo_diff = image_processing.crop(
-                diff_image, config.opponent_photo_loc)
-
-            if np.sum(my_photo_diff) != 0:
-                logging.info(f'{self.frame_index} My turn to kick')
-                diff_score = image_processing.diff_image(image1, image2)
-                logging.debug(f'frame diff score: {diff_score}')
-                if diff_score < 0.5:
-                    image2 = self.adb.get_screen()
-                    logging.debug(f'Since frame was captured while camera is moving, re-captured')
-
-                gray_image = cv2.cvtColor(image2, cv2.COLOR_BGR2GRAY)
-                color_image = image2
- 
-                self.kick(gray_image, color_image)
-            elif np.sum(opponent_photo_diff) != 0:
-                logging.info(f'{self.frame_index} Opponent\'s turn to kick')
-                #self.defend(gray_image, color_image)
-            else:
-                logging.info(f'{self.frame_index} In-progress')
+        match_start_time = time.time()
+        self.enter_phase('match')
+        with self.expect_motion():
+            result = self.play_match()
+        metrics.match_fps.set((self.adb.serial,), result['analyzed'] / max(time.time() - match_start_time, 1))
 
-            self.frame_index += 1
+        self.enter_phase('game_end')
 
         while True:
-            image = self.adb.get_screen()
+            image = self.adb.get_screen(fresh=True)
             logging.info('Trying to find shootout')
             matched, score = self.match_template(
                 'templates/shootout.png', config.shootout_loc, mask=True, image=image)
             if matched:
                 logging.info(f'Shootout started ({score})')
+                self.enter_phase('shootout')
                 self.play_shootout()
+                result['outcome'] = 'shootout'
+                self.enter_phase('game_end')
 
             logging.info('Trying to find game end')
             matched, score = self.match_template(
@@ -405,7 +532,18 @@ class Action():
                 time.sleep(3)
                 break
 
-            time.sleep(0.5)
+            self.governor.wait(image)
+
+        decision_times = result['decision_times']
+        self.stats.record_match(
+            match_start_time,
+            time.time(),
+            result['outcome'],
+            result['analyzed'],
+            len(decision_times),
+            sum(decision_times) / len(decision_times) if decision_times else None)
+        metrics.games.inc((self.adb.serial, result['outcome']))
+        self.enter_phase('post_match')
 
         time.sleep(3)
 
@@ -431,7 +569,9 @@ class Action():
                 self.touch_box(config.watch_video_loc)
 
                 logging.info('Playing video for 60 secs')
+                start_time = time.time()
                 time.sleep(60)
+                self.stats.record_ad_wait(start_time, time.time())
 
                 logging.info('Finished playing video')
 
@@ -465,6 +605,144 @@ class Action():
         self.touch(config.go_back_loc)
         time.sleep(3)
 
+    def play_match(self):
+        '''
+        Play the match until game end or timeout screen is found.
+        Frames are captured by FrameGrabber and gestures are sent by Actuator
+        in background threads, so that only the latest frame is analyzed here.
+        Unless pipelined, they are captured and sent in turn with the analysis.
+
+        Returns:
+            dict: frame counters and reaction times of the kicks
+        '''
+        photo_loc = [
+            0,
+            0,
+            config.screen_size[1],
+            config.my_photo_loc[1] + config.my_photo_loc[3]
+        ]
+
+        motion = MotionEstimator()
+        grabber = FrameGrabber(self.adb, self.pipelined)
+        actuator = Actuator(self.adb, motion, self.pipelined)
+        grabber.start()
+        actuator.start()
+        self.actuator = actuator
+
+        def recapture():
+            image, timestamp = grabber.get(timeout=config.decision_budget)
+            if image is None:
+                return None
+
+            actuator.frame_timestamp = timestamp
+            return Frame(image, timestamp, self.buffers)
+
+        outcome = 'stopped'
+        decision_times = []
+        if self.trackers:
+            self.trackers = [PlayerTracker(), PlayerTracker()]
+            self.track_count = 0
+
+        if self.record:
+            if self.debug_dir is None:
+                self.create_debug_dir()
+            self.recorder = RecordingWriter(os.path.join(self.debug_dir, 'match.rec'))
+
+        try:
+            self.frame_index = 0
+            previous_frame = None
+            while True:
+                image, timestamp = grabber.get()
+                if image is None:
+                    logging.warning('Frame capture is stopped')
+                    break
+                frame = Frame(image, timestamp, self.buffers)
+
+                logging.info('Trying to find game end screen')
+                matched, score = self.match_template(
+                    'templates/game_end.png', config.game_end_loc, image=frame)
+                if matched:
+                    logging.info(f'Game ended ({score})')
+                    outcome = 'game_end'
+                    break
+
+                logging.info('Trying to find time out screen')
+                matched, score = self.match_template(
+                    'templates/timeout.png', config.timeout_loc, mask=True, threshold=0.95, image=frame)
+                if matched:
+                    logging.info(f'Timeout ({score})')
+                    outcome = 'timeout'
+                    break
+
+                motion.update(image, timestamp)
+
+                if previous_frame is None:
+                    previous_frame = frame
+                    continue
+
+                diff_image = np.subtract(
+                    image_processing.crop(previous_frame.image, photo_loc),
+                    image_processing.crop(image, photo_loc),
+                    out=self.buffers.get('photo_diff', (photo_loc[3], photo_loc[2], 3)))
+                my_photo_diff = image_processing.crop(
+                    diff_image, config.my_photo_loc)
+                opponent_photo_diff = image_processing.crop(
+                    diff_image, config.opponent_photo_loc)
+
+                if np.sum(my_photo_diff) != 0:
+                    state = 'my_turn'
+                    if actuator.busy(timestamp):
+                        logging.info('%d My turn to kick, but the last kick is not shown yet', self.frame_index)
+                    else:
+                        logging.info('%d My turn to kick', self.frame_index)
+                        diff_score = image_processing.diff_image(previous_frame, frame, buffers=self.buffers)
+                        logging.debug('frame diff score: %s', diff_score)
+                        if diff_score < config.frame_diff_threshold:
+                            logging.debug('Since frame was captured while camera is moving, waiting for the next frame')
+                        else:
+                            actuator.frame_timestamp = timestamp
+                            # the views of the frame are overwritten if a newer frame is analyzed
+                            frame = self.kick(frame, recapture) or frame
+                            decision_times.append(time.time() - actuator.frame_timestamp)
+                            metrics.decision_seconds.observe(decision_times[-1], (self.adb.serial,))
+                elif np.sum(opponent_photo_diff) != 0:
+                    state = 'opponent_turn'
+                    logging.info('%d Opponent\'s turn to kick', self.frame_index)
+                    #self.defend(gray_image, color_image)
+                else:
+                    state = 'in_progress'
+                    logging.info('%d In-progress', self.frame_index)
+
+                self.record_frame(frame, state=state)
+
+                if self.trackers:
+                    self.locate_players(frame)
+
+                previous_frame = frame
+                self.frame_index += 1
+                metrics.match_frames.inc((self.adb.serial,))
+        finally:
+            grabber.stop()
+            actuator.stop()
+            self.actuator = self.adb
+
+            if self.recorder:
+                self.recorder.close()
+                logging.info(f'Recorded {self.recorder.count} frames to {self.recorder.path} '
+                             f'({self.recorder.dropped_count} frames or annotations dropped)')
+                self.recorder = None
+                self.recorded_frame = None
+
+        return {
+            'outcome': outcome,
+            'captured': grabber.captured_count,
+            'dropped': grabber.dropped_count,
+            'duplicate': grabber.duplicate_count,
+            'analyzed': self.frame_index,
+            'decision_times': decision_times,
+            'reaction_times': actuator.reaction_times,
+        }
+
     def sign_in(self):
         logging.info('Trying to find signed-out screen')
         matched, score = self.match_template(
@@ -477,38 +755,47 @@ class Action():
 
         return False
 
-    def shoot(self, gray_image, color_image):
+    def get_goal_post_image(self, gray_image, dst: np.ndarray = None):
+        gray_image = image_processing.get_gray(gray_image)
+        # same as gray[gray < 250] = 0 on a copy
+        _, gray = cv2.threshold(gray_image, 249, 255, cv2.THRESH_TOZERO, dst=dst)
+
+        gray[0:config.dashboard_height, :] = 0
+
+        return gray
+
+    def find_goal_post(self, gray_image):
         '''
         1. rgb2gray
         2. remove dashboard region
         3. 250 thresholding
         4. hough transform
         5. find upper goal post
-        6. shoot to the farther corner
+        6. decide the farther corner as target
+
+        Returns:
+            list: x1, y1, x2, y2 of the goal post and target_x, target_y, or None if it's not shoot chance
         '''
         logging.info('Check if it\'s shoot chance')
-        gray = gray_image.copy()
+        gray = self.get_goal_post_image(gray_image, self.buffers.get('goal_post', gray_image.shape[0:2]))
 
-        gray[0:config.dashboard_height, :] = 0
-        gray[gray < 250] = 0
-
-        lines = cv2.HoughLines(gray, 1, np.pi/180, 150)
+        lines = cv2.HoughLines(gray, 1, np.pi/180, config.goal_post_hough_threshold)
 
         if lines is None or len(lines) == 0:
             logging.info('There is no goal post')
-            return False
+            return None
 
         index = 0 if len(lines) == 1 else 1
         rho, theta = sorted(lines, key=lambda x: x[0][0])[index][0]
 
-        logging.debug(f'rho: {rho} theta: {theta}')
+        logging.debug('rho: %s theta: %s', rho, theta)
         if rho > 700 or theta < 0.8 or theta > 2.4:
             logging.debug('The goal post position is not valid')
-            return False
+            return None
 
         if np.sin(theta) == 0:
             logging.debug('sin(theta) == 0')
-            return False
+            return None
 
         a = -np.cos(theta) / np.sin(theta)
         b = rho / np.sin(theta)
@@ -525,7 +812,7 @@ class Action():
                 continue
 
             if gray[y, x] > 0:
-                logging.debug(f'({x}, {y}), is starting point of goal post')
+                logging.debug('(%d, %d), is starting point of goal post', x, y)
                 x1 = x
                 y1 = y
                 break
@@ -536,16 +823,17 @@ class Action():
                 continue
 
             if gray[y, x] > 0:
-                logging.debug(f'({x}, {y}), is ending point of goal post')
+                logging.debug('(%d, %d), is ending point of goal post', x, y)
                 x2 = x
                 y2 = y
                 break
 
         goal_post_length = image_processing.get_distance([x1, y1], [x2, y2])
-        logging.debug(f'Goal post length: {goal_post_length}')
-        if (theta > 1.4 and theta < 1.8 and goal_post_length < 170) or goal_post_length < 150:
+        logging.debug('Goal post length: %s', goal_post_length)
+        if (theta > 1.4 and theta < 1.8 and goal_post_length < config.goal_post_min_front_length) or \
+                goal_post_length < config.goal_post_min_length:
             logging.info(f'Goal post is far ({goal_post_length}). Give up shooting')
-            return False
+            return None
 
         center = config.screen_size[1] / 2
         if abs(x1 - center) > abs(x2 - center):
@@ -557,36 +845,159 @@ class Action():
 
         if target_y > config.kick_start_loc[1]:
             logging.debug(f'It seems our goal post. Give up shooting')
-            return False
+            return None
 
-        logging.info(f'Shot to ({target_x}, {target_y})')
+        return [x1, y1, x2, y2, target_x, target_y]
+
+    def shoot(self, gray_image, goal_post: list):
+        """Decide the shot to the goal post
+
+        Returns:
+            list: kick as start_x, start_y, end_x, end_y, duration
+        """
+        x1, y1, x2, y2, target_x, target_y = goal_post
 
-        self.adb.swipe(
-            config.kick_start_loc[0], config.kick_start_loc[1], target_x, target_y, 500)
+        logging.info(f'Shot to ({target_x}, {target_y})')
 
         if self.debug:
+            gray = self.get_goal_post_image(gray_image)
             cv2.circle(gray, (x1, y1), 5, (128,), -1)
             cv2.circle(gray, (x2, y2), 5, (128,), -1)
             cv2.line(gray, tuple(config.kick_start_loc), (target_x, target_y), (128,), 2)
 
             cv2.imwrite(f'{self.debug_dir}\\shot_{self.frame_index}.png', gray)
 
-        return True
+        return [config.kick_start_loc[0], config.kick_start_loc[1], target_x, target_y, 500]
 
-    def kick(self, gray_image, color_image):
-        if self.debug:
-            cv2.imwrite(f'{self.debug_dir}\\frame_{self.frame_index}.png', color_image)
+    def kick(self, frame: Frame, recapture=None):
+        """Decide and send kicks for the frame
+
+        The decision is a deadline-aware cascade of shoot, pass, and random kick.
+        When a stage is expected to end after config.decision_budget from the capture,
+        a newer frame is taken once by recapture, otherwise the random kick is used.
+
+        Args:
+            frame (Frame): captured frame, or color image captured now
+            recapture (function): returns a newer Frame, or None if there is no newer frame
+
+        Returns:
+            Frame: the frame which the kicks are decided on, or None if no kick is sent
+        """
+        frame = to_frame(frame, buffers=self.buffers)
+
+        while True:
+            if self.debug:
+                cv2.imwrite(f'{self.debug_dir}\\frame_{self.frame_index}.png', frame.image)
+
+            kicks = self.decide_kick(frame)
+            if kicks is not None:
+                break
+
+            if recapture is None:
+                logging.info('Over the decision budget. Random kick')
+                kicks = self.random_kick()
+                break
+
+            logging.info('Over the decision budget. Re-capture')
+            frame = recapture()
+            recapture = None
+            if frame is None:
+                return None
 
-        if self.shoot(gray_image, color_image):
+        logging.info(f'Decided {len(kicks)} kicks at frame age {(time.time() - frame.timestamp) * 1000:.0f} ms')
+        self.record_frame(frame, kicks=kicks)
+        for kick in kicks:
+            self.actuator.swipe(*kick)
+
+        return frame
+
+    def record_frame(self, frame: Frame, **fields):
+        '''
+        Append the frame to the match recording, or add the fields to it if it's already appended
+        '''
+        if self.recorder is None:
             return
 
+        if frame is self.recorded_frame:
+            self.recorder.annotate(frame.timestamp, **fields)
+        else:
+            self.recorder.append(frame.image, frame.timestamp, **fields)
+            self.recorded_frame = frame
+
+    def decide_kick(self, frame: Frame):
+        """Decide kicks in the order of shoot, pass, and random kick
+
+        Returns:
+            list: kicks, or None if the next stage can't be finished before the deadline
+        """
+        deadline = frame.timestamp + config.decision_budget
+
+        if self.vision_pool:
+            return self.vision_pool.decide(frame.image, frame.timestamp, deadline)
+
+        if self.executor:
+            if self.over_budget('vision', deadline):
+                return None
+
+            # goal post and player map are independent, so they are analyzed concurrently
+            start_time = time.time()
+            goal_post_future = self.executor.submit(self.find_goal_post, frame)
+            player_map = self.locate_players(frame)
+            goal_post = goal_post_future.result()
+            self.update_cost('vision', start_time)
+        else:
+            if self.over_budget('goal_post', deadline):
+                return None
+
+            start_time = time.time()
+            goal_post = self.find_goal_post(frame)
+            self.update_cost('goal_post', start_time)
+
+        if goal_post:
+            return [self.shoot(frame, goal_post)]
+
         # if corner kick, kick to the header position
         # self.header()
 
-        if self.kick_pass(color_image):
-            return
+        if self.over_budget('pass', deadline):
+            return None
 
-        # random kick
+        start_time = time.time()
+        if not self.executor:
+            player_map = self.locate_players(frame)
+        kicks = self.kick_pass(frame, player_map)
+        self.update_cost('pass', start_time)
+        if kicks:
+            return kicks
+
+        return self.random_kick()
+
+    def over_budget(self, stage: str, deadline: float):
+        '''
+        Check if the stage is expected to end after the deadline.
+        The expected cost decays whenever the stage is skipped, so that a stage which was slow once
+        (e.g. on the first frame or a busy host) runs again and is measured.
+        '''
+        cost = self.stage_costs.get(stage, 0)
+        if time.time() + cost <= deadline:
+            return False
+
+        self.stage_costs[stage] = cost * config.stage_cost_decay
+        return True
+
+    def update_cost(self, stage: str, start_time: float):
+        # exponential moving average of the elapsed time of the stage, which a sample can raise
+        # stage_cost_max_growth times at most, and which never exceeds the decision budget
+        cost = time.time() - start_time
+        previous = self.stage_costs.get(stage)
+        if previous is None:
+            estimate = cost
+        else:
+            estimate = min(0.8 * previous + 0.2 * cost, previous * config.stage_cost_max_growth)
+        self.stage_costs[stage] = min(estimate, config.decision_budget)
+
+    def random_kick(self):
+        kicks = []
         for kick in ['forward', 'backward', 'header']:
             if kick == 'forward':
                 zone = [167, 420, 385, 289]
@@ -605,7 +1016,9 @@ class Action():
             y = random.randint(zone[1], zone[1] + zone[3])
 
             logging.info(f'Random {kick} kick from ({kick_start_x}, {kick_start_y}) to ({x}, {y})')
-            self.adb.swipe(kick_start_x, kick_start_y, x, y, 500)
+            kicks.append([kick_start_x, kick_start_y, x, y, 500])
+
+        return kicks
 
     def defend(self, gray_image, color_image):
         logging.debug('Implement how to defend')
@@ -614,46 +1027,46 @@ class Action():
     def play_shootout(self):
         logging.info('Starting shootout')
 
-        not_found_count = 0
+        detector = ShootoutDetector()
+        start_time = time.time()
         while True:
-            matched, score = self.match_template(
-                'templates/shootout_defence.png', mask=True, threshold=0.7, diff_threshold=50)
-            if (matched):
+            image = self.adb.get_screen(fresh=True)
+            state = detector.detect(image)
+
+            if state == 'defence':
                 logging.info('Found shootout defence')
                 self.defend_penalty()
-
                 time.sleep(1)
-                not_found_count = 0
-                continue
-
-            matched, score = self.match_template(
-                'templates/shootout_offence.png', mask=True, threshold=0.7, diff_threshold=50)
-            if (matched):
+            elif state == 'offence':
                 logging.info('Found shootout offence')
                 self.kick_penalty()
-
                 time.sleep(1)
-                not_found_count = 0
-                continue
-
-            logging.info('None of defence and offence found')
-            not_found_count += 1
-
-            if not_found_count == 10:
+            elif state == 'end':
                 logging.info('Finished the shootout')
                 break
+            else:
+                logging.info('None of defence and offence found')
 
-    def kick_pass(self, image: np.ndarray):
+            if time.time() - start_time > config.shootout_timeout:
+                logging.warning('Can\'t find the end of the shootout')
+                break
+
+            self.governor.wait(image)
+
+    def kick_pass(self, image: np.ndarray, player_map: tuple = None):
         """Decide where to pass
 
         Args:
-            image (np.ndarray): color image
+            image (np.ndarray): color image or Frame
+            player_map (tuple): result of get_player_map if it's already computed
 
         Returns:
-            [type]: [description]
+            list: kicks as start_x, start_y, end_x, end_y, duration
         """
 
-        my_stats, my_centroids, op_stats, op_centroids = self.get_player_map(image)
+        if player_map is None:
+            player_map = self.get_player_map(image)
+        my_stats, my_centroids, op_stats, op_centroids = player_map
 
         # preprocessing: merge into bigger location if location exists in both my and op
         my_remove_list = []
@@ -671,10 +1084,12 @@ class Action():
                         my_remove_list.append(my_index)
 
         my_centroids = np.delete(my_centroids, my_remove_list, axis=0)
+        op_stats = np.delete(op_stats, op_remove_list, axis=0)
         op_centroids = np.delete(op_centroids, op_remove_list, axis=0)
 
         if self.debug:
-            result = np.zeros((image.shape[0], image.shape[1], 3), np.uint8)
+            result = self.buffers.get('kick_pass_result', (image.shape[0], image.shape[1], 3))
+            result.fill(0)
 
             for index, position in enumerate(my_centroids):
                 position = tuple(map(int, position))
@@ -706,143 +1121,216 @@ class Action():
             config.kick_backward_start_locs[1],
             config.header_start_loc
         ]
-        kick_distance_threshold = [80, 40, 40, 60]
+        kick_list = []
 
-        for kick_index, kick in enumerate(kicks):
-            for index, position in enumerate(my_centroids):
-                dist = image_processing.get_distance(
-                    position, kick_start_locs[kick_index])
-                if dist < kick_distance_threshold[kick_index]:
-                    kick_found[kick_index]= True
-                    kicker_index = index
-                    logging.info(f'{kick} kick ({dist})')
-                    break
+        if self.pass_planner:
+            for kick_index, kick in self.pass_planner.plan(my_centroids, op_stats, op_centroids, self.buffers):
+                kick_found[kick_index] = True
+                kick_list.append(kick)
 
-            if kick_found[kick_index]:
-                max_dist = 0
-                max_index = -1
-                for my_index, my_position in enumerate(my_centroids):
-                    if my_index == kicker_index:
-                        continue
+                if self.debug:
+                    cv2.line(result, tuple(kick[0:2]), tuple(kick[2:4]), kick_colors[kick_index], 2)
+        else:
+            for kick_index, kick in enumerate(kicks):
+                for index, position in enumerate(my_centroids):
+                    dist = image_processing.get_distance(
+                        position, kick_start_locs[kick_index])
+                    if dist < config.kick_distance_threshold[kick_index]:
+                        kick_found[kick_index]= True
+                        kicker_index = index
+                        logging.info(f'{kick} kick ({dist})')
+                        break
 
-                    pos = list(map(int, my_position))
+                if kick_found[kick_index]:
+                    max_dist = 0
+                    max_index = -1
+                    for my_index, my_position in enumerate(my_centroids):
+                        if my_index == kicker_index:
+                            continue
 
-                    if kick_masks[kick_index][pos[1], pos[0]] == 0:
-                        continue
+                        pos = list(map(int, my_position))
 
-                    min_op_dist = sys.maxsize
-                    min_op_index = -1
-                    for op_index, op_position in enumerate(op_centroids):
-                        if (kick == 'forward' or kick == 'header') and \
-                            (op_position[1] < my_position[1] or 
-                            op_position[1] > my_centroids[kicker_index][1]):
+                        if kick_masks[kick_index][pos[1], pos[0]] == 0:
                             continue
 
-                        if (kick == 'backword1' or kick == 'backward2') and \
-                            (op_position[1] > my_position[1] or 
-                            op_position[1] < my_centroids[kicker_index][1]):
-                            continue
+                        min_op_dist = sys.maxsize
+                        min_op_index = -1
+                        for op_index, op_position in enumerate(op_centroids):
+                            if (kick == 'forward' or kick == 'header') and \
+                                (op_position[1] < my_position[1] or 
+                                op_position[1] > my_centroids[kicker_index][1]):
+                                continue
+
+                            if (kick == 'backword1' or kick == 'backward2') and \
+                                (op_position[1] > my_position[1] or 
+                                op_position[1] < my_centroids[kicker_index][1]):
+                                continue
+
+                            dist = image_processing.get_point_line_distance(op_position, my_position, my_centroids[kicker_index])
+                            if dist < min_op_dist:
+                                min_op_dist = dist
+                                min_op_index = op_index
+
+                        logging.debug(
+                            'Minimum distance between player[%d] and opponent[%d]: %s', my_index, min_op_index, min_op_dist)
+
+                        if max_dist < min_op_dist:
+                            max_dist = min_op_dist
+                            max_index = my_index
+
+                    if max_index != -1:
+                        logging.info(
+                            f'Kicked to player[{max_index}]({my_centroids[max_index]}) with opponent distance {max_dist}')
+
+                        kick_list.append([
+                            kick_start_locs[kick_index][0],
+                            kick_start_locs[kick_index][1],
+                            my_centroids[max_index][0],
+                            my_centroids[max_index][1],
+                            200])
+
+                        if self.debug:
+                            cv2.line(result, tuple(kick_start_locs[kick_index]), tuple(
+                                map(int, my_centroids[max_index])), kick_colors[kick_index], 2)
+                    else:
+                        logging.warning('Can\'t find proper player')
+                        kick_found[kick_index] = False
 
-                        dist = image_processing.get_point_line_distance(op_position, my_position, my_centroids[kicker_index])
-                        if dist < min_op_dist:
-                            min_op_dist = dist
-                            min_op_index = op_index
+        if self.debug:
+            cv2.imwrite(f'{self.debug_dir}\\result_{self.frame_index}.png', result)
 
-                    logging.debug(
-                        f'Minimum distance between player[{my_index}] and opponent[{min_op_index}]: {min_op_dist}')
+        if not any(kick_found):
+            logging.error('Can\'t find any of kick situation')
+            if self.debug:
+                cv2.imwrite(f'{self.debug_dir}\\error_image_{self.frame_index}.png', image_processing.get_view(image))
 
-                    if max_dist < min_op_dist:
-                        max_dist = min_op_dist
-                        max_index = my_index
+        return kick_list
 
-                if max_index != -1:
-                    logging.info(
-                        f'Kicked to player[{max_index}]({my_centroids[max_index]}) with opponent distance {max_dist}')
+    def locate_players(self, image: np.ndarray, timestamp: float = None):
+        """Get the player map, from the trackers if tracking is enabled
 
-                    self.swipe(kick_start_locs[kick_index], my_centroids[max_index])
+        Full detection by get_player_map runs every config.tracker_detection_interval
+        frames or when a track is lost, and the tracks are updated by local search otherwise.
+        The timestamp is the capture time of the image, which is taken from the image if it's a Frame.
+        """
+        frame = to_frame(image, timestamp, self.buffers)
+        timestamp = frame.timestamp
+        image = frame
+
+        if not self.trackers:
+            return self.get_player_map(image)
+
+        if timestamp == self.track_timestamp:
+            return self.track_map
+
+        my_tracker, op_tracker = self.trackers
+        if self.track_count % config.tracker_detection_interval == 0 or len(my_tracker) == 0:
+            my_stats, my_centroids, op_stats, op_centroids = self.get_player_map(image)
+            my_tracker.update_detections(my_stats, my_centroids, timestamp)
+            op_tracker.update_detections(op_stats, op_centroids, timestamp)
+
+            self.uniform_colors = [
+                self.get_uniform_colors(image, config.my_uniform_loc),
+                self.get_uniform_colors(image, config.opponent_uniform_loc),
+            ]
+            self.track_count = 1
+        else:
+            found = True
+            for tracker, uniform_colors in zip(self.trackers, self.uniform_colors):
+                found &= tracker.update_local(
+                    frame.image,
+                    timestamp,
+                    lambda crop: self.get_player_locations(Frame(crop).eh, uniform_colors))
 
-                    if self.debug:
-                        cv2.line(result, tuple(kick_start_locs[kick_index]), tuple(
-                            map(int, my_centroids[max_index])), kick_colors[kick_index], 2)
-                else:
-                    logging.warning('Can\'t find proper player')
-                    kick_found[kick_index] = False
+            # detect again on the next frame if a player is lost
+            self.track_count = self.track_count + 1 if found else 0
 
-        if self.debug:
-            cv2.imwrite(f'{self.debug_dir}\\result_{self.frame_index}.png', result)
+        self.track_timestamp = timestamp
+        self.track_map = my_tracker.get_map() + op_tracker.get_map()
 
-        if any(kick_found):
-            return True
-        else:
-            logging.error('Can\'t find any of kick situation')
-            if self.debug:
-                cv2.imwrite(f'{self.debug_dir}\\error_image_{self.frame_index}.png', image)
+        return self.track_map
 
-        return False
+    def get_uniform_colors(self, image: np.ndarray, uniform_loc: list):
+        return self.estimate_uniform_colors(to_frame(image, buffers=self.buffers), uniform_loc)
 
     def get_player_map(self, image):
-        image_hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-        image_eh = image_processing.hsv2eh(image_hsv)
+        '''
+        Stats and centroids of my and opponent players by the player detector
+        '''
+        return self.detector.detect(to_frame(image, buffers=self.buffers))
+
+    def get_color_player_map(self, frame: Frame):
+        image_eh = frame.eh
+
+        if self.executor:
+            # playground and uniform masks are independent, so they are computed concurrently
+            playground_future = self.executor.submit(self.get_playground_mask, image_eh)
+            my_future = self.executor.submit(
+                self.get_uniform_mask, frame, config.my_uniform_loc, 'my')
+            opponent_mask = self.get_uniform_mask(frame, config.opponent_uniform_loc, 'op')
+            my_mask = my_future.result()
+            playground_mask = playground_future.result()
+
+            my_future = self.executor.submit(self.get_team_map, my_mask, playground_mask, 'my')
+            op_stats, op_centroid = self.get_team_map(opponent_mask, playground_mask, 'op')
+            my_stats, my_centroid = my_future.result()
+        else:
+            playground_mask = self.get_playground_mask(image_eh)
+            my_mask = self.get_uniform_mask(frame, config.my_uniform_loc, 'my')
+            opponent_mask = self.get_uniform_mask(frame, config.opponent_uniform_loc, 'op')
 
-        # mask for the green playground
-        playground_mask = cv2.inRange(image_eh, np.array(40, dtype=np.uint16), np.array(55, dtype=np.uint16))
-        playground_mask = cv2.morphologyEx(playground_mask, cv2.MORPH_OPEN, np.ones((5, 5), np.uint8))
-        playground_mask = cv2.morphologyEx(playground_mask, cv2.MORPH_CLOSE, np.ones((55, 55), np.uint8))
+            my_stats, my_centroid = self.get_team_map(my_mask, playground_mask, 'my')
+            op_stats, op_centroid = self.get_team_map(opponent_mask, playground_mask, 'op')
 
-        my_uniform_colors = self.estimate_uniform_colors(
-            image_hsv, config.my_uniform_loc)
-        opponent_uniform_colors = self.estimate_uniform_colors(
-            image_hsv, config.opponent_uniform_loc)
+        if self.debug and self.save_mask:
+            cv2.imwrite(f'{self.debug_dir}\\result_{self.frame_index}_playground_mask.png', playground_mask)
 
-        logging.debug(
-            f'my uniform color: {",".join(map(str, my_uniform_colors))}')
-        logging.debug(
-            f'opponent uniform color: {",".join(map(str, opponent_uniform_colors))}')
+        return my_stats, my_centroid, op_stats, op_centroid
 
-        my_mask = self.get_player_locations(image_eh, my_uniform_colors)
-        opponent_mask = self.get_player_locations(
-            image_eh, opponent_uniform_colors)
+    def get_playground_mask(self, image_eh):
+        return self.playground.segment(image_processing.get_view(image_eh, 'eh'), self.buffers)
+
+    def get_uniform_mask(self, frame: Frame, uniform_loc, team):
+        uniform_colors = self.estimate_uniform_colors(frame, uniform_loc)
+        logging.debug('%s uniform color: %s', team, ','.join(map(str, uniform_colors)))
+
+        return self.get_player_locations(
+            frame, uniform_colors, self.buffers.get(f'{team}_uniform_mask', frame.shape[0:2]))
+
+    def get_team_map(self, mask, playground_mask, team):
+        # masks are computed alternately in the two buffers
+        mask1 = self.buffers.get(f'{team}_mask_1', mask.shape)
+        mask2 = self.buffers.get(f'{team}_mask_2', mask.shape)
 
         # Remove non-playground region
-        my_mask = cv2.bitwise_and(my_mask, playground_mask)
-        opponent_mask = cv2.bitwise_and(opponent_mask, playground_mask)
+        cv2.bitwise_and(mask, playground_mask, dst=mask1)
 
         # Merge separated player's points, especially for striped uniform
-        kernel = np.ones((3, 3), np.uint8)
-        my_mask = cv2.morphologyEx(my_mask, cv2.MORPH_CLOSE, kernel)
-        opponent_mask = cv2.morphologyEx(
-            opponent_mask, cv2.MORPH_CLOSE, kernel)
+        cv2.morphologyEx(mask1, cv2.MORPH_CLOSE, kernel_3, dst=mask2)
 
         # Remove noise
-        kernel = np.ones((5, 5), np.uint8)
-        my_mask_open = cv2.morphologyEx(my_mask, cv2.MORPH_OPEN, kernel)
-        opponent_mask_open = cv2.morphologyEx(
-            opponent_mask, cv2.MORPH_OPEN, kernel)
+        cv2.morphologyEx(mask2, cv2.MORPH_OPEN, kernel_5, dst=mask1)
 
         # Merge separated player's parts, i.e. body and leg
-        kernel = np.ones((30, 30), np.uint8)
-        my_mask_close = cv2.morphologyEx(my_mask_open, cv2.MORPH_CLOSE, kernel)
-        opponent_mask_close = cv2.morphologyEx(
-            opponent_mask_open, cv2.MORPH_CLOSE, kernel)
+        cv2.morphologyEx(mask1, cv2.MORPH_CLOSE, kernel_30, dst=mask2)
+        mask = mask2
 
-        _, _, my_stats, my_centroid = cv2.connectedComponentsWithStats(
-            my_mask_close)
-        _, _, op_stats, op_centroid = cv2.connectedComponentsWithStats(
-            opponent_mask_close)
+        _, _, stats, centroid = cv2.connectedComponentsWithStats(
+            mask, self.buffers.get(f'{team}_labels', mask.shape, np.int32))
 
         if self.debug and self.save_mask:
-            cv2.imwrite(f'{self.debug_dir}\\result_{self.frame_index}_my_mask.png', my_mask_close)
-            cv2.imwrite(f'{self.debug_dir}\\result_{self.frame_index}_op_mask.png', opponent_mask_close)
-            cv2.imwrite(f'{self.debug_dir}\\result_{self.frame_index}_playground_mask.png', playground_mask)
-            
+            cv2.imwrite(f'{self.debug_dir}\\result_{self.frame_index}_{team}_mask.png', mask)
+
         # Remove the first element which covers entire screen
-        return my_stats[1:], my_centroid[1:], op_stats[1:], op_centroid[1:]
+        return stats[1:], centroid[1:]
 
     def estimate_uniform_colors(self, image_hsv, uniform_loc):
+        '''
+        EH values of the uniform in the HSV image, or in the Frame whose EH view is cropped if it's computed
+        '''
         uniform_eh = image_processing.hsv2eh(
             image_processing.crop(image_hsv, uniform_loc))
-        uniform_mask = cv2.imread(
-            'templates/uniform_mask.png', cv2.IMREAD_GRAYSCALE)
+        uniform_mask = self.uniform_mask
 
         uniform_masked = np.ma.masked_array(uniform_eh, uniform_mask == 0)
         values, counts = np.unique(
@@ -855,37 +1343,29 @@ class Action():
             if type(v) == np.ma.core.MaskedConstant:
                 continue
 
-            if c / uniform_pixels > 0.2:
+            if c / uniform_pixels > config.uniform_color_ratio:
                 uniform_values.append(v)
 
         return uniform_values
 
-    def get_player_locations(self, image_eh, uniform_colors):
-        mask = np.zeros(image_eh.shape, np.uint8)
+    def get_player_locations(self, image_eh, uniform_colors, dst: np.ndarray = None):
+        # mask of all uniform colors in one pass
+        return cv2.LUT(image_processing.get_view(image_eh, 'eh'), self.get_uniform_lut(uniform_colors), dst=dst)
+
+    def get_uniform_lut(self, uniform_colors):
+        '''
+        Lookup table from EH value to 255 if the value is within the range of any uniform color
+        '''
+        lut = np.zeros(256, np.uint8)
         for color in uniform_colors:
+            # the range doesn't cross the boundary between hues and non-colors
             if color < 180:
-                if color >= 178:
-                    upper_margin = 179 - color
-                else:
-                    upper_margin = 2
-
-                if color <= 1:
-                    lower_margin = color
-                else:
-                    lower_margin = 2
+                upper_margin = min(config.uniform_hue_margin, 179 - color)
+                lower_margin = min(config.uniform_hue_margin, color)
             else:
-                if color > 240:
-                    upper_margin = 255 - color
-                else:
-                    upper_margin = 15
-
-                if color < 195:
-                    lower_margin = color - 180
-                else:
-                    lower_margin = 15
+                upper_margin = min(config.uniform_non_color_margin, 255 - color)
+                lower_margin = min(config.uniform_non_color_margin, color - 180)
 
-            cur_mask = cv2.inRange(image_eh, np.array(
-                color - lower_margin, dtype=np.uint16), np.array(color + upper_margin, dtype=np.uint16))
-            mask = cv2.bitwise_or(mask, cur_mask)
+            lut[color - lower_margin:color + upper_margin + 1] = 255
 
-        return mask
+        return lut
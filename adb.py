@@ -2,54 +2,228 @@ import cv2
 import numpy as np
 import logging
 import time
+import re
+import struct
+import threading
 
 from ppadb.client import Client as AdbClient
 import config
+import metrics
+
+
+class ShellSession():
+    '''
+    Interactive shell kept open on the device, so that a command is written to the open
+    connection instead of a new ADB connection per command, and returns before the command finishes
+    '''
+    def __init__(self, device):
+        self.connection = device.create_connection()
+        self.connection.send('shell:')
+        self.lock = threading.Lock()
+
+        # the output is read and discarded, so that the shell is never blocked by a full buffer
+        self.reader = threading.Thread(target=self.drain, name='Shell', daemon=True)
+        self.reader.start()
+
+    def drain(self):
+        try:
+            while self.connection.socket.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def run(self, command: str):
+        with self.lock:
+            self.connection.socket.sendall(f'{command}\n'.encode())
+
+    def close(self):
+        self.connection.close()
+
+
+def decode_raw_screen(buffer: bytes, color: bool = True):
+    '''
+    Image of the output of screencap without -p: width, height, and pixel format as 32-bit integers,
+    and the color space on Android 9 or later, followed by the RGBA pixels
+    '''
+    width, height, pixel_format = struct.unpack_from('<3I', buffer)
+    header_size = len(buffer) - width * height * 4
+    if pixel_format != 1 or header_size not in (12, 16):
+        raise Exception(f'Unsupported raw screen: {width}x{height}, format {pixel_format}, {len(buffer)} bytes')
+
+    rgba = np.frombuffer(buffer, np.uint8, width * height * 4, header_size).reshape(height, width, 4)
+    return cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR if color else cv2.COLOR_RGBA2GRAY)
+
 
 class Adb():
-    def __init__(self):
-        client = AdbClient(host="127.0.0.1", port=5037)
-        devices = client.devices()
-        if len(devices) == 0:
-            raise Exception('There is no ADB devices')
+    def __init__(self, device=None):
+        '''
+        Connect to the first ADB device, or use the given ppadb device
+        '''
+        if device is None:
+            client = AdbClient(host="127.0.0.1", port=5037)
+            devices = client.devices()
+            if len(devices) == 0:
+                raise Exception('There is no ADB devices')
 
-        self.device = devices[0]
+            device = devices[0]
+
+        self.device = device
+        self.serial = self.device.serial
         self.app_name = 'com.firsttouchgames.smp'
+        # capture and input methods, see config.capture_backend and config.input_backend
+        self.capture_backend = config.capture_backend
+        self.input_backend = config.input_backend
+        self.shell_session = None
+        # run statistics, the watchdog, and the input queue, which are set by Action
+        self.stats = None
+        self.watchdog = None
+        self.input_queue = None
+
+        # last capture as (image, color, capture start time), and the time of the last input
+        self.cache = None
+        self.input_time = 0
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def get_screen(self, color: bool = True, fresh: bool = False):
+        '''
+        Capture the screen. The last capture is returned instead while it's younger than
+        config.capture_freshness and no input is sent after it, unless fresh is set.
+        The returned image must not be modified.
+        '''
+        self.check_watchdog()
+        if self.input_queue:
+            self.input_queue.wait()
+
+        cache = self.cache
+        if not fresh and cache and cache[1] == color and cache[2] > self.input_time and \
+                time.time() - cache[2] < config.capture_freshness:
+            self.hit_count += 1
+            metrics.capture_cache.inc((self.serial, 'hit'))
+            return cache[0]
+
+        self.miss_count += 1
+        metrics.capture_cache.inc((self.serial, 'miss'))
 
-    def get_screen(self, color: bool = True):
         dim = config.screen_size
 
         for idx in range(10):
-            buffer = np.frombuffer(self.device.screencap(), dtype='uint8')
-
-            if color:
-                img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
-            else:
-                img = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE)
+            self.check_watchdog()
+            start_time = time.time()
+            img = self.capture(color)
+            metrics.capture_seconds.observe(time.time() - start_time, (self.serial,))
  
             if dim == list(img.shape[0:2]):
+                if self.watchdog:
+                    self.watchdog.observe(img)
+                self.cache = (img, color, start_time)
                 break
 
             logging.warning('Score! Match app is not active. Trying to run the app')
             self.start_app()
             time.sleep(5)
+            metrics.restarts.inc((self.serial, 'app is not active'))
+            if self.stats:
+                self.stats.record_restart('app is not active', 5)
        
         return img
 
+    def capture(self, color: bool = True):
+        '''
+        Capture the screen by the capture backend without the cache and the retries
+        '''
+        if self.capture_backend == 'raw':
+            with self.device.create_connection() as connection:
+                # exec: doesn't allocate a terminal, which would convert the line feeds of the binary output
+                connection.send('exec:screencap')
+                return decode_raw_screen(connection.read_all(), color)
+
+        buffer = np.frombuffer(self.device.screencap(), dtype='uint8')
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR if color else cv2.IMREAD_GRAYSCALE)
+
     def touch(self, x, y):
-        self.device.input_tap(x, y)
+        self.check_watchdog()
+        # after the queued inputs
+        if self.input_queue:
+            self.input_queue.wait()
+        self.input_time = time.time()
+        if self.input_backend == 'shell':
+            self.get_shell_session().run(f'input tap {x} {y}')
+        else:
+            self.device.input_tap(x, y)
         
     def swipe(self, start_x, start_y, end_x, end_y, duration):
-        self.device.input_swipe(start_x, start_y, end_x, end_y, duration)
+        self.check_watchdog()
+        if self.input_queue:
+            self.input_queue.wait()
+        self.input_time = time.time()
+        if self.input_backend == 'shell':
+            self.get_shell_session().run(f'input swipe {start_x} {start_y} {end_x} {end_y} {duration}')
+        else:
+            self.device.input_swipe(start_x, start_y, end_x, end_y, duration)
+
+    def send_inputs(self, commands: list, on_ack=None):
+        '''
+        Run the commands in one shell invocation, and call on_ack with the index of each command
+        when the device echoes that the command is done
+        '''
+        script = '; '.join(f'{command}; echo ack {index}' for index, command in enumerate(commands))
+
+        def read(connection):
+            buffer = b''
+            while True:
+                data = connection.read(4096)
+                if not data:
+                    break
+
+                buffer += data
+                lines = buffer.split(b'\n')
+                buffer = lines.pop()
+                for line in lines:
+                    if line.startswith(b'ack ') and on_ack:
+                        on_ack(int(line[4:]))
+            connection.close()
+
+        self.device.shell(script, handler=read)
+
+    def get_shell_session(self):
+        if self.shell_session is None:
+            self.shell_session = ShellSession(self.device)
+
+        return self.shell_session
+
+    def check_watchdog(self):
+        if self.watchdog:
+            self.watchdog.check()
+
+    def get_pid(self):
+        return self.device.shell(f'pidof {self.app_name}').strip()
+
+    def get_foreground_activity(self):
+        '''
+        Returns:
+            str: package/activity of the resumed activity, or empty string if it's unknown
+        '''
+        output = self.device.shell('dumpsys activity activities | grep ResumedActivity')
+        match = re.search(r'([\w.]+/[\w.$]+)', output)
+        return match.group(1) if match else ''
 
     def start_app(self):
+        self.input_time = time.time()
         self.device.shell(f'monkey -p {self.app_name} -c android.intent.category.LAUNCHER 1')
         
     def stop_app(self):
+        self.input_time = time.time()
         self.device.shell(f'am force-stop {self.app_name}')
         
-    def restart_app(self):
+    def restart_app(self, reason: str = ''):
+        metrics.screen_state.set((self.serial,), 'restarting')
+        metrics.restarts.inc((self.serial, reason))
+        start_time = time.time()
         self.stop_app()
         time.sleep(5)
         self.start_app()
-        time.sleep(5)
\ No newline at end of file
+        time.sleep(5)
+
+        if self.stats:
+            self.stats.record_restart(reason, time.time() - start_time)
@@ -0,0 +1,338 @@
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import platform
+import argparse
+import itertools
+
+import cv2
+import numpy as np
+
+from action import Action
+from frame import Frame
+import config
+import image_processing
+
+
+# benchmark name to the setup function, which returns the function to measure
+cases = {}
+
+
+def case(function):
+    cases[function.__name__] = function
+    return function
+
+
+def create_frames(count: int = 8):
+    '''
+    Synthetic match frames at the screen size: the pitch with lines, both teams, and their uniforms
+    in the dashboard, so that the benchmark runs without recorded frames. Same frames on every run.
+    '''
+    uniform_mask = cv2.imread('templates/uniform_mask.png', cv2.IMREAD_GRAYSCALE)
+    rng = np.random.default_rng(0)
+
+    images = []
+    for index in range(count):
+        image = np.zeros(config.screen_size + [3], np.uint8)
+        image[:] = (40, 160, 80)
+        image[:config.dashboard_height] = (30, 30, 30)
+        # camera moves a little between the frames
+        cv2.line(image, (0, 400 + index), (719, 420 + index), (255, 255, 255), 3)
+        cv2.line(image, (100, 500), (600, 480), (255, 255, 255), 4)
+
+        for color in [(0, 0, 220), (220, 0, 0)]:
+            for x, y in rng.integers([40, 300], [680, 1100], (5, 2)):
+                cv2.rectangle(image, (int(x) - 12, int(y) - 30), (int(x) + 12, int(y) + 10), color, -1)
+        # the kicker at the kick start location
+        x, y = config.kick_start_loc
+        cv2.rectangle(image, (x - 12, y - 30), (x + 12, y + 10), (0, 0, 220), -1)
+
+        for color, loc in [((0, 0, 220), config.my_uniform_loc), ((220, 0, 0), config.opponent_uniform_loc)]:
+            image_processing.crop(image, loc)[uniform_mask > 0] = color
+
+        # noise like compression artifacts
+        image = cv2.add(image, rng.integers(0, 4, image.shape, np.uint8))
+        images.append(image)
+
+    return images
+
+
+class OfflineAdb():
+    '''
+    Device of the Action, which is never used by the vision primitives
+    '''
+    serial = 'benchmark'
+    stats = None
+
+
+class Context():
+    '''
+    Frames and the Action shared by the benchmarks. Each call of a benchmark takes the next frame,
+    and a new Frame is created for it so that the views are computed in the measured time.
+    '''
+    def __init__(self, images: list):
+        self.images = images
+        self.action = Action(adb=OfflineAdb())
+
+    def cycle(self, items: list = None):
+        return itertools.cycle(self.images if items is None else items)
+
+    def frame(self, image: np.ndarray):
+        return Frame(image, buffers=self.action.buffers)
+
+
+@case
+def diff_image(context: Context):
+    pairs = context.cycle(list(zip(context.images, context.images[1:] + context.images[:1])))
+    buffers = context.action.buffers
+
+    def run():
+        image1, image2 = next(pairs)
+        image_processing.diff_image(image1, image2, buffers=buffers)
+
+    return run
+
+
+@case
+def find_template(context: Context):
+    # searching the whole screen, as in open_rewards
+    template = cv2.imread('templates/found.png')
+    images = context.cycle()
+
+    return lambda: image_processing.find_template(next(images), template)
+
+
+@case
+def hsv2eh(context: Context):
+    images = context.cycle([cv2.cvtColor(image, cv2.COLOR_BGR2HSV) for image in context.images])
+    dst = np.empty(config.screen_size, np.uint8)
+    buffers = context.action.buffers
+
+    return lambda: image_processing.hsv2eh(next(images), dst, buffers)
+
+
+@case
+def get_point_line_distance(context: Context):
+    points = context.cycle(np.random.default_rng(0).integers(0, 720, (100, 3, 2)).tolist())
+
+    def run():
+        point0, point1, point2 = next(points)
+        image_processing.get_point_line_distance(point0, point1, point2)
+
+    return run
+
+
+@case
+def get_player_map(context: Context):
+    images = context.cycle()
+
+    return lambda: context.action.get_player_map(context.frame(next(images)))
+
+
+@case
+def estimate_uniform_colors(context: Context):
+    images = context.cycle([cv2.cvtColor(image, cv2.COLOR_BGR2HSV) for image in context.images])
+
+    return lambda: context.action.estimate_uniform_colors(next(images), config.my_uniform_loc)
+
+
+@case
+def get_player_locations(context: Context):
+    items = []
+    for image in context.images:
+        frame = context.frame(image)
+        items.append((frame.eh.copy(), context.action.estimate_uniform_colors(frame, config.my_uniform_loc)))
+    items = context.cycle(items)
+    dst = np.empty(config.screen_size, np.uint8)
+
+    def run():
+        image_eh, uniform_colors = next(items)
+        context.action.get_player_locations(image_eh, uniform_colors, dst)
+
+    return run
+
+
+@case
+def shoot(context: Context):
+    # the shoot stage of the kick decision: goal post detection and the shot
+    images = context.cycle()
+
+    def run():
+        frame = context.frame(next(images))
+        goal_post = context.action.find_goal_post(frame)
+        if goal_post is not None:
+            context.action.shoot(frame, goal_post)
+
+    return run
+
+
+@case
+def kick_pass(context: Context):
+    items = context.cycle([
+        (image, tuple(item.copy() for item in context.action.get_player_map(context.frame(image))))
+        for image in context.images])
+
+    def run():
+        image, player_map = next(items)
+        context.action.kick_pass(image, player_map)
+
+    return run
+
+
+@case
+def kick_pass_field(context: Context):
+    # kick_pass by the clearance field, including the through balls
+    action = Action(adb=OfflineAdb(), pass_planner='field')
+    items = context.cycle([
+        (image, tuple(item.copy() for item in action.get_player_map(context.frame(image))))
+        for image in context.images])
+
+    def run():
+        image, player_map = next(items)
+        action.kick_pass(image, player_map)
+
+    return run
+
+
+def measure(function, rounds: int, min_round_time: float, period: int = 1):
+    '''
+    Time per call in seconds for each round. The number of calls per round is
+    calibrated so that a round takes at least min_round_time, and is a multiple of
+    the period so that every round runs on the same frames.
+    '''
+    function()
+
+    number = period
+    while True:
+        start_time = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed_time = time.perf_counter() - start_time
+        if elapsed_time >= min_round_time:
+            break
+        number *= 2 if elapsed_time == 0 else max(2, int(min_round_time / elapsed_time * 1.2))
+        number = -(-number // period) * period
+
+    times = [elapsed_time / number]
+    for _ in range(rounds - 1):
+        start_time = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start_time) / number)
+
+    return times, number
+
+
+def get_metadata(args, frame_count: int):
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'threads': cv2.getNumThreads(),
+        'frames': args.frames or 'synthetic',
+        'frame_count': frame_count,
+    }
+
+
+def format_time(seconds: float):
+    if seconds < 1e-3:
+        return f'{seconds * 1e6:8.1f} us'
+    return f'{seconds * 1e3:8.2f} ms'
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    '''
+    Print the change from the baseline. The fastest round is compared, since the
+    other processes only make a round slower.
+
+    Returns:
+        list: names of the benchmarks slower than the baseline by more than the threshold
+    '''
+    regressions = []
+    print(f'{"benchmark":25s} {"min":>11s} {"baseline":>11s} {"change":>8s}')
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f'{name:25s} {format_time(result["min"])} {"":>11s} {"new":>8s}')
+            continue
+
+        change = result['min'] / base['min'] - 1
+        status = ''
+        if change > threshold:
+            status = 'REGRESSION'
+            regressions.append(name)
+        print(f'{name:25s} {format_time(result["min"])} {format_time(base["min"])} {change * 100:+7.1f}% {status}')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the vision primitives of the kick decision')
+    parser.add_argument('--frames', help='Glob pattern of recorded match frames (default: synthetic frames)')
+    parser.add_argument('--filter', help='Comma separated names of the benchmarks to run (default: all)')
+    parser.add_argument('--rounds', default=7, type=int, help='Number of measured rounds per benchmark (default: 7)')
+    parser.add_argument('--min-round-time', default=0.1, type=float, help='Minimum seconds of a round (default: 0.1)')
+    parser.add_argument('--threads', default=1, type=int, help='OpenCV threads, 1 for stable numbers (default: 1)')
+    parser.add_argument('--output', help='Write the results in JSON')
+    parser.add_argument('--baseline', help='Compare with the results in JSON, and fail on a regression')
+    parser.add_argument('--threshold', default=0.15, type=float, help='Slowdown of the fastest round regarded as a regression (default: 0.15)')
+    parser.add_argument('--log', default='critical', help='Log level (CRITICAL, ERROR, WARNING, INFO, and DEBUG)')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s', level=getattr(logging, args.log.upper()))
+    cv2.setNumThreads(args.threads)
+
+    if args.frames:
+        images = [cv2.imread(path) for path in sorted(glob.glob(args.frames))]
+        if len(images) == 0:
+            print(f'There is no frame in {args.frames}')
+            sys.exit(1)
+    else:
+        images = create_frames()
+
+    names = args.filter.split(',') if args.filter else list(cases)
+    for name in names:
+        if name not in cases:
+            print(f'Unknown benchmark {name}. Available: {", ".join(cases)}')
+            sys.exit(1)
+
+    context = Context(images)
+    results = {}
+    for name in names:
+        times, number = measure(cases[name](context), args.rounds, args.min_round_time, len(images))
+        results[name] = {
+            'median': float(np.median(times)),
+            'min': float(np.min(times)),
+            'max': float(np.max(times)),
+            'rounds': len(times),
+            'calls_per_round': number,
+        }
+        print(f'{name:25s} {format_time(results[name]["median"])} (min {format_time(results[name]["min"]).strip()}, '
+              f'{len(times)} x {number} calls)')
+
+    report = {'metadata': get_metadata(args, len(images)), 'results': results}
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        print(f'\nBaseline: {args.baseline} ({baseline["metadata"]["time"]}, {baseline["metadata"]["processor"]})')
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'Regressions over {args.threshold * 100:.0f}%: {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
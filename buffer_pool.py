@@ -0,0 +1,26 @@
+import threading
+
+import numpy as np
+
+
+class BufferPool():
+    '''
+    Reusable arrays for the images computed on every frame.
+    A buffer is identified by name, shape, and dtype, and each thread has its own
+    buffers so that the parallel vision stages don't overwrite each other.
+    The content of a buffer is valid until the same buffer is requested again.
+    '''
+    def __init__(self):
+        self.local = threading.local()
+
+    def get(self, name: str, shape: tuple, dtype=np.uint8):
+        if not hasattr(self.local, 'buffers'):
+            self.local.buffers = {}
+
+        key = (name, tuple(shape), np.dtype(dtype))
+        buffer = self.local.buffers.get(key)
+        if buffer is None:
+            buffer = np.empty(shape, dtype)
+            self.local.buffers[key] = buffer
+
+        return buffer
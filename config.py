@@ -89,4 +89,154 @@ kick_backward_start_locs = [
 
 header_start_loc = [360, 790]
 
-dashboard_height = 200
\ No newline at end of file
+dashboard_height = 200
+
+# number of bot instances running on this host
+bot_instances = 1
+
+# number of threads for the parallel vision stages (0: cores available per instance)
+vision_threads = 0
+
+# minimum seconds between captures in the shootout
+shootout_poll_interval = 0.3
+# seconds to give up waiting for the end of the shootout
+shootout_timeout = 300
+
+# minimum and maximum seconds between polls, and CPU budget in cores of the polling phases.
+# Polls are at the minimum interval while the screen changes, and back off to the maximum on a static screen
+governor_phases = {
+    'matchmaking': [0.5, 2, 0.1],
+    'game_end': [0.5, 2, 0.1],
+    'shootout': [shootout_poll_interval, 0.6, 0.5],
+    'default': [0.5, 2, 0.1],
+}
+# growth of the poll interval per unchanged poll
+governor_backoff = 1.5
+# downscale factor of the thumbnails compared between polls
+governor_thumbnail_scale = 1 / 16
+# mean absolute difference of the thumbnails regarded as a change
+governor_change_threshold = 2
+
+# seconds from the capture until the kick decision should be made
+decision_budget = 0.4
+# decay of the expected cost of a decision stage whenever it's skipped for the deadline
+stage_cost_decay = 0.8
+# maximum growth of the expected cost of a decision stage by a sample
+stage_cost_max_growth = 2
+
+# downscale factor of the pitch for the camera motion estimation
+motion_scale = 0.25
+# minimum phase correlation response to trust the estimated motion
+motion_min_response = 0.1
+
+# frames between full player detections while tracking
+tracker_detection_interval = 10
+# maximum distance to associate a detected player with a track
+tracker_gate = 60
+# half size of the window to search a tracked player
+tracker_window = 40
+# minimum number of uniform color pixels to find a tracked player in the window
+tracker_min_pixels = 30
+# frames to keep a track which is not found
+tracker_max_misses = 3
+
+# seconds to reuse the last capture if no input is sent after it
+capture_freshness = 1.0
+
+# seconds to give up finding an opponent
+matchmaking_timeout = 90
+
+# size of smbot.log to rotate, and number of the rotated files to keep
+log_max_bytes = 10 * 1024 * 1024
+log_backup_count = 5
+# seconds to log the same INFO/DEBUG message of a line once (0: no rate limit)
+log_rate_interval = 1.0
+
+# seconds between the watchdog checks of the app process and the foreground activity
+watchdog_interval = 2
+# seconds without a screen change to regard the app as hung while the screen is expected to move
+watchdog_frozen_time = 30
+
+# minimum frame diff score to analyze the frame (lower: captured while the camera is moving)
+frame_diff_threshold = 0.5
+
+# minimum accumulator votes of the goal post line
+goal_post_hough_threshold = 150
+# minimum goal post length to shoot
+goal_post_min_length = 150
+# minimum goal post length to shoot from the front of the goal post
+goal_post_min_front_length = 170
+
+# maximum distance from the kick start location to the kicker of forward, backward1, backward2, and header kicks
+kick_distance_threshold = [80, 40, 40, 60]
+
+# downscale factor of the opponent clearance field of the field pass planner
+pass_field_scale = 0.125
+# spacing in pixels of the open spots for through balls in the kick masks
+pass_grid_step = 40
+# number of clearance samples along a pass lane
+pass_lane_samples = 32
+# distance from the kick start location where the lane clearance is ignored, since the kicker is usually marked
+pass_kicker_margin = 40
+# lane clearance in pixels regarded as safe, so that safer lanes don't win over passes to the feet
+pass_safe_clearance = 80
+# minimum lane clearance in pixels to pass
+pass_min_clearance = 16
+# weight of the lane clearance of a through ball to an open spot
+pass_through_weight = 0.8
+
+# minimum ratio of the uniform pixels for a EH value to be a uniform color
+uniform_color_ratio = 0.2
+# EH margin of a uniform color, which is a hue (< 180) or a non-color value (>= 180)
+uniform_hue_margin = 2
+uniform_non_color_margin = 15
+
+# downscale factor of the playground segmentation (1: full resolution)
+playground_scale = 1
+# maximum mean difference of the playground color mask to reuse the last segmentation (0: no cache)
+playground_cache_tolerance = 0
+
+# maximum growth between the first and the last samples of a soak test: RSS in MB, file descriptors, sockets, threads,
+# and the ratio of CPU time per cycle
+soak_max_rss_growth = 20
+soak_max_fd_growth = 2
+soak_max_socket_growth = 1
+soak_max_thread_growth = 1
+soak_max_cpu_growth = 0.2
+# minimum samples in the first and the last quarter of a soak test, which are compared by their medians
+soak_min_window_samples = 8
+
+# ONNX model of the CNN player detector, which is trained by train_detector.py
+detector_model = 'models/player_detector.onnx'
+# downscale factor of the frame fed to the CNN player detector
+detector_scale = 0.25
+# minimum probability of a player pixel
+detector_threshold = 0.5
+
+# screen capture method: 'png' (screencap -p) or 'raw' (uncompressed RGBA, no encoding on the device)
+capture_backend = 'png'
+# input method: 'exec' (an ADB shell command per input, returns when the input is injected) or
+# 'shell' (written to a persistent shell, returns immediately)
+input_backend = 'exec'
+# seconds the input queue waits for more commands to send them in one shell invocation
+input_coalesce_time = 0.05
+# seconds after the ack of a tap while the same tap is dropped unless the screen is captured after it
+input_transition_time = 1
+# maximum distance in pixels between the same taps
+input_tap_radius = 5
+# number of input commands kept with their send and ack times
+input_history_size = 100
+
+# frame codec of the session recordings: 'zlib' (difference from the previous frame, compressed) or 'raw'
+recording_codec = 'zlib'
+# frames between the keyframes of a zlib recording, which bounds the frames decoded for a random access
+recording_key_interval = 30
+# frames waiting to be written to a recording, beyond which new frames are dropped
+recording_queue_size = 8
+
+# number of vision worker processes deciding the kicks (0: in the bot process)
+vision_workers = 0
+# frame slots in the shared memory of the vision workers, i.e. frames analyzed at once
+vision_slots = 4
+# seconds a vision worker may take on a frame before it's regarded as hung and restarted
+vision_hang_timeout = 5
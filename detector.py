@@ -0,0 +1,99 @@
+import os
+import logging
+import threading
+
+import cv2
+import numpy as np
+
+import config
+
+
+# output channels of the CNN, in the order of the player map
+classes = ['my', 'op']
+
+
+class ColorDetector():
+    '''
+    Players found by the uniform colors on the playground mask (Action.get_color_player_map)
+    '''
+    name = 'color'
+
+    def __init__(self, action):
+        self.action = action
+
+    def detect(self, frame):
+        return self.action.get_color_player_map(frame)
+
+
+class CnnDetector():
+    '''
+    Players found by a small fully convolutional network run by cv2.dnn on CPU.
+    The network takes the frame downscaled by config.detector_scale (RGB, 0..1) and outputs
+    a probability map per class at the same resolution. Both teams come out of one forward pass,
+    and several frames can be batched in one blob. The model is trained by train_detector.py.
+    '''
+    name = 'cnn'
+
+    def __init__(self, model_path: str = None, scale: float = None, threshold: float = None):
+        self.model_path = model_path or config.detector_model
+        self.scale = scale or config.detector_scale
+        self.threshold = threshold or config.detector_threshold
+
+        if not os.path.exists(self.model_path):
+            raise Exception(f'Player detector model {self.model_path} is not found. Train it with train_detector.py')
+
+        self.net = cv2.dnn.readNet(self.model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        # the network keeps its state between setInput and forward
+        self.lock = threading.Lock()
+
+        logging.info(f'Loaded player detector {self.model_path} (scale {self.scale})')
+
+    def forward(self, frames: list):
+        '''
+        Probability maps of the frames in one forward pass
+
+        Returns:
+            np.ndarray: N x classes x height x width
+        '''
+        images = [frame.downscaled(self.scale) for frame in frames]
+        blob = cv2.dnn.blobFromImages(images, 1 / 255, swapRB=True)
+
+        with self.lock:
+            self.net.setInput(blob)
+            return self.net.forward()
+
+    def decode(self, heatmaps: np.ndarray):
+        '''
+        Player map from the probability maps of a frame, in the full resolution coordinates
+        '''
+        player_map = []
+        for heatmap in heatmaps[:len(classes)]:
+            mask = np.uint8(heatmap > self.threshold)
+            _, _, stats, centroids = cv2.connectedComponentsWithStats(mask)
+
+            # the first element is the background
+            stats = stats[1:].copy()
+            stats[:, 0:4] = np.round(stats[:, 0:4] / self.scale)
+            stats[:, 4] = np.round(stats[:, 4] / self.scale ** 2)
+            centroids = (centroids[1:] + 0.5) / self.scale - 0.5
+            player_map += [stats, centroids]
+
+        return tuple(player_map)
+
+    def detect(self, frame):
+        return self.decode(self.forward([frame])[0])
+
+    def detect_batch(self, frames: list):
+        return [self.decode(heatmaps) for heatmaps in self.forward(frames)]
+
+
+def create(name: str, action):
+    if name == 'color':
+        return ColorDetector(action)
+
+    if name == 'cnn':
+        return CnnDetector()
+
+    raise Exception(f'Unknown player detector {name}')
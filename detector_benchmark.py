@@ -0,0 +1,127 @@
+import os
+import glob
+import time
+import logging
+import argparse
+
+import cv2
+import numpy as np
+
+from action import Action
+from replay import ReplayAdb
+from frame import Frame
+from detector_dataset import load_labels, get_boxes
+import detector
+import image_processing
+
+
+def get_centers(boxes: list):
+    return [[x + w / 2, y + h / 2] for x, y, w, h in boxes]
+
+
+def match_points(found: list, expected: list, tolerance: float):
+    '''
+    Number of expected points matched to a found point within the tolerance, each point matched once
+    '''
+    pairs = sorted(
+        (image_processing.get_distance(f, e), found_index, expected_index)
+        for found_index, f in enumerate(found)
+        for expected_index, e in enumerate(expected))
+
+    found_used = set()
+    expected_used = set()
+    for distance, found_index, expected_index in pairs:
+        if distance > tolerance:
+            break
+        if found_index in found_used or expected_index in expected_used:
+            continue
+        found_used.add(found_index)
+        expected_used.add(expected_index)
+
+    return len(expected_used)
+
+
+class Result():
+    def __init__(self, name: str):
+        self.name = name
+        self.times = []
+        self.matched = 0
+        self.expected = 0
+        self.found = 0
+
+    def add(self, elapsed_time: float, boxes: list, expected_boxes: list, tolerance: float):
+        self.times.append(elapsed_time)
+        for class_boxes, expected_class_boxes in zip(boxes, expected_boxes):
+            self.matched += match_points(get_centers(class_boxes), get_centers(expected_class_boxes), tolerance)
+            self.expected += len(expected_class_boxes)
+            self.found += len(class_boxes)
+
+    def print(self):
+        recall = self.matched / max(self.expected, 1)
+        precision = self.matched / max(self.found, 1)
+        print(f'{self.name:12s} {np.median(self.times) * 1000:8.2f} ms {np.percentile(self.times, 95) * 1000:8.2f} ms '
+              f'{recall * 100:7.1f}% {precision * 100:9.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the latency and recall of the CNN player detector with the color pipeline')
+    parser.add_argument('image_dir', help='Glob pattern of recorded match frames, e.g. "debug/20201120103000/frame_*.png"')
+    parser.add_argument('--labels', help='Hand-labeled boxes in JSON lines (default: the color pipeline result is the reference)')
+    parser.add_argument('--model', help='ONNX model of the CNN (default: config.detector_model)')
+    parser.add_argument('--tolerance', default=20, type=float, help='Maximum distance in pixels between a found and an expected player (default: 20)')
+    parser.add_argument('--batch', default=8, type=int, help='Batch size of the batched CNN throughput (default: 8)')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s', level=logging.WARNING)
+
+    paths = sorted(glob.glob(args.image_dir))
+    if len(paths) == 0:
+        print(f'There is no frame in {args.image_dir}')
+        return
+
+    labels = load_labels(args.labels) if args.labels else {}
+    if args.labels:
+        paths = [path for path in paths if os.path.abspath(path) in labels]
+
+    action = Action(adb=ReplayAdb(paths[0]))
+    cnn = detector.CnnDetector(args.model)
+
+    color_result = Result('color')
+    cnn_result = Result('cnn')
+    images = []
+    for path in paths:
+        image = cv2.imread(path)
+        images.append(image)
+
+        # a new Frame for each detector, so that the views are computed in the measured time
+        start_time = time.perf_counter()
+        color_boxes = get_boxes(action.get_color_player_map(Frame(image)))
+        color_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        cnn_boxes = get_boxes(cnn.detect(Frame(image)))
+        cnn_time = time.perf_counter() - start_time
+
+        expected_boxes = labels.get(os.path.abspath(path), color_boxes)
+        color_result.add(color_time, color_boxes, expected_boxes, args.tolerance)
+        cnn_result.add(cnn_time, cnn_boxes, expected_boxes, args.tolerance)
+
+    print(f'Frames: {len(paths)}, reference: {args.labels or "color pipeline"}, model: {cnn.model_path}, scale: {cnn.scale}')
+    print(f'{"detector":12s} {"p50":>11s} {"p95":>11s} {"recall":>8s} {"precision":>10s}')
+    if args.labels:
+        color_result.print()
+    cnn_result.print()
+
+    batch_times = []
+    for start in range(0, len(images) - args.batch + 1, args.batch):
+        frames = [Frame(image) for image in images[start:start + args.batch]]
+        start_time = time.perf_counter()
+        cnn.detect_batch(frames)
+        batch_times.append((time.perf_counter() - start_time) / args.batch)
+
+    if batch_times:
+        print(f'CNN batched by {args.batch}: {np.median(batch_times) * 1000:.2f} ms/frame')
+
+
+if __name__ == '__main__':
+    main()
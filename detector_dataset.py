@@ -0,0 +1,109 @@
+import os
+import glob
+import json
+import logging
+import argparse
+
+import cv2
+import numpy as np
+
+from action import Action
+from replay import ReplayAdb
+from frame import Frame
+import config
+import detector
+
+
+def load_labels(path: str):
+    '''
+    Hand-labeled player boxes in JSON lines, e.g.
+    {"image": "frame_010.png", "my": [[120, 300, 20, 40]], "op": [[400, 520, 18, 42]]}
+
+    image is relative to the label file, and the boxes are x, y, width, height in the full resolution.
+
+    Returns:
+        dict: absolute image path to the boxes of each class
+    '''
+    base_dir = os.path.dirname(path)
+
+    labels = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+
+            label = json.loads(line)
+            labels[os.path.abspath(os.path.join(base_dir, label['image']))] = [label.get(c, []) for c in detector.classes]
+
+    return labels
+
+
+def get_boxes(player_map: tuple):
+    '''
+    Boxes of each class from a player map
+    '''
+    return [player_map[index * 2][:, 0:4].tolist() for index in range(len(detector.classes))]
+
+
+def get_target(boxes: list, shape: tuple, scale: float):
+    '''
+    Mask per class at the input resolution of the CNN, where the player boxes are filled
+    '''
+    height, width = round(shape[0] * scale), round(shape[1] * scale)
+    target = np.zeros((len(detector.classes), height, width), np.uint8)
+    for mask, class_boxes in zip(target, boxes):
+        for x, y, w, h in class_boxes:
+            cv2.rectangle(
+                mask,
+                (int(x * scale), int(y * scale)),
+                (int(np.ceil((x + w) * scale)) - 1, int(np.ceil((y + h) * scale)) - 1),
+                1, -1)
+
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export recorded frames and their player masks to train the CNN player detector')
+    parser.add_argument('image_dir', nargs='+', help='Glob patterns of recorded match frames, e.g. "debug/20201120103000/frame_*.png"')
+    parser.add_argument('--output', default='dataset', help='Output directory (default: dataset)')
+    parser.add_argument('--labels', help='Hand-labeled boxes in JSON lines, which replace the color pipeline result of the frames')
+    parser.add_argument('--min-players', default=1, type=int, help='Skip frames with fewer players found by the color pipeline (default: 1)')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s', level=logging.WARNING)
+
+    paths = sorted(path for pattern in args.image_dir for path in glob.glob(pattern))
+    if len(paths) == 0:
+        print(f'There is no frame in {" ".join(args.image_dir)}')
+        return
+
+    labels = load_labels(args.labels) if args.labels else {}
+    action = Action(adb=ReplayAdb(paths[0]))
+    os.makedirs(args.output, exist_ok=True)
+
+    exported = 0
+    labeled = 0
+    for path in paths:
+        frame = Frame(cv2.imread(path))
+
+        boxes = labels.get(os.path.abspath(path))
+        if boxes is not None:
+            labeled += 1
+        else:
+            boxes = get_boxes(action.get_color_player_map(frame))
+            if sum(map(len, boxes)) < args.min_players:
+                continue
+
+        name = os.path.splitext(os.path.basename(path))[0]
+        output_path = os.path.join(args.output, f'{exported:06d}_{name}.npz')
+        np.savez_compressed(
+            output_path,
+            image=frame.downscaled(config.detector_scale),
+            target=get_target(boxes, frame.shape, config.detector_scale))
+        exported += 1
+
+    print(f'Exported {exported}/{len(paths)} frames ({labeled} hand-labeled) to {args.output} at scale {config.detector_scale}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import time
+import threading
+
+import cv2
+import numpy as np
+
+import config
+import image_processing
+
+
+class Frame():
+    '''
+    Captured image with its capture time and the derived images computed on demand.
+    Each view (gray, HSV, EH, downscaled) is computed at most once per frame, and a ROI is
+    a Frame of the zero-copy crop whose views are cropped from the views of the whole frame
+    if they are already computed.
+    With a buffer pool, the views are valid until the same views are computed for the next frame.
+    '''
+    def __init__(self, image: np.ndarray, timestamp: float = None, buffers=None):
+        self.image = image
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.buffers = buffers
+
+        self.views = {}
+        self.locks = {}
+        self.rois = {}
+        # parent frame and the location of the ROI
+        self.parent = None
+        self.loc = None
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def get_view(self, name: str, compute):
+        view = self.views.get(name)
+        if view is not None:
+            return view
+
+        # the parallel vision stages may request the same view at once
+        with self.locks.setdefault(name, threading.Lock()):
+            view = self.views.get(name)
+            if view is None:
+                if self.parent is not None and name in self.parent.views:
+                    view = image_processing.crop(self.parent.views[name], self.loc)
+                else:
+                    view = compute()
+                self.views[name] = view
+
+        return view
+
+    @property
+    def gray(self):
+        return self.get_view('gray', lambda: cv2.cvtColor(
+            self.image, cv2.COLOR_BGR2GRAY,
+            dst=image_processing.get_buffer(self.buffers, 'gray', self.shape[0:2])))
+
+    @property
+    def hsv(self):
+        return self.get_view('hsv', lambda: cv2.cvtColor(
+            self.image, cv2.COLOR_BGR2HSV,
+            dst=image_processing.get_buffer(self.buffers, 'hsv', self.shape)))
+
+    @property
+    def eh(self):
+        return self.get_view('eh', lambda: image_processing.hsv2eh(
+            self.hsv, image_processing.get_buffer(self.buffers, 'eh', self.shape[0:2]), self.buffers))
+
+    def downscaled(self, scale: float):
+        '''
+        Color image resized by scale
+        '''
+        return self.get_view(f'downscaled_{scale}', lambda: cv2.resize(
+            self.image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA))
+
+    def roi(self, loc):
+        '''
+        Frame of the region, which is a bounding box or the name of a location in config, e.g. 'my_uniform_loc'
+        '''
+        if isinstance(loc, str):
+            loc = getattr(config, loc)
+
+        key = tuple(loc)
+        roi = self.rois.get(key)
+        if roi is None:
+            # ROIs of the same size would share the buffers, so their views are not pooled
+            roi = Frame(image_processing.crop(self.image, loc), self.timestamp)
+            roi.parent = self
+            roi.loc = loc
+            roi = self.rois.setdefault(key, roi)
+
+        return roi
+
+
+def to_frame(image, timestamp: float = None, buffers=None):
+    '''
+    Frame of the image, or the image itself if it's already a Frame
+    '''
+    if isinstance(image, Frame):
+        return image
+
+    return Frame(image, timestamp, buffers)
@@ -0,0 +1,117 @@
+import os
+import time
+import logging
+
+import cv2
+import numpy as np
+
+import config
+import metrics
+
+
+class Governor():
+    '''
+    CPU budget of the bot phases, which are the screen states such as matchmaking and post_match.
+    The CPU and wall time of the process are accounted to the current phase, and the polling loops of
+    the waiting phases call wait between captures. The poll interval is the minimum of the phase while
+    the screen changes, backs off to the maximum on a static screen, and is stretched so that the CPU
+    time of a poll spread over the interval stays within the budget of the phase.
+    '''
+    def __init__(self, device: str = '', stats=None):
+        self.device = device
+        self.stats = stats
+        self.phase = None
+        self.phase_start = (time.time(), time.process_time())
+        # phase -> CPU and wall seconds
+        self.usage = {}
+
+        self.interval = None
+        self.thumbnail = None
+        # wall and CPU time at the end of the last wait
+        self.poll_time = None
+
+    def enter(self, phase: str):
+        if phase == self.phase:
+            return
+
+        now = (time.time(), time.process_time())
+        if self.phase is not None:
+            self.account(now)
+
+        self.phase = phase
+        self.phase_start = now
+        self.interval = None
+        self.thumbnail = None
+        self.poll_time = None
+
+    def account(self, now: tuple):
+        wall = now[0] - self.phase_start[0]
+        cpu = now[1] - self.phase_start[1]
+
+        usage = self.usage.setdefault(self.phase, [0, 0])
+        usage[0] += cpu
+        usage[1] += wall
+
+        metrics.cpu_seconds.inc((self.device, self.phase), cpu)
+        metrics.cpu_cores.set((self.device, self.phase), cpu / max(wall, 1e-3))
+        if self.stats:
+            self.stats.record_cpu(self.phase, self.phase_start[0], now[0], cpu)
+
+    def is_changed(self, image: np.ndarray):
+        '''
+        Whether the image is different from the one of the last poll, on thumbnails so that it costs little
+        '''
+        thumbnail = cv2.resize(
+            image, None, fx=config.governor_thumbnail_scale, fy=config.governor_thumbnail_scale,
+            interpolation=cv2.INTER_AREA)
+        changed = self.thumbnail is None or self.thumbnail.shape != thumbnail.shape or \
+            cv2.norm(thumbnail, self.thumbnail, cv2.NORM_L1) / thumbnail.size > config.governor_change_threshold
+        self.thumbnail = thumbnail
+
+        return changed
+
+    def wait(self, image: np.ndarray = None):
+        '''
+        Sleep until the next poll of the current phase, where image is the capture of the last poll
+        '''
+        min_interval, max_interval, budget = config.governor_phases.get(self.phase, config.governor_phases['default'])
+
+        changed = image is not None and self.is_changed(image)
+        if self.interval is None or changed:
+            self.interval = min_interval
+        else:
+            self.interval = min(self.interval * config.governor_backoff, max_interval)
+
+        delay = self.interval
+        if self.poll_time:
+            wall = time.time() - self.poll_time[0]
+            cpu = time.process_time() - self.poll_time[1]
+            delay = max(0, max(self.interval, cpu / budget) - wall)
+
+        logging.debug('%s: next poll in %.2f s (changed: %s)', self.phase, delay, changed)
+        time.sleep(delay)
+        self.poll_time = (time.time(), time.process_time())
+
+    def get_usage(self):
+        '''
+        CPU cores used in each phase, including the current one so far
+
+        Returns:
+            dict: phase -> CPU seconds, wall seconds, and cores
+        '''
+        usage = {phase: list(item) for phase, item in self.usage.items()}
+        if self.phase is not None:
+            item = usage.setdefault(self.phase, [0, 0])
+            item[0] += time.process_time() - self.phase_start[1]
+            item[1] += time.time() - self.phase_start[0]
+
+        return {phase: (cpu, wall, cpu / max(wall, 1e-3)) for phase, (cpu, wall) in usage.items()}
+
+    def format_usage(self):
+        usage = self.get_usage()
+        cpu = sum(item[0] for item in usage.values())
+        wall = sum(item[1] for item in usage.values())
+        phases = ', '.join(f'{phase} {cores * 100:.1f}%' for phase, (_, _, cores) in sorted(
+            usage.items(), key=lambda item: -item[1][0]))
+
+        return f'{cpu / max(wall, 1e-3) * 100:.1f}% of a core ({os.cpu_count()} on the host): {phases}'
@@ -2,29 +2,70 @@ import numpy as np
 import cv2
 import math as m
 
-def diff_image(image1: np.ndarray, image2: np.ndarray, mask: np.ndarray = None, color: bool = True, diff_threshold: int = 0):
-    if not color:
-        image1 = cv2.cvtColor(image1, cv2.COLOR_BGR2GRAY)
-        image2 = cv2.cvtColor(image2, cv2.COLOR_BGR2GRAY)
+import frame
+
+def get_buffer(buffers, name: str, shape: tuple, dtype=np.uint8):
+    '''
+    Buffer from the pool, or None to let OpenCV allocate the output
+    '''
+    return buffers.get(name, shape, dtype) if buffers else None
+
+def get_view(image, view: str = 'image'):
+    '''
+    View of a Frame such as 'gray', or the image itself if it's an array
+    '''
+    return getattr(image, view) if isinstance(image, frame.Frame) else image
+
+def get_gray(image, dst: np.ndarray = None):
+    '''
+    Gray view of a Frame, or gray image converted from a color image
+    '''
+    if isinstance(image, frame.Frame):
+        return image.gray
+
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=dst)
+
+def diff_image(
+        image1: np.ndarray,
+        image2: np.ndarray,
+        mask: np.ndarray = None,
+        color: bool = True,
+        diff_threshold: int = 0,
+        buffers=None):
+    '''
+    Ratio of the same pixels of two images (or Frames), which are gray if color is False
+    '''
+    if color:
+        image1 = get_view(image1)
+        image2 = get_view(image2)
+    else:
+        image1 = get_gray(image1, get_buffer(buffers, 'diff_gray1', image1.shape[0:2]))
+        image2 = get_gray(image2, get_buffer(buffers, 'diff_gray2', image2.shape[0:2]))
 
     if mask is not None:
-        mask = cv2.cvtColor(mask, cv2.COLOR_BGR2GRAY)
+        mask = get_gray(mask)
         diff = np.abs(image1[mask > 0] - image2[mask > 0])
-    else:
-        diff = np.abs(image1 - image2)
 
-    diff[diff < diff_threshold] = 0
+        diff[diff < diff_threshold] = 0
 
-    counter = dict(zip(*np.unique(diff, return_counts=True)))
+        counter = dict(zip(*np.unique(diff, return_counts=True)))
 
-    if 0 in counter:
-        return counter[0] / np.prod(diff.shape)
-    else:
-        return 0
+        if 0 in counter:
+            return counter[0] / np.prod(diff.shape)
+        else:
+            return 0
+
+    # the difference wraps around as uint8 subtraction, and the ratio of the
+    # values less than diff_threshold (or zero) is counted without temporary arrays
+    diff = np.subtract(image1, image2, out=get_buffer(buffers, 'diff', image1.shape))
+    zero_threshold = max(m.ceil(diff_threshold), 1)
+    cv2.threshold(diff, zero_threshold - 1, 255, cv2.THRESH_BINARY, dst=diff)
+
+    return (diff.size - cv2.countNonZero(diff.reshape(diff.shape[0], -1))) / diff.size
 
 def find_template(image: np.ndarray, template: np.ndarray):
-    image_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+    image_gray = get_gray(image)
+    template_gray = get_gray(template)
     w, h = template_gray.shape[::-1]
 
     res = cv2.matchTemplate(image_gray, template_gray, cv2.TM_CCORR_NORMED, template_gray)
@@ -37,6 +78,12 @@ def find_template(image: np.ndarray, template: np.ndarray):
     return [max_loc[0], max_loc[1], w, h]
 
 def crop(image: np.ndarray, bounding_box: list):
+    '''
+    Zero-copy crop of the image, or the Frame of the region if the image is a Frame
+    '''
+    if isinstance(image, frame.Frame):
+        return image.roi(bounding_box)
+
     x = bounding_box[0]
     y = bounding_box[1]
     width = bounding_box[2]
@@ -44,19 +91,33 @@ def crop(image: np.ndarray, bounding_box: list):
 
     return image[y:y + height, x:x + width]
 
-def hsv2eh(image: np.ndarray):
+# EH value of each V for non-color pixels
+value_to_eh = np.array([int(v / 255 * (255 - 180)) + 180 for v in range(256)], np.uint8)
+
+def hsv2eh(image: np.ndarray, dst: np.ndarray = None, buffers=None):
     '''
     Convert HSV image into EH (Extended Hue) image, which non-colors are considered such as white, gray, and black
     EH plane value
     0-179: original H
     180-255: linear transformed value from V(0-255) if S < 20
+
+    The HSV image is not modified, and the EH image is written into dst if given.
+    The EH view is returned if the image is a Frame.
     '''
-    eh = image[:,:,0]
+    if isinstance(image, frame.Frame):
+        return image.eh
+
+    shape = image.shape[0:2]
+    value = get_buffer(buffers, 'hsv2eh_value', shape)
+    non_color = get_buffer(buffers, 'hsv2eh_non_color', shape)
 
-    for y, x in zip(*np.where(image[:, :, 1] < 20)):
-        eh[y, x] = int(image[y, x, 2] / 255 * (255 - 180)) + 180 
+    dst = cv2.extractChannel(image, 0, dst=dst)
+    value = cv2.extractChannel(image, 2, dst=value)
+    value = cv2.LUT(value, value_to_eh, dst=value)
+    non_color = cv2.extractChannel(image, 1, dst=non_color)
+    _, non_color = cv2.threshold(non_color, 19, 255, cv2.THRESH_BINARY_INV, dst=non_color)
 
-    return eh
+    return cv2.copyTo(value, non_color, dst=dst)
 
 def get_distance(vector1: [], vector2: []):
     sum = 0
@@ -0,0 +1,164 @@
+import time
+import logging
+import threading
+import collections
+
+import config
+import metrics
+
+
+class InputCommand():
+    '''
+    Tap or swipe with the time it's queued, sent to the device, and acknowledged by the device
+    '''
+    def __init__(self, kind: str, args: tuple):
+        self.kind = kind
+        self.args = args
+        self.queue_time = time.time()
+        self.send_time = None
+        self.ack_time = None
+        self.dropped = False
+
+    @property
+    def command(self):
+        return f'input {self.kind} ' + ' '.join(str(arg) for arg in self.args)
+
+    def __repr__(self):
+        return f'InputCommand({self.command})'
+
+
+class InputQueue():
+    '''
+    Input commands between Action and Adb with the same touch and swipe interface as Adb.
+    Commands queued within input_coalesce_time of each other are sent in one shell invocation,
+    which echoes an ack after each command, so that a burst of taps costs one ADB round trip and
+    the send and ack times of every command are known. A capture waits for the queued commands,
+    so that it shows their result as the blocking inputs did.
+    A tap at the location of the last tap is dropped while the screen is in transition by the last one,
+    i.e. it's not acknowledged or acknowledged less than input_transition_time ago, and the screen
+    isn't captured after it. A tap after a capture is always sent, since it's decided on the new screen.
+    '''
+    def __init__(self, adb):
+        self.adb = adb
+        self.adb.input_queue = self
+
+        self.condition = threading.Condition()
+        self.pending = []
+        self.sending = False
+        self.flushing = False
+        self.last_tap = None
+        # sent and dropped commands with their timestamps
+        self.history = collections.deque(maxlen=config.input_history_size)
+        self.command_count = 0
+        self.dropped_count = 0
+        self.round_trip_count = 0
+
+        self.thread = threading.Thread(target=self.run, name='Input', daemon=True)
+        self.thread.start()
+
+    def touch(self, x, y):
+        self.adb.check_watchdog()
+        command = InputCommand('tap', (x, y))
+
+        with self.condition:
+            if self.is_redundant(command):
+                command.dropped = True
+                self.dropped_count += 1
+                self.history.append(command)
+                metrics.input_commands.inc((self.adb.serial, 'dropped'))
+                logging.debug('Dropped tap %s during the transition of the last tap', command.args)
+                return
+
+            self.last_tap = command
+            self.put(command)
+
+    def swipe(self, start_x, start_y, end_x, end_y, duration):
+        self.adb.check_watchdog()
+        with self.condition:
+            self.last_tap = None
+            self.put(InputCommand('swipe', (start_x, start_y, end_x, end_y, duration)))
+
+    def is_redundant(self, command: InputCommand):
+        last = self.last_tap
+        if last is None:
+            return False
+
+        if abs(last.args[0] - command.args[0]) > config.input_tap_radius or \
+                abs(last.args[1] - command.args[1]) > config.input_tap_radius:
+            return False
+
+        if last.ack_time is not None and time.time() - last.ack_time > config.input_transition_time:
+            return False
+
+        # capture start time of the last capture
+        cache = self.adb.cache
+        return cache is None or cache[2] < last.queue_time
+
+    def put(self, command: InputCommand):
+        # a capture started from now on must be fresh
+        self.adb.input_time = command.queue_time
+        self.pending.append(command)
+        self.condition.notify_all()
+
+    def wait(self):
+        '''
+        Send the queued commands without waiting for more, and wait until they are acknowledged
+        '''
+        with self.condition:
+            if not self.pending and not self.sending:
+                return
+
+            self.flushing = True
+            self.condition.notify_all()
+            while self.pending or self.sending:
+                self.condition.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+
+                # more commands for the same invocation until the queue is quiet for input_coalesce_time
+                while not self.flushing:
+                    last_time = self.pending[-1].queue_time
+                    remaining = last_time + config.input_coalesce_time - time.time()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                commands = self.pending
+                self.pending = []
+                self.sending = True
+                self.flushing = False
+
+            try:
+                self.send(commands)
+            except Exception as e:
+                logging.error(f'Failed to send {len(commands)} input commands: {e}')
+            finally:
+                with self.condition:
+                    self.sending = False
+                    self.condition.notify_all()
+
+    def send(self, commands: list):
+        send_time = time.time()
+        for command in commands:
+            command.send_time = send_time
+        self.round_trip_count += 1
+
+        def on_ack(index: int):
+            command = commands[index]
+            command.ack_time = time.time()
+            metrics.input_seconds.observe(command.ack_time - command.send_time, (self.adb.serial,))
+
+        self.adb.send_inputs([command.command for command in commands], on_ack)
+
+        self.command_count += len(commands)
+        self.history.extend(commands)
+        metrics.input_commands.inc((self.adb.serial, 'sent'), len(commands))
+        logging.debug('Sent %d input commands in %.0f ms', len(commands), (time.time() - send_time) * 1000)
+
+    def get_summary(self):
+        return (f'{self.command_count} input commands in {self.round_trip_count} round trips, '
+                f'{self.dropped_count} dropped')
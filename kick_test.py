@@ -1,9 +1,9 @@
-import glob
 import logging
 
 import cv2
 
 from action import Action
+from recording import open_frames
 import config
 
 def main():
@@ -19,11 +19,10 @@ def main():
     action = Action(debug=True, save_mask=False)
     action.create_debug_dir()
 
-    for index, image in enumerate(sorted(glob.glob(image_dir))):
-        logging.info(f'Processing {index} {image}')
-        img_color = cv2.imread(image)
-        img_gray = cv2.cvtColor(img_color, cv2.COLOR_BGR2GRAY)
-        action.kick(img_gray, img_color)
+    # a glob pattern of PNGs or a recording file
+    for index, img_color in enumerate(open_frames(image_dir)):
+        logging.info(f'Processing {index}')
+        action.kick(img_color)
         action.frame_index += 1
 
         if show_image:
@@ -0,0 +1,136 @@
+import time
+import logging
+import argparse
+import itertools
+
+import numpy as np
+
+from adb import Adb
+import image_processing
+
+
+def parse_ints(value: str):
+    return [int(v) for v in value.split(',')]
+
+
+def get_roi(adb: Adb, roi: list):
+    '''
+    Gray ROI of a fresh capture, and the start and end time of the capture
+    '''
+    start_time = time.perf_counter()
+    image = adb.get_screen(color=False, fresh=True)
+    end_time = time.perf_counter()
+
+    return image_processing.crop(image, roi).astype(np.int16), start_time, end_time
+
+
+def is_changed(roi: np.ndarray, reference: np.ndarray, threshold: float):
+    return np.mean(np.abs(roi - reference)) > threshold
+
+
+def measure(adb: Adb, loc: list, roi: list, reference: np.ndarray, threshold: float, timeout: float):
+    '''
+    Tap loc and capture until the ROI changes from the reference captured before the tap.
+    The change is shown between the start of the last unchanged capture and the end of the first changed one.
+    The latency from the return of the input call decides the waits after a touch, and is negative if
+    the change is already shown when the call returns.
+
+    Returns:
+        (float, float, float, float): input call time, latencies from the start and the return of the input call
+        to the middle of the change window, and half the width of the window, or None if the ROI doesn't change
+        until timeout
+    '''
+    input_start_time = time.perf_counter()
+    adb.touch(*loc)
+    input_end_time = time.perf_counter()
+
+    # the reference is unchanged, but the change can't be shown before the input
+    last_start_time = input_start_time
+    while time.perf_counter() - input_start_time < timeout:
+        current, start_time, end_time = get_roi(adb, roi)
+        if is_changed(current, reference, threshold):
+            change_time = (last_start_time + end_time) / 2
+            return (input_end_time - input_start_time, change_time - input_start_time, change_time - input_end_time,
+                    (end_time - last_start_time) / 2)
+        last_start_time = start_time
+
+    return input_end_time - input_start_time, None, None, None
+
+
+def wait_for_revert(adb: Adb, roi: list, reference: np.ndarray, threshold: float, timeout: float):
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < timeout:
+        current, _, _ = get_roi(adb, roi)
+        if not is_changed(current, reference, threshold):
+            return True
+
+        time.sleep(0.1)
+
+    return False
+
+
+def format_distribution(values: list):
+    values = np.array(values) * 1000
+    return (f'p50 {np.percentile(values, 50):7.1f} ms, p95 {np.percentile(values, 95):7.1f} ms, '
+            f'min {values.min():7.1f} ms, max {values.max():7.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the latency from an input to the screen change per input and capture backend')
+    parser.add_argument('--loc', required=True, type=parse_ints, help='Location to tap, e.g. 360,700. A button with a visible press state')
+    parser.add_argument('--roi', type=parse_ints, help='Region expected to change, e.g. 300,650,120,100 (default: 100x100 around loc)')
+    parser.add_argument('--back-loc', type=parse_ints, help='Location to tap after each trial if the tap leaves the screen, e.g. 30,1200')
+    parser.add_argument('--repeat', default=20, type=int, help='Number of trials per backend combination (default: 20)')
+    parser.add_argument('--input-backends', default='exec,shell', help='Input backends to compare (default: exec,shell)')
+    parser.add_argument('--capture-backends', default='png,raw', help='Capture backends to compare (default: png,raw)')
+    parser.add_argument('--threshold', default=5, type=float, help='Mean absolute gray difference of a changed ROI (default: 5)')
+    parser.add_argument('--timeout', default=3, type=float, help='Seconds to give up waiting for the change (default: 3)')
+    parser.add_argument('--interval', default=1, type=float, help='Seconds between trials (default: 1)')
+    parser.add_argument('--log', default='warning', help='Log level (CRITICAL, ERROR, WARNING, INFO, and DEBUG)')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s', level=getattr(logging, args.log.upper()))
+
+    roi = args.roi or [args.loc[0] - 50, args.loc[1] - 50, 100, 100]
+    adb = Adb()
+
+    for input_backend, capture_backend in itertools.product(
+            args.input_backends.split(','), args.capture_backends.split(',')):
+        adb.input_backend = input_backend
+        adb.capture_backend = capture_backend
+
+        capture_times = []
+        input_times = []
+        latencies = []
+        return_latencies = []
+        errors = []
+        for _ in range(args.repeat):
+            reference, start_time, end_time = get_roi(adb, roi)
+            capture_times.append(end_time - start_time)
+
+            input_time, latency, return_latency, error = measure(adb, args.loc, roi, reference, args.threshold, args.timeout)
+            input_times.append(input_time)
+            if latency is None:
+                logging.warning(f'ROI didn\'t change in {args.timeout} s ({input_backend}/{capture_backend})')
+            else:
+                latencies.append(latency)
+                return_latencies.append(return_latency)
+                errors.append(error)
+
+            if args.back_loc:
+                adb.touch(*args.back_loc)
+            time.sleep(args.interval)
+            if not wait_for_revert(adb, roi, reference, args.threshold, args.timeout):
+                logging.warning('ROI didn\'t revert. Check --roi and --back-loc')
+
+        print(f'input {input_backend}, capture {capture_backend}: {len(latencies)}/{args.repeat} changes detected')
+        print(f'  capture:           {format_distribution(capture_times)}')
+        print(f'  input call:        {format_distribution(input_times)}')
+        if latencies:
+            print(f'  input to display:  {format_distribution(latencies)} (+/- {np.mean(errors) * 1000:.1f} ms)')
+            print(f'  return to display: {format_distribution(return_latencies)} (+/- {np.mean(errors) * 1000:.1f} ms)')
+
+
+if __name__ == '__main__':
+    main()
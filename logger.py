@@ -0,0 +1,84 @@
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+import config
+
+
+log_format = '%(asctime)s %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s'
+# number of messages remembered by the rate limit before the old ones are forgotten
+max_sites = 1000
+
+
+class RateLimitFilter(logging.Filter):
+    '''
+    Collapse the INFO and DEBUG records repeated from the same line with the same message template,
+    e.g. on every frame, so that per-frame values are passed as arguments rather than formatted in the message.
+    A message is logged at most once per interval seconds, and its next record tells how many
+    records are suppressed in between. Warnings and errors are never suppressed.
+    '''
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self.lock = threading.Lock()
+        # (path, line, message template) -> [time of the last record, number of suppressed records]
+        self.sites = {}
+
+    def filter(self, record: logging.LogRecord):
+        if record.levelno >= logging.WARNING or self.interval <= 0:
+            return True
+
+        key = (record.pathname, record.lineno, record.msg)
+        with self.lock:
+            site = self.sites.get(key)
+            if site is not None and record.created - site[0] < self.interval:
+                site[1] += 1
+                return False
+
+            suppressed = site[1] if site else 0
+            self.sites[key] = [record.created, 0]
+
+            # formatted messages with numbers are mostly unique, so the ones out of the interval are forgotten
+            if len(self.sites) > max_sites:
+                self.sites = {
+                    key: site for key, site in self.sites.items() if record.created - site[0] < self.interval}
+
+        if suppressed:
+            record.msg = f'{record.msg} ({suppressed} similar messages suppressed)'
+
+        return True
+
+
+def setup(level: int, path: str = 'smbot.log'):
+    '''
+    Log to the console and the rotating log file in a background thread.
+    Records are only put into a queue by the logging thread, and formatted and
+    written by the listener, so that disk I/O doesn't block the match loop.
+
+    Returns:
+        QueueListener: listener, which is stopped at exit
+    '''
+    formatter = logging.Formatter(log_format)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=config.log_max_bytes, backupCount=config.log_backup_count, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(config.log_rate_interval))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    return listener
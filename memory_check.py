@@ -0,0 +1,64 @@
+import glob
+import time
+import argparse
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from action import Action
+from frame import Frame
+from motion import MotionEstimator
+from replay import ReplayAdb
+import config
+import image_processing
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure memory allocated per frame by the kick analysis')
+    parser.add_argument('image_dir', help='Glob pattern of recorded frames, e.g. "debug/20201120103000/frame_*.png"')
+    parser.add_argument('--warmup', default=3, type=int, help='Frames to skip before measuring (default: 3)')
+    parser.add_argument('--parallel', action='store_true', help='If set, run the vision stages concurrently')
+    args = parser.parse_args()
+
+    images = [cv2.imread(path) for path in sorted(glob.glob(args.image_dir))]
+    if len(images) <= args.warmup:
+        print(f'There are not enough frames in {args.image_dir}')
+        return
+
+    # every stage of the cascade is analyzed regardless of the elapsed time
+    config.decision_budget = float('inf')
+    action = Action(adb=ReplayAdb(args.image_dir), parallel=args.parallel)
+    motion = MotionEstimator()
+
+    tracemalloc.start()
+    transient = []
+    retained = []
+    previous_frame = Frame(images[0])
+    for index, image in enumerate(images):
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+
+        frame = Frame(image, time.time(), action.buffers)
+        motion.update(image, frame.timestamp)
+        image_processing.diff_image(previous_frame, frame, buffers=action.buffers)
+        action.decide_kick(frame)
+        action.frame_index += 1
+        previous_frame = frame
+
+        current, peak = tracemalloc.get_traced_memory()
+        if index >= args.warmup:
+            transient.append(peak - start)
+            retained.append(current - start)
+
+    tracemalloc.stop()
+
+    frame_size = images[0].nbytes
+    print(f'Frames: {len(transient)} measured after {args.warmup} warm-up frames')
+    print(f'Peak allocation per frame: mean {np.mean(transient) / 1024:.1f} KiB, max {np.max(transient) / 1024:.1f} KiB '
+          f'({np.mean(transient) / frame_size * 100:.1f}% of a color frame)')
+    print(f'Retained per frame:        mean {np.mean(retained) / 1024:.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import json
+import bisect
+import logging
+import weakref
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class Metric():
+    '''
+    Base of the live metrics.
+    Each thread updates its own shard without a lock, and the shards are only
+    merged when the metrics are scraped, so updating costs a few dict operations.
+    The shards of the finished threads, which are never updated again, are merged into
+    the base shard on scrape, so that the threads of every match don't add up.
+    '''
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.local = threading.local()
+        # shards of the threads with weak references to the threads
+        self.shards = []
+        self.base = {}
+        self.shards_lock = threading.Lock()
+
+        registry.append(self)
+
+    def get_shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = {}
+            self.local.shard = shard
+            # only once per thread
+            with self.shards_lock:
+                self.shards.append((weakref.ref(threading.current_thread()), shard))
+
+        return shard
+
+    def merge(self, total: dict, shard: dict):
+        raise NotImplementedError
+
+    def collect(self):
+        values = {}
+        with self.shards_lock:
+            shards = []
+            for ref, shard in self.shards:
+                thread = ref()
+                if thread is None or not thread.is_alive():
+                    self.merge(self.base, shard)
+                else:
+                    shards.append((ref, shard))
+            self.shards = shards
+
+            self.merge(values, self.base)
+            for _, shard in shards:
+                self.merge(values, shard)
+
+        return values
+
+    def get_labels(self, values: tuple):
+        return dict(zip(self.labels, values))
+
+    def format_labels(self, values: tuple, extra: dict = None):
+        labels = self.get_labels(values)
+        if extra:
+            labels.update(extra)
+
+        if not labels:
+            return ''
+
+        escaped = [
+            f'{k}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+            for k, v in labels.items()]
+        return '{' + ','.join(escaped) + '}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        shard = self.get_shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def merge(self, total: dict, shard: dict):
+        for labels, value in list(shard.items()):
+            total[labels] = total.get(labels, 0) + value
+
+    def to_text(self):
+        return [f'{self.name}{self.format_labels(labels)} {value}' for labels, value in self.collect().items()]
+
+    def to_json(self):
+        return [{'labels': self.get_labels(labels), 'value': value} for labels, value in self.collect().items()]
+
+
+class Gauge(Metric):
+    '''
+    Last value set by any thread
+    '''
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self.values = {}
+
+    def set(self, labels: tuple = (), value: float = 0):
+        self.values[labels] = value
+
+    def collect(self):
+        return dict(self.values)
+
+    def to_text(self):
+        return [f'{self.name}{self.format_labels(labels)} {value}' for labels, value in self.collect().items()]
+
+    def to_json(self):
+        return [{'labels': self.get_labels(labels), 'value': value} for labels, value in self.collect().items()]
+
+
+class State(Gauge):
+    '''
+    Current state such as the screen of the device, exported as a gauge of 1 with the state label
+    '''
+    def to_text(self):
+        return [f'{self.name}{self.format_labels(labels, {"state": state})} 1'
+                for labels, state in self.collect().items()]
+
+    def to_json(self):
+        return [{'labels': self.get_labels(labels), 'state': state} for labels, state in self.collect().items()]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: list = None):
+        super().__init__(name, help, labels)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value: float, labels: tuple = ()):
+        shard = self.get_shard()
+        item = shard.get(labels)
+        if item is None:
+            # count per bucket and +Inf, sum, and count
+            item = [0] * (len(self.buckets) + 3)
+            shard[labels] = item
+
+        item[bisect.bisect_left(self.buckets, value)] += 1
+        item[-2] += value
+        item[-1] += 1
+
+    def merge(self, total: dict, shard: dict):
+        for labels, item in list(shard.items()):
+            merged = total.setdefault(labels, [0] * len(item))
+            for index, value in enumerate(list(item)):
+                merged[index] += value
+
+    def to_text(self):
+        lines = []
+        for labels, item in self.collect().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], item):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{self.format_labels(labels, {"le": bound})} {cumulative}')
+            lines.append(f'{self.name}_sum{self.format_labels(labels)} {item[-2]}')
+            lines.append(f'{self.name}_count{self.format_labels(labels)} {item[-1]}')
+
+        return lines
+
+    def to_json(self):
+        return [{
+            'labels': self.get_labels(labels),
+            'buckets': dict(zip(map(str, self.buckets + ['+Inf']), item)),
+            'sum': item[-2],
+            'count': item[-1],
+        } for labels, item in self.collect().items()]
+
+
+registry = []
+
+latency_buckets = [0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.75, 1, 2, 5]
+
+capture_seconds = Histogram(
+    'smbot_capture_seconds', 'Screen capture latency', ('device',), latency_buckets)
+decision_seconds = Histogram(
+    'smbot_decision_seconds', 'Kick decision latency from the frame capture', ('device',), latency_buckets)
+capture_cache = Counter(
+    'smbot_capture_cache_total', 'Screen captures served from the cache (hit) or the device (miss)', ('device', 'result'))
+match_frames = Counter(
+    'smbot_match_frames_total', 'Frames analyzed in matches', ('device',))
+match_fps = Gauge(
+    'smbot_match_frames_per_second', 'Analyzed frames per second of the last match', ('device',))
+games = Counter(
+    'smbot_games_total', 'Played games by outcome', ('device', 'outcome'))
+chores = Counter(
+    'smbot_chores_total', 'Chore runs by result', ('device', 'chore', 'result'))
+restarts = Counter(
+    'smbot_restarts_total', 'App restarts by reason', ('device', 'reason'))
+screen_state = State(
+    'smbot_screen_state', 'Current screen of the device', ('device',))
+input_seconds = Histogram(
+    'smbot_input_seconds', 'Input command latency from the send to the ack of the device', ('device',), latency_buckets)
+input_commands = Counter(
+    'smbot_input_commands_total', 'Queued input commands by result (sent or dropped)', ('device', 'result'))
+cpu_seconds = Counter(
+    'smbot_cpu_seconds_total', 'CPU time of the bot process by phase', ('device', 'phase'))
+cpu_cores = Gauge(
+    'smbot_cpu_cores', 'CPU cores used by the bot process in the last run of each phase', ('device', 'phase'))
+
+
+def to_text():
+    '''
+    Prometheus text exposition format
+    '''
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.to_text())
+
+    return '\n'.join(lines) + '\n'
+
+
+def to_json():
+    return json.dumps({metric.name: metric.to_json() for metric in registry})
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = to_text().encode()
+            content_type = 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body = to_json().encode()
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f'Metrics request: {format % args}')
+
+
+def serve(port: int, host: str = '127.0.0.1'):
+    '''
+    Serve /metrics (Prometheus text) and /metrics.json in a background thread
+    '''
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='Metrics', daemon=True)
+    thread.start()
+    logging.info(f'Metrics are served at http://{host}:{server.server_port}/metrics')
+
+    return server
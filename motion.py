@@ -0,0 +1,73 @@
+import logging
+
+import cv2
+import numpy as np
+
+import config
+
+
+class MotionEstimator():
+    '''
+    Estimate the camera pan between consecutive frames by phase correlation.
+    Only the pitch below the dashboard is used, and it's downscaled so that an
+    update takes a few milliseconds per frame.
+    '''
+    def __init__(self):
+        self.scale = config.motion_scale
+        self.min_response = config.motion_min_response
+        self.window = None
+
+        # downscaled images of the current and previous frames are stored alternately
+        self.small_color = None
+        self.small_gray = None
+        self.smalls = []
+        self.previous = None
+        self.previous_timestamp = 0
+
+        # motion of the screen contents in pixels per second
+        self.velocity = np.zeros(2)
+
+    def update(self, image: np.ndarray, timestamp: float):
+        band = image[config.dashboard_height:, :]
+        size = (round(band.shape[1] * self.scale), round(band.shape[0] * self.scale))
+
+        if self.window is None or self.window.shape != size[::-1]:
+            self.window = cv2.createHanningWindow(size, cv2.CV_32F)
+            self.small_color = np.empty((size[1], size[0], 3), np.uint8)
+            self.small_gray = np.empty((size[1], size[0]), np.uint8)
+            self.smalls = [np.empty((size[1], size[0]), np.float32) for _ in range(2)]
+            self.previous = None
+
+        cv2.resize(band, size, dst=self.small_color, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small_color, cv2.COLOR_BGR2GRAY, dst=self.small_gray)
+        small = self.smalls[1] if self.previous is self.smalls[0] else self.smalls[0]
+        np.copyto(small, self.small_gray)
+
+        elapsed_time = timestamp - self.previous_timestamp
+        if self.previous is not None and 0 < elapsed_time < 1:
+            (dx, dy), response = cv2.phaseCorrelate(self.previous, small, self.window)
+
+            if response > self.min_response:
+                velocity = np.array([dx, dy]) / self.scale / elapsed_time
+                self.velocity = 0.5 * self.velocity + 0.5 * velocity
+            else:
+                # not reliable, e.g. during scene change
+                self.velocity = np.zeros(2)
+
+            logging.debug('camera motion: (%.1f, %.1f) response %.2f', dx, dy, response)
+        else:
+            self.velocity = np.zeros(2)
+
+        self.previous = small
+        self.previous_timestamp = timestamp
+
+    def compensate(self, x: float, y: float, elapsed_time: float):
+        '''
+        Predict where the point of the frame is shown after elapsed_time seconds
+        '''
+        dx, dy = self.velocity * elapsed_time
+
+        x = min(max(x + dx, 0), config.screen_size[1] - 1)
+        y = min(max(y + dy, config.dashboard_height), config.screen_size[0] - 1)
+
+        return x, y
@@ -0,0 +1,129 @@
+import logging
+
+import cv2
+import numpy as np
+
+import config
+
+
+kicks = ['forward', 'backward1', 'backward2', 'header']
+
+
+class FieldPlanner():
+    '''
+    Pass planner on the clearance field, i.e. the distance from every pixel to the nearest opponent.
+    The field is computed once per frame by a distance transform of the opponents at pass_field_scale,
+    and every lane from the kick start location is scored by the minimum clearance sampled along it, so that
+    all the candidates of a kick are scored at once. The candidates are the teammates in the kick mask and
+    the open spots on a grid of the kick mask for through balls, which a teammate reaches before the opponents.
+    '''
+    def __init__(self, kick_masks: list, start_locs: list):
+        self.kick_masks = kick_masks
+        self.start_locs = np.array(start_locs, np.float32)
+
+        height, width = kick_masks[0].shape
+        self.scale = config.pass_field_scale
+        self.field_shape = (round(height * self.scale), round(width * self.scale))
+
+        step = config.pass_grid_step
+        ys, xs = np.mgrid[step // 2:height:step, step // 2:width:step]
+        grid = np.stack([xs.ravel(), ys.ravel()], axis=1)
+        self.spots = [grid[mask[grid[:, 1], grid[:, 0]] > 0].astype(np.float32) for mask in kick_masks]
+
+        self.samples = np.linspace(0, 1, config.pass_lane_samples, dtype=np.float32)
+
+    def get_field(self, op_stats: np.ndarray, op_centroids: np.ndarray, buffers):
+        '''
+        Distance to the nearest opponent in pixels of the field. An opponent is a disc at the centroid
+        with the area of the stats, since the stats of the trackers have no box
+        '''
+        free = buffers.get('pass_free', self.field_shape)
+        free.fill(255)
+        for stat, (x, y) in zip(op_stats, op_centroids):
+            radius = np.sqrt(stat[cv2.CC_STAT_AREA] / np.pi)
+            cv2.circle(free, (int(x * self.scale), int(y * self.scale)), max(int(radius * self.scale), 1), 0, -1)
+
+        return cv2.distanceTransform(
+            free, cv2.DIST_L2, 3, dst=buffers.get('pass_field', self.field_shape, np.float32))
+
+    def sample(self, field: np.ndarray, points: np.ndarray):
+        '''
+        Clearance of the points (..., 2) in screen pixels
+        '''
+        x = np.clip((points[..., 0] * self.scale).astype(np.int32), 0, self.field_shape[1] - 1)
+        y = np.clip((points[..., 1] * self.scale).astype(np.int32), 0, self.field_shape[0] - 1)
+
+        return field[y, x] / self.scale
+
+    def score_lanes(self, field: np.ndarray, start: np.ndarray, targets: np.ndarray):
+        '''
+        Minimum clearance along the lanes from start to the targets, where the clearance near the kicker,
+        who is usually marked, is ignored, and a clearance over pass_safe_clearance is as safe as any other
+        '''
+        vectors = targets - start
+        points = start + vectors[:, None, :] * self.samples[None, :, None]
+        clearance = self.sample(field, points)
+
+        lengths = np.linalg.norm(vectors, axis=1)
+        clearance[self.samples[None, :] * lengths[:, None] < config.pass_kicker_margin] = np.inf
+
+        return np.minimum(clearance.min(axis=1), config.pass_safe_clearance)
+
+    def plan(self, my_centroids: np.ndarray, op_stats: np.ndarray, op_centroids: np.ndarray, buffers):
+        '''
+        Plan the passes of the kicks whose kicker is found
+
+        Returns:
+            list: kick index and the kick as start_x, start_y, end_x, end_y, duration
+        '''
+        my_centroids = np.asarray(my_centroids, np.float32).reshape(-1, 2)
+        if len(my_centroids) == 0:
+            return []
+
+        field = self.get_field(op_stats, op_centroids, buffers)
+
+        planned = []
+        for kick_index, kick in enumerate(kicks):
+            start = self.start_locs[kick_index]
+            kicker_dists = np.linalg.norm(my_centroids - start, axis=1)
+            kicker_index = int(np.argmin(kicker_dists))
+            if kicker_dists[kicker_index] >= config.kick_distance_threshold[kick_index]:
+                continue
+            logging.info(f'{kick} kick ({kicker_dists[kicker_index]})')
+
+            mask = self.kick_masks[kick_index]
+            teammates = np.delete(my_centroids, kicker_index, axis=0)
+            locs = teammates.astype(np.int32)
+            inside = (locs[:, 0] >= 0) & (locs[:, 0] < mask.shape[1]) & (locs[:, 1] >= 0) & (locs[:, 1] < mask.shape[0])
+            receivers = teammates[inside][mask[locs[inside, 1], locs[inside, 0]] > 0]
+
+            # a spot is open if a teammate is closer to it than the nearest opponent
+            spots = self.spots[kick_index]
+            if len(teammates) > 0 and len(spots) > 0:
+                teammate_dists = np.linalg.norm(spots[:, None, :] - teammates[None, :, :], axis=2).min(axis=1)
+                spots = spots[teammate_dists < self.sample(field, spots)]
+            else:
+                spots = spots[:0]
+
+            targets = np.concatenate([receivers, spots])
+            if len(targets) == 0:
+                logging.warning('Can\'t find proper player')
+                continue
+
+            scores = self.score_lanes(field, start, targets)
+            # a through ball is chosen over a pass to the feet only if its lane is clearly safer
+            scores[len(receivers):] *= config.pass_through_weight
+
+            best = int(np.argmax(scores))
+            logging.debug('%s: %d receivers and %d open spots, best %d with clearance %.1f',
+                          kick, len(receivers), len(spots), best, scores[best])
+            if scores[best] < config.pass_min_clearance:
+                logging.warning(f'No lane of {kick} kick is clear of the opponents ({scores[best]:.1f})')
+                continue
+
+            target = [int(round(value)) for value in targets[best]]
+            kind = 'player' if best < len(receivers) else 'open spot'
+            logging.info(f'Kicked to {kind} {target} with opponent distance {scores[best]:.1f}')
+            planned.append((kick_index, [int(start[0]), int(start[1])] + target + [200]))
+
+        return planned
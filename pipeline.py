@@ -0,0 +1,189 @@
+import time
+import logging
+import threading
+import queue
+
+import numpy as np
+
+
+class FrameGrabber():
+    '''
+    Capture frames continuously in a background thread.
+    Only the latest frame is kept: a frame which is not taken by the consumer
+    before the next capture is dropped, and a frame identical to the previous
+    capture is counted as duplicate and never handed to the consumer.
+    Unless pipelined, there is no thread and a frame is captured when the consumer asks for it.
+    '''
+    def __init__(self, adb, pipelined: bool = True):
+        self.adb = adb
+        self.pipelined = pipelined
+        self.cond = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.error = None
+
+        self.frame = None
+        self.frame_timestamp = 0
+        self.frame_id = 0
+        self.consumed_id = 0
+
+        self.captured_count = 0
+        self.dropped_count = 0
+        self.duplicate_count = 0
+
+    def start(self):
+        self.running = True
+        if self.pipelined:
+            self.thread = threading.Thread(target=self.run, name='FrameGrabber', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+        logging.info(
+            f'Captured {self.captured_count} frames, dropped {self.dropped_count}, duplicate {self.duplicate_count}')
+
+    def run(self):
+        previous = None
+        try:
+            while self.running:
+                timestamp = time.time()
+                image = self.adb.get_screen(fresh=True)
+                self.captured_count += 1
+
+                if previous is not None and np.array_equal(image, previous):
+                    self.duplicate_count += 1
+                    continue
+                previous = image
+
+                with self.cond:
+                    if self.frame_id > self.consumed_id:
+                        self.dropped_count += 1
+
+                    self.frame = image
+                    self.frame_timestamp = timestamp
+                    self.frame_id += 1
+                    self.cond.notify_all()
+        except Exception as e:
+            logging.error(f'Frame capture stopped: {e}')
+            with self.cond:
+                self.error = e
+                self.running = False
+                self.cond.notify_all()
+
+    def get(self, timeout: float = None):
+        '''
+        Wait for a frame newer than the one taken last time
+
+        Returns:
+            (np.ndarray, float): the latest frame and its capture time
+        '''
+        if not self.pipelined:
+            return self.capture()
+
+        with self.cond:
+            self.cond.wait_for(
+                lambda: self.frame_id > self.consumed_id or not self.running, timeout)
+
+            if self.error:
+                raise self.error
+
+            if self.frame_id == self.consumed_id:
+                return None, 0
+
+            self.consumed_id = self.frame_id
+            return self.frame, self.frame_timestamp
+
+    def capture(self):
+        '''
+        Capture until the frame is different from the last one, in the caller's thread
+        '''
+        while True:
+            timestamp = time.time()
+            image = self.adb.get_screen(fresh=True)
+            self.captured_count += 1
+
+            if self.frame is None or not np.array_equal(image, self.frame):
+                break
+            self.duplicate_count += 1
+
+        self.frame = image
+        self.frame_timestamp = timestamp
+        return image, timestamp
+
+
+class Actuator():
+    '''
+    Send gestures to the device in a background thread so that analysis of the
+    next frame is not blocked by the adb round trip.
+    It has the same swipe interface as Adb.
+    If motion estimator is given, the swipe target is corrected by the camera pan
+    predicted from the capture of the frame until the swipe is sent.
+    Unless pipelined, there is no thread and a swipe is sent before swipe returns.
+    '''
+    def __init__(self, adb, motion=None, pipelined: bool = True):
+        self.adb = adb
+        self.motion = motion
+        self.pipelined = pipelined
+        self.queue = queue.Queue()
+        self.thread = None
+
+        self.done_time = 0
+        self.frame_timestamp = 0
+        self.reaction_times = []
+
+    def start(self):
+        if self.pipelined:
+            self.thread = threading.Thread(target=self.run, name='Actuator', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def swipe(self, start_x, start_y, end_x, end_y, duration):
+        if self.pipelined:
+            self.queue.put(((start_x, start_y, end_x, end_y, duration), self.frame_timestamp))
+        else:
+            self.send((start_x, start_y, end_x, end_y, duration), self.frame_timestamp)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+
+            self.send(*item)
+            self.queue.task_done()
+
+    def send(self, gesture: tuple, frame_timestamp: float):
+        frame_age = time.time() - frame_timestamp
+        self.reaction_times.append(frame_age)
+
+        if self.motion:
+            start_x, start_y, end_x, end_y, duration = gesture
+            end_x, end_y = self.motion.compensate(end_x, end_y, frame_age)
+            gesture = (start_x, start_y, int(end_x), int(end_y), duration)
+        logging.info(f'Swipe {gesture} at frame age {frame_age * 1000:.0f} ms')
+        try:
+            self.adb.swipe(*gesture)
+        except Exception as e:
+            logging.error(f'Failed to send swipe {gesture}: {e}')
+
+        self.done_time = time.time()
+
+    def busy(self, timestamp: float):
+        '''
+        Check if a gesture is being sent or the frame captured at timestamp can't
+        show the result of the last gesture yet
+        '''
+        return self.queue.unfinished_tasks > 0 or timestamp < self.done_time
@@ -0,0 +1,104 @@
+import logging
+
+import cv2
+import numpy as np
+
+import config
+from image_processing import get_buffer
+
+
+kernel_5 = np.ones((5, 5), np.uint8)
+kernel_55 = np.ones((55, 55), np.uint8)
+
+
+def get_color_mask(image_eh: np.ndarray, buffers=None):
+    # mask for the green playground
+    return cv2.inRange(
+        image_eh, np.array(40, dtype=np.uint16), np.array(55, dtype=np.uint16),
+        dst=get_buffer(buffers, 'playground_color', image_eh.shape))
+
+
+def close_holes(mask: np.ndarray, open_kernel: np.ndarray, close_kernel: np.ndarray, buffers=None):
+    opened = cv2.morphologyEx(
+        mask, cv2.MORPH_OPEN, open_kernel, dst=get_buffer(buffers, 'playground_open', mask.shape))
+
+    return cv2.morphologyEx(
+        opened, cv2.MORPH_CLOSE, close_kernel, dst=get_buffer(buffers, 'playground_close', mask.shape))
+
+
+def segment(image_eh: np.ndarray, buffers=None):
+    '''
+    Playground mask at full resolution
+    '''
+    return close_holes(get_color_mask(image_eh, buffers), kernel_5, kernel_55, buffers)
+
+
+class PlaygroundSegmenter():
+    '''
+    Faster playground segmentation, which is the same as segment() within a tolerance.
+    The morphology runs on the color mask decimated by config.playground_scale with
+    kernels scaled accordingly, and the result is upsampled to the full resolution.
+    The last result is reused while the color mask doesn't change more than
+    config.playground_cache_tolerance, i.e. the camera doesn't move.
+    '''
+    def __init__(self):
+        self.scale = config.playground_scale
+        self.tolerance = config.playground_cache_tolerance
+
+        open_size = max(1, round(5 / self.scale))
+        close_size = max(1, round(55 / self.scale))
+        self.open_kernel = np.ones((open_size, open_size), np.uint8)
+        self.close_kernel = np.ones((close_size, close_size), np.uint8)
+
+        self.thumbnail = None
+        self.mask = None
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def segment(self, image_eh: np.ndarray, buffers=None):
+        if self.scale == 1 and self.tolerance == 0:
+            return segment(image_eh, buffers)
+
+        color_mask = get_color_mask(image_eh, buffers)
+
+        if self.tolerance > 0:
+            thumbnail = cv2.resize(color_mask, None, fx=1 / 16, fy=1 / 16, interpolation=cv2.INTER_AREA)
+            if self.thumbnail is not None and self.thumbnail.shape == thumbnail.shape and \
+                    np.mean(cv2.absdiff(thumbnail, self.thumbnail)) < self.tolerance:
+                self.hit_count += 1
+                return self.mask
+
+            self.miss_count += 1
+            self.thumbnail = thumbnail
+
+        # the cached mask must not be overwritten by the next frame
+        mask_buffers = None if self.tolerance > 0 else buffers
+
+        if self.scale == 1:
+            mask = close_holes(color_mask, self.open_kernel, self.close_kernel, mask_buffers)
+        else:
+            height, width = color_mask.shape
+            small_size = (round(width / self.scale), round(height / self.scale))
+            small = cv2.resize(
+                color_mask, small_size, dst=get_buffer(buffers, 'playground_small', small_size[::-1]),
+                interpolation=cv2.INTER_AREA)
+            _, small = cv2.threshold(small, 127, 255, cv2.THRESH_BINARY, dst=small)
+            small = close_holes(small, self.open_kernel, self.close_kernel, buffers)
+
+            mask = cv2.resize(
+                small, (width, height), dst=get_buffer(mask_buffers, 'playground', color_mask.shape),
+                interpolation=cv2.INTER_LINEAR)
+            _, mask = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY, dst=mask)
+
+        self.mask = mask
+        logging.debug('playground cache hit %d miss %d', self.hit_count, self.miss_count)
+
+        return mask
+
+
+def get_iou(mask1: np.ndarray, mask2: np.ndarray):
+    union = np.count_nonzero(cv2.bitwise_or(mask1, mask2))
+    if union == 0:
+        return 1.0
+
+    return np.count_nonzero(cv2.bitwise_and(mask1, mask2)) / union
@@ -0,0 +1,65 @@
+import sys
+import glob
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+import config
+import image_processing
+import playground
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the fast playground segmentation with the full resolution one')
+    parser.add_argument('image_dir', help='Glob pattern of recorded frames, e.g. "debug/20201120103000/frame_*.png"')
+    parser.add_argument('--scale', default=4, type=int, help='Downscale factor (default: 4)')
+    parser.add_argument('--tolerance', default=0, type=float, help='Cache tolerance of the color mask difference (default: 0)')
+    parser.add_argument('--repeat', default=5, type=int, help='Repeat count per frame for timing (default: 5)')
+    parser.add_argument('--min-iou', type=float, help='Fail if the IoU of any frame is lower, e.g. 0.98')
+    args = parser.parse_args()
+
+    config.playground_scale = args.scale
+    config.playground_cache_tolerance = args.tolerance
+    segmenter = playground.PlaygroundSegmenter()
+
+    exact_times = []
+    fast_times = []
+    ious = []
+    for path in sorted(glob.glob(args.image_dir)):
+        image_hsv = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2HSV)
+        image_eh = image_processing.hsv2eh(image_hsv)
+
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            exact = playground.segment(image_eh)
+            exact_times.append(time.perf_counter() - start_time)
+
+        # the cache is only meaningful between consecutive frames, so it's measured once per frame
+        start_time = time.perf_counter()
+        fast = segmenter.segment(image_eh)
+        fast_times.append(time.perf_counter() - start_time)
+
+        ious.append(playground.get_iou(exact, fast))
+
+    if len(ious) == 0:
+        print(f'There is no frame in {args.image_dir}')
+        return
+
+    exact_time = np.median(exact_times)
+    fast_time = np.median(fast_times)
+    print(f'Frames: {len(ious)}, scale: {args.scale}, tolerance: {args.tolerance}')
+    print(f'Full resolution: {exact_time * 1000:.2f} ms')
+    print(f'Fast:            {fast_time * 1000:.2f} ms ({exact_time / fast_time:.1f}x), '
+          f'cache hit {segmenter.hit_count}/{segmenter.hit_count + segmenter.miss_count}')
+    print(f'IoU:             mean {np.mean(ious):.4f}, min {np.min(ious):.4f}')
+
+    if args.min_iou is not None and np.min(ious) < args.min_iou:
+        below = sum(iou < args.min_iou for iou in ious)
+        print(f'IoU of {below} frames is lower than {args.min_iou}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+import os
+import re
+import glob
+import json
+import mmap
+import zlib
+import struct
+import logging
+import argparse
+import threading
+from queue import Queue, Full
+
+import cv2
+import numpy as np
+
+import config
+
+
+magic = b'SMREC001'
+# magic, height, width, and channels of the frames
+header_format = '<8sIII'
+header_size = struct.calcsize(header_format)
+
+
+def get_index_path(path: str):
+    return path + '.idx'
+
+
+class RecordingWriter():
+    '''
+    Append-only session recording.
+    The data file is a header followed by the frame payloads, and the index file has a JSON line per frame
+    (offset, size, codec, keyframe, timestamp, and fields such as the screen state) and per annotation
+    (fields added later to the frame of a timestamp, such as the kick decision). Both files are flushed
+    on every frame, so a recording is readable up to the last frame even if the bot stops.
+    Frames are encoded and written by a background thread, so appending doesn't delay the match loop.
+
+    With the zlib codec, a frame is the zlib compressed difference from the previous frame, and every
+    key_interval frames is a keyframe compressed by itself. With the raw codec, every frame is stored as is,
+    so that readers get frames from the memory map without copying.
+    '''
+    def __init__(self, path: str, codec: str = None, key_interval: int = None):
+        self.path = path
+        self.codec = codec or config.recording_codec
+        self.key_interval = key_interval or config.recording_key_interval
+        if self.codec not in ('raw', 'zlib'):
+            raise Exception(f'Unknown recording codec {self.codec}')
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.data_file = open(path, 'wb')
+        self.index_file = open(get_index_path(path), 'w')
+
+        self.shape = None
+        self.previous = None
+        self.count = 0
+        self.key = 0
+        self.offset = 0
+        # frames and annotations dropped while the writer is behind
+        self.dropped_count = 0
+
+        self.queue = Queue(config.recording_queue_size)
+        self.thread = threading.Thread(target=self.run, name='Recorder', daemon=True)
+        self.thread.start()
+
+    def append(self, image: np.ndarray, timestamp: float, block: bool = False, **fields):
+        '''
+        Queue a frame, which must not be modified afterwards. Unless block is set,
+        the frame is dropped if the writer is behind.
+
+        Returns:
+            bool: True if the frame is queued
+        '''
+        try:
+            self.queue.put(('frame', image, timestamp, fields), block)
+            return True
+        except Full:
+            self.dropped_count += 1
+            logging.debug('Recorder is behind. Dropped frame %s', timestamp)
+            return False
+
+    def annotate(self, timestamp: float, **fields):
+        '''
+        Add fields to the recorded frame of the timestamp, e.g. the kicks decided on it.
+        The annotation is dropped if the writer is behind.
+
+        Returns:
+            bool: True if the annotation is queued
+        '''
+        try:
+            self.queue.put(('annotation', None, timestamp, fields), False)
+            return True
+        except Full:
+            self.dropped_count += 1
+            logging.debug('Recorder is behind. Dropped annotation of frame %s', timestamp)
+            return False
+
+    def run(self):
+        while True:
+            kind, image, timestamp, fields = self.queue.get()
+            if kind == 'close':
+                break
+
+            try:
+                if kind == 'frame':
+                    self.write_frame(image, timestamp, fields)
+                else:
+                    self.write_index(dict(timestamp=timestamp, **fields))
+            except Exception as e:
+                logging.error(f'Failed to record a frame: {e}')
+
+    def write_frame(self, image: np.ndarray, timestamp: float, fields: dict):
+        if self.shape is None:
+            self.shape = image.shape
+            height, width = image.shape[0:2]
+            channels = image.shape[2] if image.ndim == 3 else 1
+            self.data_file.write(struct.pack(header_format, magic, height, width, channels))
+            self.offset = header_size
+        elif image.shape != self.shape:
+            raise Exception(f'Frame size {image.shape} is different from the recording {self.shape}')
+
+        image = np.ascontiguousarray(image)
+        if self.codec == 'raw':
+            payload = image.data
+            self.key = self.count
+        elif self.previous is None or self.count % self.key_interval == 0:
+            payload = zlib.compress(image, 1)
+            self.key = self.count
+        else:
+            # the difference wraps around, and is mostly zeros while the camera doesn't move
+            payload = zlib.compress(np.subtract(image, self.previous, out=self.previous), 1)
+        if self.codec == 'zlib':
+            self.previous = image.copy()
+
+        self.data_file.write(payload)
+        self.data_file.flush()
+
+        size = len(payload) if isinstance(payload, bytes) else payload.nbytes
+        record = {
+            'frame': self.count,
+            'offset': self.offset,
+            'size': size,
+            'codec': self.codec,
+            'key': self.key,
+            'timestamp': timestamp,
+        }
+        record.update(fields)
+        self.write_index(record)
+
+        self.offset += size
+        self.count += 1
+
+    def write_index(self, record: dict):
+        # numbers of numpy such as the centroids of the kicks
+        self.index_file.write(json.dumps(record, default=float) + '\n')
+        self.index_file.flush()
+
+    def close(self):
+        '''
+        Write the queued frames and close the files
+        '''
+        self.queue.put(('close', None, None, None))
+        self.thread.join()
+        self.data_file.close()
+        self.index_file.close()
+
+
+class Recording():
+    '''
+    Memory-mapped reader of a session recording. A frame is decoded from its keyframe, and the last
+    decoded frame is kept so that reading the frames in order decodes each frame once.
+    Frames of the raw codec are read-only views of the memory map.
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        file_magic, height, width, channels = struct.unpack_from(header_format, self.map)
+        if file_magic != magic:
+            raise Exception(f'{path} is not a recording')
+        self.shape = (height, width, channels) if channels > 1 else (height, width)
+
+        self.records = []
+        # frame record of each timestamp for the annotations
+        timestamps = {}
+        with open(get_index_path(path)) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if 'offset' in record:
+                    # frames being written when the map was created are not readable
+                    if record['offset'] + record['size'] > len(self.map):
+                        break
+                    self.records.append(record)
+                    timestamps[record['timestamp']] = record
+                elif record['timestamp'] in timestamps:
+                    fields = dict(record)
+                    del fields['timestamp']
+                    timestamps[record['timestamp']].update(fields)
+
+        self.last_index = None
+        self.last_image = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += len(self.records)
+        if not 0 <= index < len(self.records):
+            raise IndexError(f'Frame {index} is out of the recording of {len(self.records)} frames')
+
+        record = self.records[index]
+        if record['codec'] == 'raw':
+            return np.frombuffer(self.map, np.uint8, int(np.prod(self.shape)), record['offset']).reshape(self.shape)
+
+        with self.lock:
+            if self.last_index is not None and record['key'] <= self.last_index < index:
+                start = self.last_index + 1
+                image = self.last_image.copy()
+            else:
+                start = record['key']
+                image = None
+
+            for i in range(start, index + 1):
+                payload = self.decompress(self.records[i])
+                image = payload if image is None else np.add(image, payload, out=image)
+
+            self.last_index = index
+            self.last_image = image
+
+            return image.copy()
+
+    def decompress(self, record: dict):
+        payload = self.map[record['offset']:record['offset'] + record['size']]
+        return np.frombuffer(zlib.decompress(payload), np.uint8).reshape(self.shape).copy()
+
+    @property
+    def timestamps(self):
+        return [record['timestamp'] for record in self.records]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class PngFrames():
+    '''
+    Frames of a directory of PNGs with the same interface as Recording, which are read on access
+    '''
+    def __init__(self, pattern: str):
+        self.paths = sorted(glob.glob(pattern), key=get_sort_key)
+        self.records = [
+            {'frame': index, 'timestamp': os.path.getmtime(path), 'path': path}
+            for index, path in enumerate(self.paths)]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index: int):
+        return cv2.imread(self.paths[index])
+
+    @property
+    def timestamps(self):
+        return [record['timestamp'] for record in self.records]
+
+
+def get_sort_key(path: str):
+    '''
+    Natural order of the file names, i.e. frame_2.png before frame_10.png
+    '''
+    return [int(token) if token.isdigit() else token for token in re.split(r'(\d+)', os.path.basename(path))]
+
+
+def open_frames(source: str):
+    '''
+    Recording if the source is a recording file, or the PNGs matched by the glob pattern otherwise
+    '''
+    if os.path.isfile(source) and os.path.exists(get_index_path(source)):
+        return Recording(source)
+
+    return PngFrames(source)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert between session recordings and PNG frames')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help='Convert PNG frames into a recording')
+    convert_parser.add_argument('image_dir', help='Glob pattern of recorded frames, e.g. "debug/20201120103000/frame_*.png"')
+    convert_parser.add_argument('output', help='Recording file, e.g. debug/20201120103000/match.rec')
+    convert_parser.add_argument('--codec', default=config.recording_codec, choices=['raw', 'zlib'], help=f'Frame codec (default: {config.recording_codec})')
+    convert_parser.add_argument('--key-interval', default=config.recording_key_interval, type=int, help=f'Frames between keyframes (default: {config.recording_key_interval})')
+
+    export_parser = subparsers.add_parser('export', help='Export the frames of a recording as PNGs')
+    export_parser.add_argument('recording', help='Recording file')
+    export_parser.add_argument('output_dir', help='Output directory')
+
+    info_parser = subparsers.add_parser('info', help='Print the frames and their fields')
+    info_parser.add_argument('recording', help='Recording file')
+
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        frames = PngFrames(args.image_dir)
+        if len(frames) == 0:
+            print(f'There is no frame in {args.image_dir}')
+            return
+
+        writer = RecordingWriter(args.output, args.codec, args.key_interval)
+        png_size = 0
+        for index, record in enumerate(frames.records):
+            png_size += os.path.getsize(record['path'])
+            writer.append(frames[index], record['timestamp'], block=True, source=os.path.basename(record['path']))
+        writer.close()
+
+        size = os.path.getsize(args.output) + os.path.getsize(get_index_path(args.output))
+        print(f'Converted {len(frames)} frames: {png_size / 1024 / 1024:.1f} MB of PNGs into {size / 1024 / 1024:.1f} MB')
+    elif args.command == 'export':
+        recording = Recording(args.recording)
+        os.makedirs(args.output_dir, exist_ok=True)
+        for index in range(len(recording)):
+            cv2.imwrite(os.path.join(args.output_dir, f'frame_{index}.png'), recording[index])
+        print(f'Exported {len(recording)} frames to {args.output_dir}')
+    elif args.command == 'info':
+        recording = Recording(args.recording)
+        print(f'{len(recording)} frames of {recording.shape}')
+        for record in recording.records:
+            fields = {k: v for k, v in record.items() if k not in ('frame', 'offset', 'size', 'codec', 'key', 'timestamp')}
+            kind = 'key' if record['key'] == record['frame'] else 'delta'
+            print(f'{record["frame"]:6d} {record["timestamp"]:.3f} {kind:5s} {record["size"]:9d} {json.dumps(fields)}')
+
+
+if __name__ == '__main__':
+    main()
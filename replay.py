@@ -0,0 +1,142 @@
+import time
+import logging
+import argparse
+
+import cv2
+import numpy as np
+
+from action import Action
+from recording import open_frames
+from vision_pool import VisionPool
+import config
+
+
+class ReplayAdb():
+    '''
+    Fake device which serves recorded frames instead of the emulator screen.
+    After the last frame, the game end screen is shown so that the match finishes.
+    '''
+    def __init__(self, image_dir: str, capture_time: float = 0.1, input_time: float = 0.05):
+        self.images = open_frames(image_dir)
+        if len(self.images) == 0:
+            raise Exception(f'There is no frame in {image_dir}')
+
+        self.serial = 'replay'
+        self.stats = None
+        self.capture_time = capture_time
+        self.input_time = input_time
+        self.index = 0
+        self.gestures = []
+
+        self.end_image = self.images[-1].copy()
+        x, y, width, height = config.game_end_loc
+        self.end_image[y:y + height, x:x + width] = cv2.imread('templates/game_end.png')
+
+    def get_screen(self, color: bool = True, fresh: bool = False):
+        # every capture is a new frame, so fresh is always satisfied
+        start = time.time()
+
+        if self.index < len(self.images):
+            img = self.images[self.index]
+            self.index += 1
+        else:
+            img = self.end_image.copy()
+
+        if not color:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+        time.sleep(max(0, self.capture_time - (time.time() - start)))
+
+        return img
+
+    def touch(self, x, y):
+        time.sleep(self.input_time)
+        self.gestures.append(('touch', time.time(), x, y))
+
+    def swipe(self, start_x, start_y, end_x, end_y, duration):
+        time.sleep(self.input_time + duration / 1000)
+        self.gestures.append(('swipe', time.time(), start_x, start_y, end_x, end_y))
+
+    def start_app(self):
+        pass
+
+    def stop_app(self):
+        pass
+
+    def restart_app(self, reason: str = ''):
+        pass
+
+
+def replay(args, pipelined: bool):
+    '''
+    Play a match on the recorded frames and print its frames, reaction times, and CPU usage
+
+    Returns:
+        np.ndarray: reaction times of the kicks
+    '''
+    adb = ReplayAdb(args.image_dir, args.capture_time, args.input_time)
+    options = {'player_detector': args.detector, 'pass_planner': args.pass_planner}
+    vision_pool = VisionPool(args.vision_workers, **options) if args.vision_workers else None
+    action = Action(adb=adb, vision_pool=vision_pool, pipelined=pipelined, **options)
+
+    wall_start = time.time()
+    cpu_start = time.process_time()
+    try:
+        result = action.play_match()
+    finally:
+        if vision_pool:
+            vision_pool.close()
+    wall_time = time.time() - wall_start
+    # CPU time of the bot process, without the vision workers
+    cpu_time = time.process_time() - cpu_start
+
+    reaction_times = np.array(result['reaction_times'])
+
+    print(f'[{"pipelined" if pipelined else "serial"}]')
+    print(f'Frames: {len(adb.images)} recorded, {result["captured"]} captured, {result["analyzed"]} analyzed, '
+          f'{result["dropped"]} dropped, {result["duplicate"]} duplicate')
+    print(f'Kicks: {len(reaction_times)} gestures')
+    if len(reaction_times) > 0:
+        print(f'Reaction time: mean {reaction_times.mean() * 1000:.1f} ms, '
+              f'p50 {np.percentile(reaction_times, 50) * 1000:.1f} ms, '
+              f'p95 {np.percentile(reaction_times, 95) * 1000:.1f} ms')
+    print(f'Wall time: {wall_time:.2f} s, CPU time: {cpu_time:.2f} s, CPU utilization: {cpu_time / wall_time * 100:.0f}%')
+
+    return reaction_times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('image_dir', help='Glob pattern of recorded frames, e.g. "debug/20201120103000/frame_*.png", or a recording file')
+    parser.add_argument('--capture-time', default=0.1, type=float, help='Simulated screen capture time in seconds')
+    parser.add_argument('--input-time', default=0.05, type=float, help='Simulated touch/swipe round trip time in seconds')
+    parser.add_argument('--detector', default='color', choices=['color', 'cnn'], help='Player detector (default: color)')
+    parser.add_argument('--pass-planner', default='lines', choices=['lines', 'field'], help='Pass planner (default: lines)')
+    parser.add_argument('--vision-workers', default=0, type=int, help='Number of vision worker processes (default: 0, in process)')
+    parser.add_argument('--serial', action='store_true', help='If set, capture, decide, and swipe in turn in the match loop')
+    parser.add_argument('--compare', action='store_true', help='If set, replay in both the serial and pipelined modes and compare the reaction times')
+    parser.add_argument('--log', default='warning', help='Log level (CRITICAL, ERROR, WARNING, INFO, and DEBUG)')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s', level=getattr(logging, args.log.upper()))
+
+    if not args.compare:
+        replay(args, not args.serial)
+        return
+
+    serial_times = replay(args, False)
+    pipelined_times = replay(args, True)
+    if len(serial_times) == 0 or len(pipelined_times) == 0:
+        print('There is no kick to compare the reaction times')
+        return
+
+    for name, function in (('mean', np.mean), ('p50', np.median), ('p95', lambda times: np.percentile(times, 95))):
+        serial_time = function(serial_times) * 1000
+        pipelined_time = function(pipelined_times) * 1000
+        print(f'Reaction time {name}: serial {serial_time:.1f} ms, pipelined {pipelined_time:.1f} ms, '
+              f'difference {pipelined_time - serial_time:+.1f} ms ({(pipelined_time / serial_time - 1) * 100:+.0f}%)')
+
+
+if __name__ == '__main__':
+    main()
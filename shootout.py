@@ -0,0 +1,58 @@
+import logging
+
+import cv2
+import numpy as np
+
+import config
+import image_processing
+
+
+class ShootoutDetector():
+    '''
+    Classify the shootout state from a single frame.
+    Only the regions which distinguish defence, offence, and game end screens are
+    compared, using the masks precomputed from the templates.
+    '''
+    def __init__(self, threshold: float = 0.7, diff_threshold: int = 50):
+        self.threshold = threshold
+        self.diff_threshold = diff_threshold
+
+        # state, region, template pixels, mask
+        self.states = []
+        for state in ['defence', 'offence']:
+            template = cv2.imread(f'templates/shootout_{state}.png')
+            mask = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY) > 0
+
+            # the templates are full screen images, so crop the bounding box of the mask
+            region = list(cv2.boundingRect(mask.astype(np.uint8)))
+            mask = image_processing.crop(mask, region)
+            pixels = image_processing.crop(template, region)[mask]
+            self.states.append((state, region, pixels, mask))
+
+        self.game_end_template = cv2.imread('templates/game_end.png')
+
+    def get_score(self, image: np.ndarray, region: list, pixels: np.ndarray, mask: np.ndarray):
+        # same as image_processing.diff_image with mask and diff_threshold
+        diff = pixels - image_processing.crop(image, region)[mask]
+        diff[diff < self.diff_threshold] = 0
+
+        return np.count_nonzero(diff == 0) / diff.size
+
+    def detect(self, image: np.ndarray):
+        '''
+        Returns:
+            str: 'defence', 'offence', 'end' if game end screen is shown, or None
+        '''
+        for state, region, pixels, mask in self.states:
+            score = self.get_score(image, region, pixels, mask)
+            logging.debug('shootout %s score: %s', state, score)
+            if score > self.threshold:
+                return state
+
+        score = image_processing.diff_image(
+            self.game_end_template, image_processing.crop(image, config.game_end_loc))
+        logging.debug('game end score: %s', score)
+        if score > 0.8:
+            return 'end'
+
+        return None
@@ -3,43 +3,71 @@ import logging
 import argparse
 
 from action import Action
+from stats import Stats
+from vision_pool import VisionPool
+import logger
+import metrics
 import emulator
 
+def run_chores(action: Action):
+    action.run_chore(action.open_rewards)
+    action.run_chore(action.open_package)
+    action.run_chore(action.open_box)
+    action.run_chore(action.unlock_box)
+
+    logging.info(f'Capture cache: {action.adb.hit_count} hits, {action.adb.miss_count} screencaps')
+    logging.info(f'CPU share: {action.governor.format_usage()}')
+    if action.input is not action.adb:
+        logging.info(f'Input queue: {action.input.get_summary()}')
+
 def main(
     log: str = 'INFO',
     debug: bool = False,
     play_game: bool = False,
-    play_duration: int = 60):
+    play_duration: int = 60,
+    parallel: bool = False,
+    stats_db: str = 'smbot.db',
+    tracking: bool = False,
+    no_watchdog: bool = False,
+    metrics_port: int = 0,
+    detector: str = 'color',
+    record: bool = False,
+    vision_workers: int = 0,
+    pass_planner: str = 'lines',
+    input_queue: bool = False):
 
-    log_level = getattr(logging, log.upper())
-    format='%(asctime)s %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s'
-    logFormatter = logging.Formatter(format)
-    logging.basicConfig(format=format, level=log_level)
+    logger.setup(getattr(logging, log.upper()))
 
-    fileHandler = logging.FileHandler('smbot.log')
-    fileHandler.setFormatter(logFormatter)
-    fileHandler.setLevel(log_level)
-    logging.getLogger().addHandler(fileHandler)
+    if metrics_port:
+        metrics.serve(metrics_port)
 
     emulator.launch()
-    action = Action(debug=debug)
+    vision_pool = VisionPool(vision_workers, player_detector=detector, pass_planner=pass_planner) if vision_workers else None
+    action = Action(
+        debug=debug, parallel=parallel, stats=Stats(stats_db), tracking=tracking, watchdog=not no_watchdog,
+        player_detector=detector, record=record, pass_planner=pass_planner, input_queue=input_queue,
+        vision_pool=vision_pool)
 
     last_play_time = time.time() - play_duration * 60
 
-    while True:
-        action.open_rewards()
-        action.open_package()
-        action.open_box()
-        action.unlock_box()
-
-        elapsed_time = (time.time() - last_play_time) / 60
-        logging.info(f'Elapsed time after last game: {int(elapsed_time)} minutes')
-        if play_game and elapsed_time > play_duration:
-            action.play_game()
-            last_play_time = time.time()
-        else:
-            logging.info('Sleep 5 min in main loop')
-            time.sleep(5 * 60)
+    try:
+        while True:
+            run_chores(action)
+
+            elapsed_time = (time.time() - last_play_time) / 60
+            logging.info(f'Elapsed time after last game: {int(elapsed_time)} minutes')
+            if play_game and elapsed_time > play_duration:
+                action.run_guarded(action.play_game)
+                last_play_time = time.time()
+            else:
+                logging.info('Sleep 5 min in main loop')
+                time.sleep(5 * 60)
+    finally:
+        # the worker processes and their shared memory outlive the bot otherwise
+        if action.watchdog:
+            action.watchdog.stop()
+        if vision_pool:
+            vision_pool.close()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -47,6 +75,16 @@ if __name__ == '__main__':
     parser.add_argument('--debug', action='store_true', help='')
     parser.add_argument('--play-duration', default='60', type=int, help='Time duration how often play the game (default: 60 miniutes)')
     parser.add_argument('--play-game', action='store_true', help='If set, play the game every [play-duration] minutes')
+    parser.add_argument('--parallel', action='store_true', help='If set, run the vision stages of a kick concurrently')
+    parser.add_argument('--tracking', action='store_true', help='If set, track players across frames instead of detecting them on every kick')
+    parser.add_argument('--no-watchdog', action='store_true', help='If set, don\'t restart the app when it crashes or hangs')
+    parser.add_argument('--metrics-port', default=0, type=int, help='If set, serve live metrics at http://127.0.0.1:[metrics-port]/metrics')
+    parser.add_argument('--detector', default='color', choices=['color', 'cnn'], help='Player detector: uniform colors or the CNN in config.detector_model (default: color)')
+    parser.add_argument('--record', action='store_true', help='If set, record the frames and decisions of each match in debug/<timestamp>/match.rec')
+    parser.add_argument('--vision-workers', default=0, type=int, help='If set, decide the kicks in [vision-workers] processes sharing the frames in shared memory')
+    parser.add_argument('--pass-planner', default='lines', choices=['lines', 'field'], help='Pass planner: opponent distances to the lines to the teammates, or lanes on the opponent clearance field including through balls (default: lines)')
+    parser.add_argument('--input-queue', action='store_true', help='If set, send consecutive taps of the chores in one ADB round trip and drop repeated taps during screen transitions')
+    parser.add_argument('--stats-db', default='smbot.db', help='Database to record run statistics (default: smbot.db)')
 
     args = parser.parse_args()
     main(**vars(args))
\ No newline at end of file
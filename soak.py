@@ -0,0 +1,282 @@
+import gc
+import io
+import os
+import sys
+import ctypes
+import glob
+import time
+import logging
+import argparse
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+import psutil
+
+from action import Action
+from adb import Adb
+from stats import Stats
+import config
+import logger
+import smbot
+
+
+real_sleep = time.sleep
+
+
+class VirtualClock():
+    '''
+    Accelerated time for time.sleep, so that the waits of the chores and the game
+    (ad videos, app restarts, screen transitions) take 1/speedup of the real time
+    '''
+    def __init__(self, speedup: float):
+        self.speedup = speedup
+        self.slept = 0
+        self.lock = threading.Lock()
+
+    def sleep(self, seconds: float):
+        with self.lock:
+            self.slept += seconds
+        real_sleep(seconds / self.speedup)
+
+
+def in_box(x: float, y: float, box: list):
+    return box[0] <= x < box[0] + box[2] and box[1] <= y < box[1] + box[3]
+
+
+class SoakDevice():
+    '''
+    Fake ppadb device which plays the screens of a chore cycle and a game:
+    main screen with a box to open every box_interval cycles, card opening, matchmaking
+    (bid screen), the recorded match frames, and the game end screen.
+    Screens are encoded once, so a capture costs only its decoding in Adb.
+    '''
+    def __init__(self, images: list, match_frames: int, box_interval: int):
+        self.serial = 'soak'
+        self.match_frames = match_frames
+        self.box_interval = box_interval
+
+        base = images[0]
+        self.screens = {
+            'main': self.encode(base),
+            'box': self.encode(self.compose(base, 'templates/open_now.png', config.open_now_locs[0])),
+            'cards': self.encode(self.compose(base, 'templates/okay.png', config.okay_loc)),
+            'bid': self.encode(self.compose(base, 'templates/bid.png', config.bid_loc)),
+            'game_end': self.encode(self.compose(images[-1], 'templates/game_end.png', config.game_end_loc)),
+        }
+        self.frames = [self.encode(image) for image in images]
+
+        self.state = 'main'
+        self.frame_index = 0
+        self.cycle = 0
+        self.games = 0
+        self.boxes = 0
+
+    @staticmethod
+    def encode(image: np.ndarray):
+        return cv2.imencode('.png', image)[1].tobytes()
+
+    @staticmethod
+    def compose(image: np.ndarray, template_path: str, loc: list):
+        image = image.copy()
+        x, y, width, height = loc
+        image[y:y + height, x:x + width] = cv2.imread(template_path)
+        return image
+
+    def start_cycle(self):
+        self.cycle += 1
+        self.state = 'box' if self.cycle % self.box_interval == 0 else 'main'
+
+    def screencap(self):
+        if self.state == 'bid':
+            # the bid screen is found once, then the match starts
+            self.state = 'match'
+            self.frame_index = 0
+            return self.screens['bid']
+
+        if self.state == 'match':
+            if self.frame_index >= self.match_frames:
+                self.state = 'game_end'
+                self.games += 1
+            else:
+                self.frame_index += 1
+                return self.frames[self.frame_index % len(self.frames)]
+
+        return self.screens[self.state]
+
+    def input_tap(self, x, y):
+        if self.state == 'box' and in_box(x, y, config.open_now_locs[0]):
+            self.state = 'cards'
+        elif self.state == 'cards' and in_box(x, y, config.okay_loc):
+            self.state = 'main'
+            self.boxes += 1
+        elif self.state == 'main' and [x, y] == config.play_match_loc:
+            self.state = 'bid'
+        elif self.state == 'game_end' and in_box(x, y, config.game_end_loc):
+            self.state = 'main'
+
+    def input_swipe(self, start_x, start_y, end_x, end_y, duration):
+        pass
+
+    def shell(self, command: str, handler=None):
+        if command.startswith('pidof'):
+            return '1234\n'
+
+        if command.startswith('dumpsys'):
+            return '  mResumedActivity: ActivityRecord{1 u0 com.firsttouchgames.smp/.MainActivity t1}\n'
+
+        # input commands of the input queue
+        output = ''
+        for part in command.split('; '):
+            args = part.split()
+            if args[0:2] == ['input', 'tap']:
+                self.input_tap(*map(float, args[2:]))
+            elif args[0:2] == ['input', 'swipe']:
+                self.input_swipe(*map(float, args[2:]))
+            elif args[0] == 'echo':
+                output += ' '.join(args[1:]) + '\r\n'
+
+        if handler:
+            handler(io.BytesIO(output.encode()))
+            return None
+
+        return output
+
+
+class ResourceSampler():
+    '''
+    Resident memory, open file descriptors (handles on Windows), sockets, and CPU time of this process.
+    Memory is sampled after a garbage collection and, on Linux, after the free memory of the malloc arenas
+    is returned to the system, since glibc keeps the frames freed by the threads of every match in
+    their arenas, which swings RSS by hundreds of MB without a leak.
+    '''
+    def __init__(self):
+        self.process = psutil.Process()
+        self.malloc_trim = None
+        if sys.platform.startswith('linux'):
+            try:
+                self.malloc_trim = ctypes.CDLL('libc.so.6').malloc_trim
+            except (OSError, AttributeError):
+                logging.warning('malloc_trim is not available, so RSS includes the free memory of the malloc arenas')
+
+    def get_cpu_time(self):
+        times = self.process.cpu_times()
+        return times.user + times.system
+
+    def sample(self):
+        gc.collect()
+        if self.malloc_trim:
+            self.malloc_trim(0)
+
+        if hasattr(self.process, 'num_fds'):
+            fds = self.process.num_fds()
+        else:
+            fds = self.process.num_handles()
+
+        get_connections = getattr(self.process, 'net_connections', None) or self.process.connections
+
+        return {
+            'rss': self.process.memory_info().rss / 1024 / 1024,
+            'fds': fds,
+            'sockets': len(get_connections(kind='all')),
+            'threads': self.process.num_threads(),
+        }
+
+
+def get_growth(values: list, window: int):
+    '''
+    Difference between the medians of the last and the first window of the samples,
+    which ignores the remaining peaks of the allocator
+    '''
+    return np.median(values[-window:]) - np.median(values[:window])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the chore loop and games against a fake device and check resource growth')
+    parser.add_argument('image_dir', help='Glob pattern of recorded match frames, e.g. "debug/20201120103000/frame_*.png"')
+    parser.add_argument('--cycles', default=2000, type=int, help='Number of chore cycles (default: 2000)')
+    parser.add_argument('--game-interval', default=1, type=int, help='Play a game every [game-interval] cycles (default: 1)')
+    parser.add_argument('--box-interval', default=5, type=int, help='Show a box to open every [box-interval] cycles (default: 5)')
+    parser.add_argument('--match-frames', default=30, type=int, help='Number of frames captured in a game (default: 30)')
+    parser.add_argument('--speedup', default=1000, type=float, help='Time acceleration of the sleeps (default: 1000)')
+    parser.add_argument('--warmup', default=20, type=int, help='Cycles to skip before sampling (default: 20)')
+    parser.add_argument('--sample-interval', default=10, type=int, help='Cycles between the resource samples (default: 10)')
+    parser.add_argument('--input-queue', action='store_true', help='If set, send the taps through the input queue')
+    parser.add_argument('--log', default='warning', help='Log level (CRITICAL, ERROR, WARNING, INFO, and DEBUG)')
+    args = parser.parse_args()
+
+    # samples are taken at the multiples of sample_interval after the warm-up
+    sample_count = args.cycles // args.sample_interval - args.warmup // args.sample_interval
+    if sample_count // 4 < config.soak_min_window_samples:
+        min_cycles = args.warmup + config.soak_min_window_samples * 4 * args.sample_interval
+        print(f'{sample_count} samples are too few to compare the first and the last quarter of them. '
+              f'Run at least {min_cycles} cycles, or decrease --sample-interval')
+        sys.exit(1)
+
+    images = [cv2.imread(path) for path in sorted(glob.glob(args.image_dir))]
+    if len(images) == 0:
+        print(f'There is no frame in {args.image_dir}')
+        sys.exit(1)
+
+    work_dir = tempfile.mkdtemp(prefix='soak_')
+    logger.setup(getattr(logging, args.log.upper()), os.path.join(work_dir, 'soak.log'))
+
+    clock = VirtualClock(args.speedup)
+    time.sleep = clock.sleep
+
+    device = SoakDevice(images, args.match_frames, args.box_interval)
+    action = Action(adb=Adb(device), stats=Stats(os.path.join(work_dir, 'soak.db')), watchdog=True, input_queue=args.input_queue)
+
+    sampler = ResourceSampler()
+    samples = []
+    cycle_cpu_times = []
+    start_time = time.time()
+
+    for cycle in range(1, args.cycles + 1):
+        device.start_cycle()
+        cpu_start = sampler.get_cpu_time()
+
+        smbot.run_chores(action)
+        if cycle % args.game_interval == 0:
+            action.run_guarded(action.play_game)
+
+        if cycle <= args.warmup:
+            continue
+
+        cycle_cpu_times.append(sampler.get_cpu_time() - cpu_start)
+        if cycle % args.sample_interval == 0:
+            sample = sampler.sample()
+            samples.append(sample)
+            print(f'Cycle {cycle}: RSS {sample["rss"]:.1f} MB, fds {sample["fds"]}, sockets {sample["sockets"]}, '
+                  f'threads {sample["threads"]}, CPU {np.mean(cycle_cpu_times[-args.sample_interval:]) * 1000:.0f} ms/cycle')
+
+    action.watchdog.stop()
+    elapsed_time = time.time() - start_time
+    print(f'{args.cycles} cycles, {device.games} games, {device.boxes} boxes in {elapsed_time / 60:.1f} minutes '
+          f'({(elapsed_time + clock.slept) / 3600:.1f} simulated hours)')
+
+    window = len(samples) // 4
+    cpu_window = len(cycle_cpu_times) // 4
+    first_cpu = np.median(cycle_cpu_times[:cpu_window])
+    last_cpu = np.median(cycle_cpu_times[-cpu_window:])
+
+    checks = [
+        ('RSS growth (MB)', get_growth([s['rss'] for s in samples], window), config.soak_max_rss_growth),
+        ('File descriptor growth', get_growth([s['fds'] for s in samples], window), config.soak_max_fd_growth),
+        ('Socket growth', get_growth([s['sockets'] for s in samples], window), config.soak_max_socket_growth),
+        ('Thread growth', get_growth([s['threads'] for s in samples], window), config.soak_max_thread_growth),
+        ('CPU time per cycle growth (ratio)', last_cpu / max(first_cpu, 1e-6) - 1, config.soak_max_cpu_growth),
+    ]
+
+    failed = False
+    for name, growth, bound in checks:
+        result = 'OK' if growth <= bound else 'FAIL'
+        failed |= growth > bound
+        print(f'{name:35s} {growth:8.2f} (bound {bound}) {result}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import time
+import sqlite3
+import threading
+import argparse
+
+
+class Stats():
+    '''
+    Persistent run statistics in SQLite.
+    Every chore, match, restart, watchdog recovery, ad video wait, and the CPU time of each phase is recorded
+    per device, so that throughput such as games/hour and boxes opened/hour can be reported later.
+    '''
+    def __init__(self, path: str = 'smbot.db', device: str = ''):
+        self.device = device
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+
+        with self.lock, self.conn:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS chores (
+                    device TEXT, name TEXT, start_time REAL, end_time REAL, opened INTEGER);
+                CREATE TABLE IF NOT EXISTS matches (
+                    device TEXT, start_time REAL, end_time REAL, outcome TEXT,
+                    frames INTEGER, kicks INTEGER, decision_latency REAL);
+                CREATE TABLE IF NOT EXISTS restarts (
+                    device TEXT, time REAL, reason TEXT, duration REAL);
+                CREATE TABLE IF NOT EXISTS ad_waits (
+                    device TEXT, start_time REAL, end_time REAL);
+                CREATE TABLE IF NOT EXISTS recoveries (
+                    device TEXT, reason TEXT, fault_time REAL, detection_time REAL, recovery_time REAL);
+                CREATE TABLE IF NOT EXISTS cpu_usage (
+                    device TEXT, phase TEXT, start_time REAL, end_time REAL, cpu_time REAL);
+            ''')
+
+    def insert(self, table: str, values: list):
+        with self.lock, self.conn:
+            self.conn.execute(
+                f'INSERT INTO {table} VALUES ({",".join("?" * (len(values) + 1))})', [self.device] + values)
+
+    def record_chore(self, name: str, start: float, end: float, opened: int = 0):
+        self.insert('chores', [name, start, end, opened])
+
+    def record_match(
+            self,
+            start: float,
+            end: float,
+            outcome: str,
+            frames: int = 0,
+            kicks: int = 0,
+            decision_latency: float = None):
+        self.insert('matches', [start, end, outcome, frames, kicks, decision_latency])
+
+    def record_restart(self, reason: str, duration: float = 0):
+        self.insert('restarts', [time.time(), reason, duration])
+
+    def record_ad_wait(self, start: float, end: float):
+        self.insert('ad_waits', [start, end])
+
+    def record_recovery(self, reason: str, fault: float, detection: float, recovery: float):
+        self.insert('recoveries', [reason, fault, detection, recovery])
+
+    def record_cpu(self, phase: str, start: float, end: float, cpu: float):
+        self.insert('cpu_usage', [phase, start, end, cpu])
+
+    def report(self, since: float = 0):
+        '''
+        Throughput per device since the given time
+
+        Returns:
+            dict: device -> metrics
+        '''
+        with self.lock:
+            rows = self.conn.execute('''
+                SELECT device, MIN(start_time), MAX(end_time), SUM(opened) FROM chores WHERE start_time >= ? GROUP BY device
+                ''', [since]).fetchall()
+            report = {}
+            for device, start, end, opened in rows:
+                get_item(report, device, start, end)['boxes'] = opened or 0
+
+            rows = self.conn.execute('''
+                SELECT device, MIN(start_time), MAX(end_time), COUNT(*), SUM(end_time - start_time), SUM(frames), SUM(kicks),
+                    AVG(decision_latency)
+                FROM matches WHERE start_time >= ? GROUP BY device
+                ''', [since]).fetchall()
+            for device, start, end, games, match_time, frames, kicks, latency in rows:
+                get_item(report, device, start, end).update({
+                    'games': games,
+                    'match_time': match_time,
+                    'frames': frames,
+                    'kicks': kicks,
+                    'decision_latency': latency,
+                })
+
+            rows = self.conn.execute('''
+                SELECT device, MIN(time), MAX(time + COALESCE(duration, 0)), COUNT(*), SUM(duration)
+                FROM restarts WHERE time >= ? GROUP BY device
+                ''', [since]).fetchall()
+            for device, start, end, count, duration in rows:
+                get_item(report, device, start, end).update({'restarts': count, 'restart_time': duration or 0})
+
+            rows = self.conn.execute('''
+                SELECT device, MIN(fault_time), MAX(recovery_time), COUNT(*), AVG(detection_time - fault_time),
+                    AVG(recovery_time - fault_time)
+                FROM recoveries WHERE fault_time >= ? GROUP BY device
+                ''', [since]).fetchall()
+            for device, start, end, count, detection, recovery in rows:
+                get_item(report, device, start, end).update({'recoveries': count, 'mttd': detection, 'mttr': recovery})
+
+            rows = self.conn.execute('''
+                SELECT device, MIN(start_time), MAX(end_time), COUNT(*), SUM(end_time - start_time)
+                FROM ad_waits WHERE start_time >= ? GROUP BY device
+                ''', [since]).fetchall()
+            for device, start, end, count, duration in rows:
+                get_item(report, device, start, end).update({'ad_waits': count, 'ad_time': duration})
+
+            rows = self.conn.execute('''
+                SELECT device, MIN(start_time), MAX(end_time), SUM(cpu_time), SUM(end_time - start_time)
+                FROM cpu_usage WHERE start_time >= ? GROUP BY device
+                ''', [since]).fetchall()
+            for device, start, end, cpu, duration in rows:
+                get_item(report, device, start, end).update({'cpu_time': cpu, 'cpu_cores': cpu / max(duration, 1e-3)})
+
+        for item in report.values():
+            hours = max(item['end'] - item['start'], 1) / 3600
+            item['hours'] = hours
+            item['games_per_hour'] = item.get('games', 0) / hours
+            item['boxes_per_hour'] = item['boxes'] / hours
+
+        return report
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def get_item(report: dict, device: str, start: float, end: float):
+    '''
+    Metrics of the device in the report, whose time range is extended to the given one.
+    Each table is aggregated by itself, so that a device with only restarts, for example, is reported.
+    '''
+    item = report.setdefault(device, {'start': start, 'end': end, 'boxes': 0})
+    item['start'] = min(item['start'], start)
+    item['end'] = max(item['end'], end)
+    return item
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report throughput of the bot')
+    parser.add_argument('--db', default='smbot.db', help='Statistics database (default: smbot.db)')
+    parser.add_argument('--hours', default=0, type=float, help='Report only the last [hours] hours (default: all)')
+    args = parser.parse_args()
+
+    since = time.time() - args.hours * 3600 if args.hours > 0 else 0
+    stats = Stats(args.db)
+
+    for device, item in stats.report(since).items():
+        print(f'Device {device or "-"} ({item["hours"]:.1f} hours)')
+        print(f'  Games/hour:          {item["games_per_hour"]:.2f} ({item.get("games", 0)} games)')
+        print(f'  Boxes opened/hour:   {item["boxes_per_hour"]:.2f} ({item["boxes"]} boxes)')
+        print(f'  Restarts:            {item.get("restarts", 0)} ({item.get("restart_time", 0) / 60:.1f} minutes lost)')
+        if item.get('recoveries'):
+            print(f'  Watchdog recoveries: {item["recoveries"]} (detected in {item["mttd"]:.1f} s, '
+                  f'recovered in {item["mttr"]:.1f} s on average)')
+        print(f'  Ad video waits:      {item.get("ad_waits", 0)} ({item.get("ad_time", 0) / 60:.1f} minutes)')
+        if item.get('games'):
+            print(f'  Match duration:      {item["match_time"] / item["games"] / 60:.1f} minutes on average')
+            print(f'  Frames/kicks:        {item["frames"]} frames, {item["kicks"]} kicks')
+        if item.get('decision_latency') is not None:
+            print(f'  Decision latency:    {item["decision_latency"] * 1000:.1f} ms on average')
+        if item.get('cpu_time') is not None:
+            print(f'  CPU share:           {item["cpu_cores"] * 100:.1f}% of a core ({item["cpu_time"] / 60:.1f} CPU minutes)')
+
+    for name, count, duration, opened in stats.conn.execute('''
+            SELECT name, COUNT(*), AVG(end_time - start_time), SUM(opened) FROM chores WHERE start_time >= ? GROUP BY name
+            ''', [since]).fetchall():
+        print(f'Chore {name}: {count} runs, {duration:.1f} s on average, {opened} opened')
+
+    for phase, cpu, duration in stats.conn.execute('''
+            SELECT phase, SUM(cpu_time), SUM(end_time - start_time) FROM cpu_usage WHERE start_time >= ? GROUP BY phase
+            ''', [since]).fetchall():
+        print(f'Phase {phase}: {cpu / max(duration, 1e-3) * 100:.1f}% of a core for {duration / 60:.1f} minutes')
+
+    stats.close()
+
+
+if __name__ == '__main__':
+    main()
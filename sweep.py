@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import random
+import logging
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from action import Action
+from replay import ReplayAdb
+from frame import Frame
+import config
+import image_processing
+
+
+# parameters used by each stage, which decide the cached results to reuse
+diff_parameters = ['frame_diff_threshold']
+goal_post_parameters = ['goal_post_hough_threshold', 'goal_post_min_length', 'goal_post_min_front_length']
+player_map_parameters = ['uniform_color_ratio', 'uniform_hue_margin', 'uniform_non_color_margin']
+pass_parameters = ['kick_distance_threshold']
+
+default_space = {
+    'frame_diff_threshold': [0.3, 0.5, 0.7],
+    'goal_post_hough_threshold': [130, 150, 170],
+    'goal_post_min_length': [130, 150, 170],
+    'goal_post_min_front_length': [150, 170, 190],
+    'kick_distance_threshold': [[60, 30, 30, 50], [80, 40, 40, 60], [100, 50, 50, 70]],
+    'uniform_color_ratio': [0.1, 0.2, 0.3],
+    'uniform_hue_margin': [1, 2, 3],
+    'uniform_non_color_margin': [10, 15, 20],
+}
+
+decisions = ['wait', 'shoot', 'pass', 'random']
+
+# state of the worker process
+action = None
+corpus = []
+
+
+def load_corpus(path: str):
+    '''
+    Labeled frames in JSON lines, e.g.
+    {"image": "frame_010.png", "previous": "frame_009.png", "decision": "pass", "target": [300, 520]}
+
+    image and previous (optional) are relative to the corpus file, decision is one of
+    wait, shoot, pass, and random, and target (optional) is the expected end point of the kick.
+    '''
+    base_dir = os.path.dirname(path)
+
+    frames = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+
+            frame = json.loads(line)
+            if frame['decision'] not in decisions:
+                raise Exception(f'Unknown decision {frame["decision"]} of {frame["image"]}')
+
+            frame['image'] = os.path.join(base_dir, frame['image'])
+            if frame.get('previous'):
+                frame['previous'] = os.path.join(base_dir, frame['previous'])
+            frames.append(frame)
+
+    if len(frames) == 0:
+        raise Exception(f'There is no frame in {path}')
+
+    return frames
+
+
+def get_parameter_sets(space: dict, count: int = 0, seed: int = None):
+    '''
+    All combinations of the parameter space, or count random ones if count > 0.
+    The sets are sorted so that the sets sharing the player map parameters are evaluated together.
+    '''
+    for name in space:
+        if not hasattr(config, name):
+            raise Exception(f'Unknown parameter {name}')
+
+    # the most expensive stage varies slowest
+    order = [name for name in player_map_parameters + goal_post_parameters + diff_parameters + pass_parameters
+             if name in space]
+    order += [name for name in space if name not in order]
+
+    combinations = list(itertools.product(*[space[name] for name in order]))
+    if 0 < count < len(combinations):
+        indices = sorted(random.Random(seed).sample(range(len(combinations)), count))
+        combinations = [combinations[i] for i in indices]
+
+    return [dict(zip(order, values)) for values in combinations]
+
+
+def get_key(parameters: list):
+    return repr([getattr(config, name) for name in parameters])
+
+
+def init_worker(frames: list, log_level: int):
+    global action, corpus
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s', level=log_level)
+
+    corpus = frames
+    action = Action(adb=ReplayAdb(frames[0]['image']))
+
+
+def run_stage(cache: dict, key, function):
+    '''
+    Result of the stage and its elapsed time, which is computed once per key
+    '''
+    if key not in cache:
+        start_time = time.perf_counter()
+        result = function()
+        cache[key] = (result, time.perf_counter() - start_time)
+
+    return cache[key]
+
+
+def get_player_map(cache: dict, image: Frame):
+    '''
+    Same as Action.get_color_player_map in serial mode, but the EH image and the playground mask are
+    shared by all parameter sets. The results in the buffer pool are copied to be cached.
+    '''
+    image_eh, eh_time = run_stage(cache, 'eh', lambda: image.eh)
+    playground_mask, playground_time = run_stage(
+        cache, 'playground', lambda: action.get_playground_mask(image_eh).copy())
+
+    def get_team_maps():
+        my_mask = action.get_uniform_mask(image, config.my_uniform_loc, 'my')
+        my_stats, my_centroid = action.get_team_map(my_mask, playground_mask, 'my')
+        op_mask = action.get_uniform_mask(image, config.opponent_uniform_loc, 'op')
+        op_stats, op_centroid = action.get_team_map(op_mask, playground_mask, 'op')
+        return my_stats.copy(), my_centroid.copy(), op_stats.copy(), op_centroid.copy()
+
+    player_map, team_time = run_stage(cache, ('player_map', get_key(player_map_parameters)), get_team_maps)
+
+    return player_map, eh_time + playground_time + team_time
+
+
+def decide(cache: dict, image: Frame, previous_image: np.ndarray):
+    '''
+    Kick decision of the match loop for the current config
+
+    Returns:
+        (str, list, float): decision, end point of the kick or None, and elapsed time of the decision
+    '''
+    cost = 0
+
+    if previous_image is not None:
+        diff_score, elapsed_time = run_stage(
+            cache, 'diff', lambda: image_processing.diff_image(previous_image, image))
+        cost += elapsed_time
+        if diff_score < config.frame_diff_threshold:
+            return 'wait', None, cost
+
+    goal_post, elapsed_time = run_stage(
+        cache, ('goal_post', get_key(goal_post_parameters)), lambda: action.find_goal_post(image))
+    cost += elapsed_time
+    if goal_post is not None:
+        return 'shoot', goal_post[4:6], cost
+
+    player_map, elapsed_time = get_player_map(cache, image)
+    cost += elapsed_time
+
+    start_time = time.perf_counter()
+    kicks = action.kick_pass(image, player_map)
+    cost += time.perf_counter() - start_time
+    if len(kicks) > 0:
+        return 'pass', kicks[0][2:4], cost
+
+    return 'random', None, cost
+
+
+def evaluate(parameter_sets: list, tolerance: float):
+    '''
+    Evaluate the parameter sets on the corpus. Frames are the outer loop so that the
+    intermediate results of a frame are computed once and shared by the parameter sets.
+    '''
+    results = [{
+        'parameters': parameters,
+        'correct': 0,
+        'cost': 0,
+        'confusion': {},
+    } for parameters in parameter_sets]
+
+    for frame in corpus:
+        # views of the frame are computed once and shared by the parameter sets
+        image = Frame(cv2.imread(frame['image']))
+        previous_image = cv2.imread(frame['previous']) if frame.get('previous') else None
+
+        cache = {}
+        for result in results:
+            for name, value in result['parameters'].items():
+                setattr(config, name, value)
+
+            decision, target, cost = decide(cache, image, previous_image)
+
+            correct = decision == frame['decision']
+            if correct and target is not None and frame.get('target'):
+                correct = image_processing.get_distance(target, frame['target']) <= tolerance
+
+            result['correct'] += int(correct)
+            result['cost'] += cost
+            key = f'{frame["decision"]}->{decision}'
+            result['confusion'][key] = result['confusion'].get(key, 0) + 1
+
+    for result in results:
+        result['accuracy'] = result['correct'] / len(corpus)
+        result['cost'] = result['cost'] / len(corpus)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep the kick decision parameters on labeled frames')
+    parser.add_argument('corpus', help='Labeled frames in JSON lines')
+    parser.add_argument('--space', help='JSON file of config names and their candidate values (default: built-in space)')
+    parser.add_argument('--random', default=0, type=int, help='Number of random parameter sets (default: 0, grid search)')
+    parser.add_argument('--seed', default=None, type=int, help='Random seed')
+    parser.add_argument('--tolerance', default=50, type=float, help='Maximum distance in pixels from the labeled target (default: 50)')
+    parser.add_argument('--workers', default=os.cpu_count(), type=int, help='Number of worker processes (default: all cores)')
+    parser.add_argument('--top', default=10, type=int, help='Number of parameter sets to print (default: 10)')
+    parser.add_argument('--output', help='Write all results in JSON')
+    parser.add_argument('--log', default='critical', help='Log level of the workers (CRITICAL, ERROR, WARNING, INFO, and DEBUG)')
+    args = parser.parse_args()
+
+    frames = load_corpus(args.corpus)
+
+    space = default_space
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+
+    parameter_sets = get_parameter_sets(space, args.random, args.seed)
+    print(f'{len(parameter_sets)} parameter sets, {len(frames)} frames, {args.workers} workers')
+
+    # contiguous chunks share the expensive parameters, and there are a few chunks per worker for load balancing
+    chunk_size = max(1, int(np.ceil(len(parameter_sets) / (args.workers * 4))))
+    chunks = [parameter_sets[i:i + chunk_size] for i in range(0, len(parameter_sets), chunk_size)]
+
+    start_time = time.time()
+    results = []
+    with ProcessPoolExecutor(
+            max_workers=args.workers, initializer=init_worker,
+            initargs=(frames, getattr(logging, args.log.upper()))) as executor:
+        for chunk_results in executor.map(evaluate, chunks, itertools.repeat(args.tolerance)):
+            results.extend(chunk_results)
+    print(f'Elapsed time: {time.time() - start_time:.1f} s')
+
+    results.sort(key=lambda result: (-result['accuracy'], result['cost']))
+
+    for rank, result in enumerate(results[:args.top], 1):
+        print(f'{rank:3d}. accuracy {result["accuracy"] * 100:.1f}% cost {result["cost"] * 1000:.1f} ms/frame '
+              f'{json.dumps(result["parameters"])}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
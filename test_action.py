@@ -0,0 +1,35 @@
+import time
+
+import config
+from action import Action
+
+
+class FakeAdb():
+    serial = 'test'
+
+
+def test_inflated_stage_cost_recovers():
+    action = Action(adb=FakeAdb())
+    # a pause on the first frame
+    action.update_cost('pass', time.time() - 5)
+    assert action.stage_costs['pass'] <= config.decision_budget
+
+    runs = 0
+    for _ in range(20):
+        timestamp = time.time()
+        if action.over_budget('pass', timestamp + config.decision_budget):
+            continue
+
+        runs += 1
+        action.update_cost('pass', time.time() - 0.01)
+
+    assert runs > 10
+    assert action.stage_costs['pass'] < 0.1
+
+
+def test_sample_raises_cost_boundedly():
+    action = Action(adb=FakeAdb())
+    action.update_cost('vision', time.time() - 0.01)
+    action.update_cost('vision', time.time() - 1)
+
+    assert action.stage_costs['vision'] <= 0.01 * config.stage_cost_max_growth + 1e-3
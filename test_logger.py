@@ -0,0 +1,45 @@
+import logging
+
+from logger import RateLimitFilter
+
+
+def create_record(message: str, created: float, lineno: int = 10, args: tuple = None):
+    record = logging.LogRecord('smbot', logging.INFO, 'action.py', lineno, message, args, None)
+    record.created = created
+    return record
+
+
+def test_distinct_messages_from_one_line():
+    limiter = RateLimitFilter(1.0)
+    messages = [f'Trying to find box {index} to open' for index in range(1, 4)]
+
+    assert all(limiter.filter(create_record(message, 100.0)) for message in messages)
+
+
+def test_frame_indexed_lines_are_collapsed():
+    limiter = RateLimitFilter(1.0)
+    records = [create_record('%d In-progress', 100.0 + index * 0.1, args=(index,)) for index in range(100)]
+
+    passed = [record for record in records if limiter.filter(record)]
+
+    assert len(passed) == 10
+    assert passed[1].getMessage() == '10 In-progress (9 similar messages suppressed)'
+
+
+def test_repeated_message_is_suppressed():
+    limiter = RateLimitFilter(1.0)
+
+    assert limiter.filter(create_record('Waiting for the next frame', 100.0))
+    assert not limiter.filter(create_record('Waiting for the next frame', 100.5))
+    record = create_record('Waiting for the next frame', 101.5)
+    assert limiter.filter(record)
+    assert '(1 similar messages suppressed)' in record.msg
+
+
+def test_warnings_are_not_suppressed():
+    limiter = RateLimitFilter(1.0)
+    record = create_record('Can\'t find proper player', 100.0)
+    record.levelno = logging.WARNING
+
+    assert limiter.filter(record)
+    assert limiter.filter(record)
@@ -0,0 +1,52 @@
+import numpy as np
+
+from buffer_pool import BufferPool
+from pass_planner import FieldPlanner
+from tracker import PlayerTracker
+import config
+
+
+def create_planner():
+    mask = np.full(config.screen_size, 255, np.uint8)
+    return FieldPlanner(
+        [mask] * 4,
+        [config.kick_start_loc, config.kick_backward_start_locs[0], config.kick_backward_start_locs[1], config.header_start_loc])
+
+
+def get_tracked_map(centroids: list, area: int = 800):
+    '''
+    Map of the tracker, whose stats have the area only
+    '''
+    centroids = np.array(centroids, np.float64)
+    stats = np.zeros((len(centroids), 5), np.int32)
+    stats[:, 4] = area
+
+    tracker = PlayerTracker()
+    tracker.update_detections(stats, centroids, 0)
+    return tracker.get_map()
+
+
+def test_field_from_tracked_opponents():
+    planner = create_planner()
+    op_stats, op_centroids = get_tracked_map([[360, 680]])
+
+    field = planner.get_field(op_stats, op_centroids, BufferPool())
+
+    assert planner.sample(field, np.array([360, 680], np.float32)) == 0
+    assert planner.sample(field, np.array([360, 400], np.float32)) > 200
+
+
+def test_plan_avoids_tracked_opponent():
+    planner = create_planner()
+    x, y = config.kick_start_loc
+    blocked = [x, y - 370]
+    open_teammate = [x + 240, y - 270]
+    # opponent on the lane to the blocked teammate
+    op_stats, op_centroids = get_tracked_map([[x, y - 190]])
+    my_centroids = np.array([[x, y], blocked, open_teammate], np.float64)
+
+    planned = planner.plan(my_centroids, op_stats, op_centroids, BufferPool())
+
+    kicks = dict(planned)
+    assert 0 in kicks
+    assert kicks[0][2:4] != blocked
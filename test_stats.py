@@ -0,0 +1,28 @@
+from stats import Stats
+
+
+def test_device_with_only_restarts():
+    stats = Stats(':memory:')
+    stats.device = 'emulator-5554'
+    stats.record_chore('open_boxes', 100.0, 160.0, 2)
+    stats.device = 'emulator-5556'
+    stats.record_restart('frozen', 30.0)
+
+    report = stats.report()
+
+    assert report['emulator-5554']['boxes'] == 2
+    assert report['emulator-5556']['restarts'] == 1
+    assert report['emulator-5556']['restart_time'] == 30.0
+    assert 'restarts' not in report['emulator-5554']
+
+
+def test_restarts_extend_the_time_range():
+    stats = Stats(':memory:')
+    stats.record_chore('open_boxes', 100.0, 160.0)
+    stats.insert('restarts', [7300.0, 'crashed', 20.0])
+
+    item = stats.report()[stats.device]
+
+    assert item['restarts'] == 1
+    assert item['start'] == 100.0
+    assert item['end'] == 7320.0
@@ -0,0 +1,132 @@
+import logging
+
+import cv2
+import numpy as np
+
+import config
+
+
+class PlayerTracker():
+    '''
+    Track the players of a team across frames.
+    Tracks are kept in arrays, associated to full detections by greedy nearest
+    neighbour matching, and updated between detections by searching the team
+    color only in a small window around the predicted position of each track.
+    '''
+    def __init__(self):
+        self.positions = np.zeros((0, 2))
+        self.velocities = np.zeros((0, 2))
+        self.areas = np.zeros(0, np.int32)
+        self.misses = np.zeros(0, np.int32)
+        self.timestamp = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def predict(self, timestamp: float):
+        return self.positions + self.velocities * (timestamp - self.timestamp)
+
+    def move(self, indices: np.ndarray, positions: np.ndarray, timestamp: float):
+        elapsed_time = timestamp - self.timestamp
+        if elapsed_time > 0:
+            velocities = (positions - self.positions[indices]) / elapsed_time
+            self.velocities[indices] = 0.5 * self.velocities[indices] + 0.5 * velocities
+
+        self.positions[indices] = positions
+        self.misses[indices] = 0
+
+    def remove_lost(self):
+        alive = self.misses <= config.tracker_max_misses
+        self.positions = self.positions[alive]
+        self.velocities = self.velocities[alive]
+        self.areas = self.areas[alive]
+        self.misses = self.misses[alive]
+
+    def update_detections(self, stats: np.ndarray, centroids: np.ndarray, timestamp: float):
+        '''
+        Associate the detected players (result of connectedComponentsWithStats) with the tracks
+        '''
+        predicted = self.predict(timestamp)
+        distances = np.linalg.norm(predicted[:, np.newaxis, :] - centroids[np.newaxis, :, :], axis=2)
+
+        track_matched = np.zeros(len(predicted), bool)
+        detection_matched = np.zeros(len(centroids), bool)
+        track_indices = []
+        detection_indices = []
+        for track_index, detection_index in zip(*np.unravel_index(np.argsort(distances, axis=None), distances.shape)):
+            if distances[track_index, detection_index] > config.tracker_gate:
+                break
+
+            if track_matched[track_index] or detection_matched[detection_index]:
+                continue
+
+            track_matched[track_index] = True
+            detection_matched[detection_index] = True
+            track_indices.append(track_index)
+            detection_indices.append(detection_index)
+
+        track_indices = np.array(track_indices, np.int64)
+        detection_indices = np.array(detection_indices, np.int64)
+        self.move(track_indices, centroids[detection_indices], timestamp)
+        self.areas[track_indices] = stats[detection_indices, cv2.CC_STAT_AREA]
+        self.misses[~track_matched] += 1
+
+        new = ~detection_matched
+        self.positions = np.concatenate([self.positions, centroids[new]])
+        self.velocities = np.concatenate([self.velocities, np.zeros((np.count_nonzero(new), 2))])
+        self.areas = np.concatenate([self.areas, stats[new, cv2.CC_STAT_AREA]])
+        self.misses = np.concatenate([self.misses, np.zeros(np.count_nonzero(new), np.int32)])
+
+        self.remove_lost()
+        self.timestamp = timestamp
+
+        logging.debug('%d tracks matched, %d tracks added', len(track_indices), np.count_nonzero(new))
+
+    def update_local(self, image: np.ndarray, timestamp: float, get_mask):
+        '''
+        Update the tracks by searching the window around the predicted positions
+
+        Args:
+            image (np.ndarray): color image
+            timestamp (float): capture time of the image
+            get_mask (function): returns the team color mask of a color image crop
+        '''
+        size = config.tracker_window
+        height, width = image.shape[0:2]
+
+        predicted = self.predict(timestamp)
+        found = np.zeros(len(predicted), bool)
+        positions = np.zeros_like(predicted)
+        for index, (x, y) in enumerate(predicted.astype(int)):
+            x1 = max(x - size, 0)
+            y1 = max(y - size, config.dashboard_height)
+            x2 = min(x + size, width)
+            y2 = min(y + size, height)
+            if x1 >= x2 or y1 >= y2:
+                continue
+
+            moments = cv2.moments(get_mask(image[y1:y2, x1:x2]), binaryImage=True)
+            if moments['m00'] < config.tracker_min_pixels:
+                continue
+
+            found[index] = True
+            positions[index] = [x1 + moments['m10'] / moments['m00'], y1 + moments['m01'] / moments['m00']]
+
+        indices = np.flatnonzero(found)
+        self.move(indices, positions[indices], timestamp)
+        self.misses[~found] += 1
+
+        self.remove_lost()
+        self.timestamp = timestamp
+
+        return np.all(found)
+
+    def get_map(self):
+        '''
+        Returns:
+            (np.ndarray, np.ndarray): stats and centroids as connectedComponentsWithStats
+        '''
+        stats = np.zeros((len(self), 5), np.int32)
+        stats[:, cv2.CC_STAT_AREA] = self.areas
+
+        return stats, self.positions.copy()
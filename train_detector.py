@@ -0,0 +1,171 @@
+import os
+import glob
+import random
+import argparse
+
+import numpy as np
+
+try:
+    import torch
+    from torch import nn
+except ImportError:
+    torch = None
+
+import detector
+
+
+def create_model(channels: int = 16):
+    '''
+    Fully convolutional network at 1/4 of the input resolution, which is upsampled back to the input.
+    The stages are plain convolutions, ReLU, and resize so that cv2.dnn runs them.
+    '''
+    def conv(in_channels, out_channels, stride=1, dilation=1):
+        return [
+            nn.Conv2d(in_channels, out_channels, 3, stride=stride, padding=dilation, dilation=dilation),
+            nn.BatchNorm2d(out_channels),
+            nn.ReLU(inplace=True),
+        ]
+
+    return nn.Sequential(
+        *conv(3, channels, stride=2),
+        *conv(channels, channels),
+        *conv(channels, channels * 2, stride=2),
+        *conv(channels * 2, channels * 2, dilation=2),
+        *conv(channels * 2, channels * 2),
+        nn.Conv2d(channels * 2, len(detector.classes), 1),
+        nn.Upsample(scale_factor=4, mode='bilinear', align_corners=False),
+        nn.Sigmoid(),
+    )
+
+
+def load_dataset(path: str):
+    '''
+    Images (RGB, 0..1) and targets exported by detector_dataset.py, cropped to a multiple of 4
+    '''
+    images = []
+    targets = []
+    for file_path in sorted(glob.glob(os.path.join(path, '*.npz'))):
+        data = np.load(file_path)
+        height, width = data['image'].shape[0] // 4 * 4, data['image'].shape[1] // 4 * 4
+        images.append(data['image'][:height, :width, ::-1].transpose(2, 0, 1) / 255)
+        targets.append(data['target'][:, :height, :width])
+
+    return np.float32(images), np.float32(targets)
+
+
+class CalibrationReader():
+    '''
+    Dataset images for the static quantization of onnxruntime
+    '''
+    def __init__(self, images: np.ndarray, input_name: str, count: int = 100):
+        self.batches = iter([{input_name: image[None]} for image in images[:count]])
+
+    def get_next(self):
+        return next(self.batches, None)
+
+
+def quantize(model_path: str, output_path: str, images: np.ndarray):
+    '''
+    INT8 weights and activations with QuantizeLinear/DequantizeLinear nodes, which cv2.dnn runs on CPU
+    '''
+    try:
+        from onnxruntime.quantization import quantize_static, QuantFormat, QuantType
+    except ImportError:
+        raise Exception('onnxruntime is required to quantize the model (pip install onnxruntime)')
+
+    quantize_static(
+        model_path, output_path, CalibrationReader(images, 'image'),
+        quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the CNN player detector on the frames exported by detector_dataset.py')
+    parser.add_argument('dataset', help='Directory of the exported frames')
+    parser.add_argument('--output', default='models/player_detector.onnx', help='ONNX model to write (default: models/player_detector.onnx)')
+    parser.add_argument('--init', help='PyTorch weights (.pt) to fine-tune, e.g. the weights saved with the last model')
+    parser.add_argument('--epochs', default=30, type=int, help='Number of epochs (default: 30)')
+    parser.add_argument('--batch-size', default=16, type=int, help='Batch size (default: 16)')
+    parser.add_argument('--lr', default=1e-3, type=float, help='Learning rate (default: 0.001)')
+    parser.add_argument('--validation', default=0.1, type=float, help='Ratio of the frames held out for validation (default: 0.1)')
+    parser.add_argument('--quantize', action='store_true', help='If set, also write an INT8 model (requires onnxruntime)')
+    parser.add_argument('--seed', default=0, type=int, help='Random seed (default: 0)')
+    args = parser.parse_args()
+
+    if torch is None:
+        print('PyTorch is required to train the detector (pip install torch)')
+        return
+
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    images, targets = load_dataset(args.dataset)
+    if len(images) == 0:
+        print(f'There is no frame in {args.dataset}')
+        return
+
+    indices = list(range(len(images)))
+    random.shuffle(indices)
+    validation_count = int(len(indices) * args.validation)
+    validation_indices = indices[:validation_count]
+    train_indices = indices[validation_count:]
+    print(f'{len(train_indices)} training frames, {len(validation_indices)} validation frames')
+
+    model = create_model()
+    if args.init:
+        model.load_state_dict(torch.load(args.init))
+
+    # players cover a few percent of the pixels
+    positive_ratio = max(targets[train_indices].mean(), 1e-3)
+    positive_weight = min((1 - positive_ratio) / positive_ratio, 50)
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
+
+    def get_loss(batch_indices, flip=False):
+        image = torch.from_numpy(images[batch_indices])
+        target = torch.from_numpy(targets[batch_indices])
+        if flip:
+            image = image.flip(3)
+            target = target.flip(3)
+
+        output = model(image).clamp(1e-6, 1 - 1e-6)
+        loss = -(positive_weight * target * output.log() + (1 - target) * (1 - output).log())
+        return loss.mean()
+
+    for epoch in range(1, args.epochs + 1):
+        model.train()
+        random.shuffle(train_indices)
+        train_loss = 0
+        for start in range(0, len(train_indices), args.batch_size):
+            batch_indices = train_indices[start:start + args.batch_size]
+            loss = get_loss(batch_indices, flip=random.random() < 0.5)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            train_loss += loss.item() * len(batch_indices)
+
+        model.eval()
+        with torch.no_grad():
+            validation_loss = sum(
+                get_loss(validation_indices[start:start + args.batch_size]).item() * len(validation_indices[start:start + args.batch_size])
+                for start in range(0, len(validation_indices), args.batch_size))
+
+        print(f'Epoch {epoch}: training loss {train_loss / len(train_indices):.4f}, '
+              f'validation loss {validation_loss / max(len(validation_indices), 1):.4f}')
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    torch.save(model.state_dict(), os.path.splitext(args.output)[0] + '.pt')
+
+    model.eval()
+    torch.onnx.export(
+        model, torch.from_numpy(images[:1]), args.output, input_names=['image'], output_names=['heatmap'],
+        dynamic_axes={'image': {0: 'batch', 2: 'height', 3: 'width'}, 'heatmap': {0: 'batch', 2: 'height', 3: 'width'}},
+        opset_version=13)
+    print(f'Saved {args.output}')
+
+    if args.quantize:
+        quantized_path = os.path.splitext(args.output)[0] + '_int8.onnx'
+        quantize(args.output, quantized_path, images)
+        print(f'Saved {quantized_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import config
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+def attach_shared_memory(name: str):
+    '''
+    Attach to the shared memory of the pool, which is owned and unlinked by the pool
+    '''
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers it again, but spawned workers share the resource tracker
+        # of the pool, where the name is registered once and unregistered by unlink
+        return shared_memory.SharedMemory(name=name)
+
+
+class WorkerAdb():
+    '''
+    Device of the Action in a worker, which only analyzes frames
+    '''
+    stats = None
+
+    def __init__(self, index: int):
+        self.serial = f'vision-{index}'
+
+
+def decide(action, frame):
+    '''
+    Kick decision of a frame in the order of shoot, pass, and random kick, as Action.decide_kick without the deadline
+
+    Returns:
+        (str, list): decision and kicks
+    '''
+    goal_post = action.find_goal_post(frame)
+    if goal_post:
+        return 'shoot', [action.shoot(frame, goal_post)]
+
+    kicks = action.kick_pass(frame)
+    if kicks:
+        return 'pass', kicks
+
+    return 'random', action.random_kick()
+
+
+def run_worker(index: int, memory_name: str, shape: tuple, tasks, results, log_level: int, options: dict):
+    '''
+    Worker process, which analyzes the frames in the shared slots and returns the decisions.
+    The options are passed to the Action of the worker, e.g. player_detector.
+    '''
+    logging.basicConfig(
+        format=f'%(asctime)s %(levelname)-8s [vision-{index} %(filename)s:%(lineno)d] %(message)s', level=log_level)
+
+    # imported in the worker so that the pool module doesn't depend on Action
+    from action import Action
+    from frame import Frame
+
+    memory = attach_shared_memory(memory_name)
+    frame_size = int(np.prod(shape))
+    action = Action(adb=WorkerAdb(index), **options)
+    results.put(('ready', index, None))
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+
+            task_id, slot, timestamp, deadline = task
+            start_time = time.time()
+            # nobody waits for the decision anymore, but the slot is given back only by the reply
+            if start_time > deadline:
+                results.put(('skipped', index, {'id': task_id}))
+                continue
+
+            # zero-copy view of the slot, which is not modified until the result is returned
+            image = np.ndarray(shape, np.uint8, memory.buf, slot * frame_size)
+            decision, kicks = decide(action, Frame(image, timestamp, action.buffers))
+            del image
+
+            results.put(('result', index, {
+                'id': task_id,
+                'decision': decision,
+                # numbers of numpy, e.g. centroids, are sent as Python numbers
+                'kicks': [[value.item() if isinstance(value, np.generic) else value for value in kick] for kick in kicks],
+                'elapsed_time': time.time() - start_time,
+                'worker': index,
+            }))
+    finally:
+        memory.close()
+
+
+class VisionPool():
+    '''
+    Pool of vision worker processes sharing the frames through shared memory.
+    A frame is copied into a free slot of the shared memory, and a worker decides the kicks on
+    the slot without copying, so that only the slot index and the small decision record are passed
+    between the processes. Bot instances in one process can share a pool without contending on the GIL.
+    A crashed worker is restarted, and the frames it was analyzing fail with WorkerCrashed.
+    A worker which takes more than vision_hang_timeout seconds on a frame is regarded as hung and restarted,
+    since the slots are only given back when the worker replies or is gone.
+    '''
+    def __init__(self, workers: int = None, slots: int = None, shape: tuple = None, **options):
+        self.worker_count = workers or config.vision_workers
+        self.slot_count = slots or max(config.vision_slots, self.worker_count)
+        self.shape = tuple(shape or config.screen_size + [3])
+        self.frame_size = int(np.prod(self.shape))
+        # Action options of the workers
+        self.options = options
+
+        self.memory = shared_memory.SharedMemory(create=True, size=self.frame_size * self.slot_count)
+        self.slots = np.ndarray((self.slot_count,) + self.shape, np.uint8, self.memory.buf)
+        self.free_slots = queue.Queue()
+        for slot in range(self.slot_count):
+            self.free_slots.put(slot)
+
+        # spawn on every platform, so that the workers don't inherit the threads of the bot
+        self.context = multiprocessing.get_context('spawn')
+        self.results = self.context.Queue()
+        self.processes = [None] * self.worker_count
+        self.task_queues = [None] * self.worker_count
+        # task id to (future, slot, submit time) of each worker, including the abandoned ones until the worker replies
+        self.in_flight = [{} for _ in range(self.worker_count)]
+        self.lock = threading.Lock()
+        self.task_id = 0
+        self.restart_count = 0
+
+        self.running = True
+        for index in range(self.worker_count):
+            self.start_worker(index)
+        self.thread = threading.Thread(target=self.run, name='VisionPool', daemon=True)
+        self.thread.start()
+
+    def start_worker(self, index: int):
+        self.task_queues[index] = self.context.Queue()
+        process = self.context.Process(
+            target=run_worker,
+            args=(index, self.memory.name, self.shape, self.task_queues[index], self.results,
+                  logging.getLogger().getEffectiveLevel(), self.options),
+            name=f'Vision-{index}',
+            daemon=True)
+        process.start()
+        self.processes[index] = process
+
+    def submit(self, image: np.ndarray, timestamp: float, deadline: float, timeout: float = None):
+        '''
+        Copy the frame into a free slot and queue it to the least busy worker, which skips it after the deadline
+
+        Returns:
+            Future: decision record, or None if there is no free slot until timeout
+        '''
+        try:
+            slot = self.free_slots.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+        self.slots[slot] = image
+
+        future = concurrent.futures.Future()
+        with self.lock:
+            self.task_id += 1
+            index = min(range(self.worker_count), key=lambda i: len(self.in_flight[i]))
+            self.in_flight[index][self.task_id] = (future, slot, time.time())
+            self.task_queues[index].put((self.task_id, slot, timestamp, deadline))
+
+        return future
+
+    def decide(self, image: np.ndarray, timestamp: float, deadline: float):
+        '''
+        Kicks decided by a worker, or None if they are not decided before the deadline or the worker crashed
+        '''
+        future = self.submit(image, timestamp, deadline, max(0, deadline - time.time()))
+        if future is None:
+            logging.warning('There is no free frame slot for the vision workers')
+            return None
+
+        try:
+            result = future.result(timeout=max(0, deadline - time.time()))
+        except concurrent.futures.TimeoutError:
+            self.cancel(future)
+            return None
+        except WorkerCrashed as e:
+            logging.error(f'Vision worker crashed: {e}')
+            return None
+
+        logging.info(f'{result["decision"]} by vision worker {result["worker"]} in {result["elapsed_time"] * 1000:.0f} ms')
+        return result['kicks']
+
+    def cancel(self, future: concurrent.futures.Future):
+        '''
+        Abandon a frame past its deadline, whose late result is discarded.
+        The slot and the load of the worker are kept until the worker replies, since it may be reading the slot.
+        '''
+        with self.lock:
+            future.cancel()
+
+    def run(self):
+        '''
+        Resolve the futures by the results, and restart the crashed workers
+        '''
+        while self.running:
+            try:
+                kind, index, result = self.results.get(timeout=0.5)
+            except queue.Empty:
+                kind = None
+            except (EOFError, OSError):
+                break
+
+            if kind in ('result', 'skipped'):
+                with self.lock:
+                    future, slot, _ = self.in_flight[index].pop(result['id'], (None, None, None))
+                    if kind == 'result' and future and not future.cancelled():
+                        future.set_result(result)
+                if future:
+                    self.free_slots.put(slot)
+            elif kind == 'ready':
+                logging.info(f'Vision worker {index} is ready')
+
+            now = time.time()
+            for index, process in enumerate(self.processes):
+                with self.lock:
+                    submit_times = [submit_time for _, _, submit_time in self.in_flight[index].values()]
+                if self.running and submit_times and now - min(submit_times) > config.vision_hang_timeout:
+                    logging.error(f'Vision worker {index} is hung on a frame for {now - min(submit_times):.1f} s')
+                    # killed, since a hung process may not handle SIGTERM
+                    process.kill()
+                    process.join(1)
+
+            for index, process in enumerate(self.processes):
+                if self.running and not process.is_alive():
+                    self.restart_worker(index, process.exitcode)
+
+    def restart_worker(self, index: int, exitcode: int):
+        logging.error(f'Vision worker {index} exited with {exitcode}. Restarting')
+        with self.lock:
+            in_flight = self.in_flight[index]
+            self.in_flight[index] = {}
+            for future, _, _ in in_flight.values():
+                if not future.cancelled():
+                    future.set_exception(WorkerCrashed(f'worker {index} exited with {exitcode}'))
+
+        # the slots are released after the worker is gone, so nothing reads them anymore
+        for _, slot, _ in in_flight.values():
+            self.free_slots.put(slot)
+
+        self.restart_count += 1
+        self.start_worker(index)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+        del self.slots
+        self.memory.close()
+        self.memory.unlink()
@@ -0,0 +1,152 @@
+import time
+import zlib
+import logging
+import threading
+import contextlib
+
+import numpy as np
+
+import config
+
+
+class AppHang(Exception):
+    '''
+    Raised by the device calls after the watchdog found the app crashed or hung,
+    so that the running operation is cancelled at its next capture, touch, or swipe
+    '''
+    pass
+
+
+class Watchdog():
+    '''
+    Monitor the app of a device in a background thread.
+    The app process and the foreground activity are checked every config.watchdog_interval
+    seconds, and the screen is regarded as frozen if the captured frames don't change for
+    config.watchdog_frozen_time seconds while the screen is expected to move, e.g. in a match.
+    When a fault is found, the device calls raise AppHang until recover() restarts the app.
+    '''
+    def __init__(self, adb, stats=None):
+        self.adb = adb
+        self.stats = stats
+        self.thread = None
+        self.running = False
+        self.lock = threading.Lock()
+
+        self.cancelled = threading.Event()
+        self.reason = None
+        self.fault_time = 0
+        self.detection_time = 0
+        self.healthy_time = time.time()
+
+        self.motion_expected = 0
+        self.frame_hash = None
+        self.frame_change_time = time.time()
+
+        self.recovery_times = []
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=f'Watchdog-{self.adb.serial}', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while self.running:
+            start_time = time.time()
+
+            if not self.cancelled.is_set():
+                try:
+                    reason, fault_time = self.diagnose()
+                except Exception as e:
+                    logging.warning(f'Watchdog check failed: {e}')
+                    reason = None
+
+                if reason:
+                    self.cancel(reason, fault_time)
+
+            time.sleep(max(0, config.watchdog_interval - (time.time() - start_time)))
+
+    def diagnose(self):
+        '''
+        Returns:
+            (str, float): reason and estimated start time of the fault, or (None, 0) if the app is healthy
+        '''
+        with self.lock:
+            motion_expected = self.motion_expected > 0
+            frame_change_time = self.frame_change_time
+
+        if not self.adb.get_pid():
+            return 'app is not running', self.healthy_time
+
+        activity = self.adb.get_foreground_activity()
+        if activity and not activity.startswith(f'{self.adb.app_name}/'):
+            return f'app is not in foreground ({activity})', self.healthy_time
+
+        if motion_expected and time.time() - frame_change_time > config.watchdog_frozen_time:
+            return 'screen is frozen', frame_change_time
+
+        self.healthy_time = time.time()
+        return None, 0
+
+    def cancel(self, reason: str, fault_time: float):
+        logging.error(f'Watchdog: {reason}. Cancelling the running operation')
+        self.reason = reason
+        self.fault_time = fault_time
+        self.detection_time = time.time()
+        self.cancelled.set()
+
+    def check(self):
+        '''
+        Raise AppHang if a fault was found. Called by the device before every capture, touch, and swipe.
+        '''
+        if self.cancelled.is_set():
+            raise AppHang(self.reason)
+
+    def observe(self, image: np.ndarray):
+        '''
+        Update the frame hash by a captured frame. A sparse grid of pixels is enough to tell a frozen screen.
+        '''
+        frame_hash = zlib.crc32(np.ascontiguousarray(image[::8, ::8]))
+        with self.lock:
+            if frame_hash != self.frame_hash:
+                self.frame_hash = frame_hash
+                self.frame_change_time = time.time()
+
+    @contextlib.contextmanager
+    def expect_motion(self):
+        '''
+        Screen is expected to change all the time in this context, e.g. the clock of a match
+        '''
+        with self.lock:
+            self.motion_expected += 1
+            self.frame_change_time = time.time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.motion_expected -= 1
+
+    def recover(self):
+        '''
+        Restart the app after the running operation is cancelled, and record the time to recovery
+        '''
+        reason = self.reason
+        self.adb.restart_app(f'watchdog: {reason}')
+
+        recovery_time = time.time()
+        self.recovery_times.append(recovery_time - self.fault_time)
+        logging.info(
+            f'Recovered from "{reason}" in {recovery_time - self.fault_time:.1f} s '
+            f'(MTTR {np.mean(self.recovery_times):.1f} s over {len(self.recovery_times)} recoveries)')
+        if self.stats:
+            self.stats.record_recovery(reason, self.fault_time, self.detection_time, recovery_time)
+
+        with self.lock:
+            self.frame_change_time = time.time()
+        self.healthy_time = time.time()
+        self.cancelled.clear()